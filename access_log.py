@@ -0,0 +1,322 @@
+import atexit
+import collections
+import itertools
+import json
+import os
+import sqlite3
+import threading
+
+from metrics import ACCESS_LOG_DROPPED, IO_SECONDS
+
+try:
+    import fcntl  # 仅在类Unix系统上可用，用于多进程轮转时加锁
+except ImportError:
+    fcntl = None
+
+
+class JsonLinesBackend:
+    """JSON Lines 追加写入后端，超过大小上限时轮转"""
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+    def write_batch(self, entries):
+        """一次性追加一批记录（单次write，多个进程同时追加也不会互相覆盖）"""
+        data = ''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in entries).encode('utf-8')
+        if not data:
+            return
+        with self._lock():
+            self._maybe_rotate(len(data))
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                view = memoryview(data)
+                while view:
+                    written = os.write(fd, view)
+                    view = view[written:]
+            finally:
+                os.close(fd)
+
+    def tail(self, n):
+        """从文件末尾倒序读取最近n条记录，返回最新在前的列表"""
+        entries = []
+        if n <= 0 or not os.path.exists(self.path):
+            return entries
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            remainder = b''
+            while pos > 0 and len(entries) < n:
+                step = min(64 * 1024, pos)
+                pos -= step
+                f.seek(pos)
+                lines = (f.read(step) + remainder).split(b'\n')
+                # 第一段可能是不完整的行，留到下一轮拼接
+                remainder = lines.pop(0) if pos > 0 else b''
+                for line in reversed(lines):
+                    if line.strip():
+                        entries.append(self._parse(line))
+                        if len(entries) >= n:
+                            break
+            if remainder.strip() and len(entries) < n:
+                entries.append(self._parse(remainder))
+        return [e for e in entries if e is not None]
+
+    def iter_all(self):
+        """按时间顺序遍历所有记录（含已轮转的旧文件）"""
+        paths = [f'{self.path}.{i}' for i in range(self.backup_count, 0, -1)] + [self.path]
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            with open(path, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        entry = self._parse(line)
+                        if entry is not None:
+                            yield entry
+
+    def close(self):
+        pass
+
+    def _parse(self, line):
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None  # 进程被杀时可能留下半行，跳过
+
+    def _maybe_rotate(self, incoming):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size + incoming <= self.max_bytes:
+            return
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f'{self.path}.{i}'
+            if os.path.exists(src):
+                os.replace(src, f'{self.path}.{i + 1}')
+        if self.backup_count > 0:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+
+    def _lock(self):
+        return _FileLock(self.path + '.lock')
+
+
+class SqliteBackend:
+    """SQLite（WAL模式）后端，数据库超过大小上限时删除最旧的记录"""
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS access_log ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp REAL, data TEXT)'
+        )
+        self._conn.commit()
+
+    def write_batch(self, entries):
+        rows = [(e.get('timestamp'), json.dumps(e, ensure_ascii=False)) for e in entries]
+        if not rows:
+            return
+        with self._db_lock, self._conn:
+            self._conn.executemany('INSERT INTO access_log (timestamp, data) VALUES (?, ?)', rows)
+            self._enforce_retention()
+
+    def tail(self, n):
+        with self._db_lock:
+            rows = self._conn.execute(
+                'SELECT data FROM access_log ORDER BY id DESC LIMIT ?', (n,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def iter_all(self):
+        with self._db_lock:
+            rows = self._conn.execute('SELECT data FROM access_log ORDER BY id').fetchall()
+        for row in rows:
+            yield json.loads(row[0])
+
+    def close(self):
+        with self._db_lock:
+            self._conn.close()
+
+    def _enforce_retention(self):
+        page_size = self._conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = self._conn.execute('PRAGMA page_count').fetchone()[0]
+        free_pages = self._conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if (page_count - free_pages) * page_size <= self.max_bytes:
+            return
+        # 超出上限时删除最旧的10%，被释放的页会被后续写入复用
+        total = self._conn.execute('SELECT COUNT(*) FROM access_log').fetchone()[0]
+        self._conn.execute(
+            'DELETE FROM access_log WHERE id IN '
+            '(SELECT id FROM access_log ORDER BY id LIMIT ?)', (max(1, total // 10),)
+        )
+
+
+class AccessLogStore:
+    """访问记录：内存环形缓冲提供最近记录，后台线程批量写入后端"""
+
+    def __init__(self, backend, buffer_size=1000, flush_interval=1.0, max_batch=500, shared=False,
+                 max_pending=100000):
+        self.backend = backend
+        # 多个工作进程共用同一个后端时，各进程的内存缓冲只包含自己的记录，
+        # 读取最近记录需要先刷盘再从后端末尾读取
+        self.shared = shared
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        # 后端持续写入失败时待写入记录的上限，超出时丢弃最旧的
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._ring = collections.deque(maxlen=buffer_size)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        # 每批记录落盘后调用的回调（如访问统计），在刷盘线程中执行，不占用请求时间
+        self._listeners = []
+        # 启动时从磁盘预热环形缓冲，之后的读取不再访问磁盘
+        self._ring.extend(reversed(backend.tail(buffer_size)))
+
+    def append(self, entry):
+        """记录一条访问（只做内存操作，不阻塞请求）"""
+        with self._lock:
+            self._ring.append(entry)
+            self._pending.append(entry)
+            self._trim()
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def extend(self, entries):
+        """批量记录（一次加锁）"""
+        with self._lock:
+            self._ring.extend(entries)
+            self._pending.extend(entries)
+            self._trim()
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def recent(self, limit=50):
+        """返回最近的记录，最新在前"""
+        if self.shared:
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"写入访问记录失败: {e}")
+            with IO_SECONDS.time(operation='access_log_read'):
+                return self.backend.tail(limit)
+        with self._lock:
+            return list(itertools.islice(reversed(self._ring), limit))
+
+    def flush(self):
+        """把待写入的记录一次性写入后端"""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            try:
+                with IO_SECONDS.time(operation='access_log_write'):
+                    self.backend.write_batch(batch)
+            except Exception:
+                # 写入失败时放回队首，下次刷盘重试；积压超过上限时丢弃最旧的
+                with self._lock:
+                    self._pending[:0] = batch
+                    self._trim()
+                raise
+            for listener in self._listeners:
+                try:
+                    listener(batch)
+                except Exception as e:
+                    print(f"访问记录回调失败: {e}")
+        return len(batch)
+
+    def _trim(self):
+        """持有锁时调用：丢弃超出 max_pending 的最旧记录并计数"""
+        excess = len(self._pending) - self.max_pending
+        if excess > 0:
+            del self._pending[:excess]
+            self.dropped += excess
+            ACCESS_LOG_DROPPED.inc(excess)
+
+    def add_listener(self, callback):
+        """注册落盘回调，callback(batch) 收到刚写入后端的一批记录"""
+        self._listeners.append(callback)
+        return self
+
+    def start(self):
+        """启动后台刷盘线程"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='access-log-flusher', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        return self
+
+    def close(self):
+        """停止后台线程并写入剩余记录"""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"写入访问记录失败: {e}")
+
+
+class _FileLock:
+    """跨进程文件锁（不支持fcntl的平台上退化为无锁）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+def create_backend(kind, path, max_bytes):
+    """根据配置创建访问记录后端"""
+    if kind == 'sqlite':
+        return SqliteBackend(path, max_bytes=max_bytes)
+    if kind == 'jsonl':
+        return JsonLinesBackend(path, max_bytes=max_bytes)
+    raise ValueError(f"未知的访问记录后端: {kind}")
+
+
+def import_legacy_log(legacy_path, backend):
+    """把旧版 access_log.json（最新在前的列表）导入新后端，只执行一次"""
+    # 先重命名再读取，多个工作进程同时启动时只有一个能导入成功
+    try:
+        os.replace(legacy_path, legacy_path + '.bak')
+    except FileNotFoundError:
+        return 0
+    with open(legacy_path + '.bak', 'r', encoding='utf-8') as f:
+        try:
+            entries = json.load(f)
+        except ValueError:
+            entries = []
+    backend.write_batch(list(reversed(entries)))
+    return len(entries)
@@ -0,0 +1,239 @@
+import sqlite3
+import threading
+import time
+
+from metrics import IO_SECONDS
+
+# 小时汇总保留的天数、日汇总保留的天数
+HOURLY_RETENTION_DAYS = 14
+DAILY_RETENTION_DAYS = 400
+# 每类计数最多保留的键数（如失败登录中随意填写的用户名），超出时删除计数最少的
+MAX_KEYS_PER_KIND = 100000
+# 清理过期汇总和多余键的间隔（秒）
+PRUNE_INTERVAL = 3600
+
+HOUR_FORMAT = '%Y-%m-%d %H:00'
+DAY_FORMAT = '%Y-%m-%d'
+
+
+def _counter_updates(entries):
+    """把一批访问记录合并成 {(类别, 键): [次数, 最后时间]} 和 {(周期, 时间段, 动作): 次数}"""
+    counters = {}
+    rollups = {}
+
+    def bump(kind, key, ts):
+        item = counters.get((kind, key))
+        if item is None:
+            counters[(kind, key)] = [1, ts]
+        else:
+            item[0] += 1
+            if ts > item[1]:
+                item[1] = ts
+
+    for entry in entries:
+        ts = entry.get('timestamp') or 0.0
+        action = entry.get('action') or 'unknown'
+        username = entry.get('username')
+        ip = entry.get('ip')
+        bump('action', action, ts)
+        if ip:
+            bump('ip', ip, ts)
+        if action == 'login_failed':
+            # 失败登录的用户名由请求方任意填写，单独统计，不计入用户活跃度
+            if username:
+                bump('failed_user', username, ts)
+            if ip:
+                bump('failed_ip', ip, ts)
+        else:
+            # 打包下载的一条记录包含多个文件，每个成员都计为一次下载
+            downloads = entry.get('members') or []
+            if action == 'file_access' and entry.get('filename'):
+                downloads = [entry['filename']]
+            if username:
+                bump('user', username, ts)
+                for _ in downloads:
+                    bump('user_download', username, ts)
+            for filename in downloads:
+                bump('file', filename, ts)
+        local = time.localtime(ts)
+        for period, fmt in (('hour', HOUR_FORMAT), ('day', DAY_FORMAT)):
+            key = (period, time.strftime(fmt, local), action)
+            rollups[key] = rollups.get(key, 0) + 1
+    return counters, rollups
+
+
+class AccessAnalytics:
+    """访问统计：每批访问记录落盘时增量更新计数表，查询只读取排名靠前的几行
+
+    计数保存在 SQLite（WAL模式）中，多个工作进程共享同一个文件；
+    排行榜走 (类别, 次数) 索引，按小时/按天的汇总只读取查询范围内的时间段，
+    查询耗时与历史记录总数无关。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db_lock = threading.Lock()
+        self._next_prune = 0.0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS counters ('
+            'kind TEXT, key TEXT, count INTEGER, last REAL, PRIMARY KEY (kind, key)) WITHOUT ROWID'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS counters_rank ON counters (kind, count DESC)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS rollups ('
+            'period TEXT, bucket TEXT, action TEXT, count INTEGER, '
+            'PRIMARY KEY (period, bucket, action)) WITHOUT ROWID'
+        )
+        self._conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+        self._conn.commit()
+
+    def backfill(self, entries):
+        """首次启用时从已有的访问记录建立计数（只执行一次，多个进程同时启动时只有一个会导入）"""
+        with self._db_lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                done = self._conn.execute("SELECT 1 FROM meta WHERE name = 'backfilled'").fetchone()
+                count = 0
+                if done is None:
+                    batch = []
+                    for entry in entries:
+                        batch.append(entry)
+                        if len(batch) >= 10000:
+                            self._apply(batch)
+                            count += len(batch)
+                            batch = []
+                    self._apply(batch)
+                    count += len(batch)
+                    self._conn.execute(
+                        "INSERT INTO meta (name, value) VALUES ('backfilled', ?)", (str(time.time()),)
+                    )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return count
+
+    def record(self, entries):
+        """合并一批新记录（由访问记录的后台刷盘线程调用）"""
+        if not entries:
+            return
+        try:
+            with IO_SECONDS.time(operation='analytics_write'), self._db_lock, self._conn:
+                self._apply(entries)
+                self._maybe_prune(time.time())
+        except sqlite3.Error as e:
+            print(f"更新访问统计失败: {e}")
+
+    def top(self, kind, limit=10):
+        """返回某一类中次数最多的 [(键, 次数, 最后时间)]"""
+        with self._db_lock:
+            return self._conn.execute(
+                'SELECT key, count, last FROM counters WHERE kind = ? ORDER BY count DESC LIMIT ?',
+                (kind, limit)
+            ).fetchall()
+
+    def counts(self, kind, keys):
+        """返回指定键的次数 {键: 次数}"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        with self._db_lock:
+            rows = self._conn.execute(
+                f'SELECT key, count FROM counters WHERE kind = ? AND key IN ({",".join("?" * len(keys))})',
+                [kind] + keys
+            ).fetchall()
+        return dict(rows)
+
+    def rollup(self, period, buckets):
+        """返回连续时间段的汇总 [{'bucket', 'total', 'actions'}]，没有记录的时间段计数为0"""
+        if not buckets:
+            return []
+        with self._db_lock:
+            rows = self._conn.execute(
+                'SELECT bucket, action, count FROM rollups WHERE period = ? AND bucket >= ? AND bucket <= ?',
+                (period, buckets[0], buckets[-1])
+            ).fetchall()
+        result = {bucket: {'bucket': bucket, 'total': 0, 'actions': {}} for bucket in buckets}
+        for bucket, action, count in rows:
+            item = result.get(bucket)
+            if item is not None:
+                item['actions'][action] = count
+                item['total'] += count
+        return [result[bucket] for bucket in buckets]
+
+    def summary(self, limit=10, hours=24, days=30, now=None):
+        """管理员统计页面所需的全部数据"""
+        now = time.time() if now is None else now
+        hour_buckets = [time.strftime(HOUR_FORMAT, time.localtime(now - i * 3600))
+                        for i in range(hours - 1, -1, -1)]
+        day_buckets = sorted({time.strftime(DAY_FORMAT, time.localtime(now - i * 86400))
+                              for i in range(days)})
+
+        users = self.top('user', limit)
+        names = [row[0] for row in users]
+        downloads = self.counts('user_download', names)
+        failures = self.counts('failed_user', names)
+        hourly = self.rollup('hour', hour_buckets)
+        return {
+            'totals': {key: count for key, count, _ in self.top('action', 100)},
+            'top_files': [{'filename': key, 'count': count, 'last': last}
+                          for key, count, last in self.top('file', limit)],
+            'top_users': [{'username': key, 'count': count, 'last': last,
+                           'downloads': downloads.get(key, 0), 'failed_logins': failures.get(key, 0)}
+                          for key, count, last in users],
+            'top_ips': [{'ip': key, 'count': count, 'last': last}
+                        for key, count, last in self.top('ip', limit)],
+            'failed_logins': {
+                'users': [{'username': key, 'count': count, 'last': last}
+                          for key, count, last in self.top('failed_user', limit)],
+                'ips': [{'ip': key, 'count': count, 'last': last}
+                        for key, count, last in self.top('failed_ip', limit)],
+                'hourly': [{'bucket': item['bucket'], 'count': item['actions'].get('login_failed', 0)}
+                           for item in hourly],
+            },
+            'hourly': hourly,
+            'daily': self.rollup('day', day_buckets),
+        }
+
+    def close(self):
+        with self._db_lock:
+            self._conn.close()
+
+    def _apply(self, entries):
+        counters, rollups = _counter_updates(entries)
+        self._conn.executemany(
+            'INSERT INTO counters (kind, key, count, last) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(kind, key) DO UPDATE SET count = count + excluded.count, '
+            'last = max(last, excluded.last)',
+            [(kind, key, count, last) for (kind, key), (count, last) in counters.items()]
+        )
+        self._conn.executemany(
+            'INSERT INTO rollups (period, bucket, action, count) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(period, bucket, action) DO UPDATE SET count = count + excluded.count',
+            [(period, bucket, action, count) for (period, bucket, action), count in rollups.items()]
+        )
+
+    def _maybe_prune(self, now):
+        """删除过期的时间段汇总；某一类的键数超过上限时删除次数最少的"""
+        if now < self._next_prune:
+            return
+        self._next_prune = now + PRUNE_INTERVAL
+        self._conn.execute(
+            "DELETE FROM rollups WHERE period = 'hour' AND bucket < ?",
+            (time.strftime(HOUR_FORMAT, time.localtime(now - HOURLY_RETENTION_DAYS * 86400)),)
+        )
+        self._conn.execute(
+            "DELETE FROM rollups WHERE period = 'day' AND bucket < ?",
+            (time.strftime(DAY_FORMAT, time.localtime(now - DAILY_RETENTION_DAYS * 86400)),)
+        )
+        kinds = self._conn.execute(
+            'SELECT kind FROM counters GROUP BY kind HAVING COUNT(*) > ?', (MAX_KEYS_PER_KIND,)
+        ).fetchall()
+        for (kind,) in kinds:
+            self._conn.execute(
+                'DELETE FROM counters WHERE kind = ? AND key IN (SELECT key FROM counters WHERE kind = ? '
+                'ORDER BY count DESC LIMIT -1 OFFSET ?)', (kind, kind, MAX_KEYS_PER_KIND)
+            )
@@ -0,0 +1,157 @@
+import os
+import tarfile
+import time
+import zipfile
+
+from generate_index import VIDEO_EXTENSIONS, IMAGE_EXTENSIONS, ARCHIVE_EXTENSIONS, is_within
+
+# 已经压缩过的格式（视频、图片、压缩包）原样存储，其余文件用 deflate 压缩
+STORED_EXTENSIONS = frozenset(VIDEO_EXTENSIONS + IMAGE_EXTENSIONS + ARCHIVE_EXTENSIONS)
+# 每次读取的字节数，也是输出块的目标大小；内存占用只与它有关，与文件大小和数量无关
+CHUNK_SIZE = 256 * 1024
+DEFLATE_LEVEL = 6
+FORMATS = {
+    'zip': ('application/zip', '.zip'),
+    'tar': ('application/x-tar', '.tar'),
+}
+_TAR_BLOCK = tarfile.BLOCKSIZE
+_TAR_RECORD = tarfile.RECORDSIZE
+# ZIP 不能表示1980年以前的时间
+_ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+class _Sink:
+    """只能追加写入的缓冲：zipfile 写入到这里，生成器定期取走，不需要临时文件"""
+
+    def __init__(self):
+        self._chunks = []
+        self.size = 0   # 尚未取走的字节数
+        self.total = 0  # 累计写入的字节数
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        self.total += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self.size = 0
+        return data
+
+
+def stat_members(members, real_root=None):
+    """members 为 [(包内路径, 文件路径)]，返回 [(包内路径, 文件路径, 大小, 修改时间)]，跳过无法读取的文件
+
+    给出 real_root（已经 realpath 过的共享目录）时跳过经符号链接指向其外的文件，
+    返回解析后的真实路径，打包期间符号链接被改指向也不影响
+    """
+    result = []
+    for arcname, path in members:
+        if real_root is not None:
+            if not is_within(path, real_root):
+                continue
+            path = os.path.realpath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if os.path.isfile(path):
+            result.append((arcname, path, st.st_size, st.st_mtime))
+    return result
+
+
+def _zip_info(arcname, size, mtime):
+    local = time.localtime(mtime)
+    info = zipfile.ZipInfo(arcname, tuple(local[:6]) if local.tm_year >= 1980 else _ZIP_EPOCH)
+    info.external_attr = 0o644 << 16
+    # 提前给出大小，zipfile 据此决定是否使用 ZIP64 扩展
+    info.file_size = size
+    if os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS:
+        info.compress_type = zipfile.ZIP_STORED
+    else:
+        info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+
+def stream_zip(members, chunk_size=CHUNK_SIZE):
+    """边读文件边生成 ZIP 数据；members 为 stat_members 的返回值
+
+    输出不可回退，zipfile 会给每个成员加数据描述符（CRC和大小写在数据之后），
+    因此不需要先读一遍文件，也不需要临时文件。
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True, compresslevel=DEFLATE_LEVEL) as zf:
+        for arcname, path, size, mtime in members:
+            try:
+                f = open(path, 'rb')
+            except OSError:
+                continue  # 打包期间被删除
+            with f, zf.open(_zip_info(arcname, size, mtime), 'w') as out:
+                while True:
+                    data = f.read(chunk_size)
+                    if not data:
+                        break
+                    out.write(data)
+                    if sink.size >= chunk_size:
+                        yield sink.drain()
+            if sink.size >= chunk_size:
+                yield sink.drain()
+    yield sink.drain()
+
+
+def _tar_header(arcname, size, mtime):
+    info = tarfile.TarInfo(arcname)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    return info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+
+
+def _padding(size, block):
+    return -size % block
+
+
+def tar_length(members):
+    """TAR 的总字节数（文件头和大小在开始时确定），可以作为 Content-Length"""
+    total = 0
+    for arcname, _, size, mtime in members:
+        total += len(_tar_header(arcname, size, mtime)) + size + _padding(size, _TAR_BLOCK)
+    total += 2 * _TAR_BLOCK
+    return total + _padding(total, _TAR_RECORD)
+
+
+def stream_tar(members, chunk_size=CHUNK_SIZE):
+    """边读文件边生成 TAR 数据（不压缩）
+
+    文件大小以 stat_members 时为准：打包期间文件变短时补零，变长时截断，
+    保证输出长度与 tar_length 一致。
+    """
+    out = _Sink()
+    for arcname, path, size, mtime in members:
+        out.write(_tar_header(arcname, size, mtime))
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            f = None
+        remaining = size
+        try:
+            while remaining:
+                data = f.read(min(chunk_size, remaining)) if f is not None else b''
+                if not data:
+                    data = bytes(min(chunk_size, remaining))
+                out.write(data)
+                remaining -= len(data)
+                if out.size >= chunk_size:
+                    yield out.drain()
+        finally:
+            if f is not None:
+                f.close()
+        out.write(bytes(_padding(size, _TAR_BLOCK)))
+    out.write(bytes(2 * _TAR_BLOCK))
+    out.write(bytes(_padding(out.total, _TAR_RECORD)))
+    yield out.drain()
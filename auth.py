@@ -1,37 +1,157 @@
 import json
+import math
 import os
+import threading
 import time
 from functools import wraps
-from flask import Flask, request, redirect, url_for, session, jsonify
+from urllib.parse import quote
+from flask import Flask, request, redirect, url_for, session, jsonify, g, Response
 from flask_cors import CORS  # 添加CORS支持
+from access_log import AccessLogStore, create_backend, import_legacy_log
+from analytics import AccessAnalytics
+from user_store import UserStore
+from passwords import verify_password, needs_rehash, rehash_password
+from share_index import ShareIndex, entry_to_json
+from generate_index import is_hidden, is_within, regenerate_index, API_PREFIX
+from session_store import ServerSessionInterface, create_session_store
+from rate_limit import LoginGuard
+from metrics import registry, REQUESTS, REQUEST_SECONDS, IN_FLIGHT
+from uploads import UploadManager, UploadError, CLIENT_CHUNK_SIZE
+from archives import FORMATS, stat_members, stream_zip, stream_tar, tar_length
+from bandwidth import BANDWIDTH_FILE, BandwidthShaper
+from signed_urls import UrlSigner, load_signing_key
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here-change-this-in-production'  # 使用更强的密钥
 
-# 添加CORS支持，允许跨域请求
-CORS(app, supports_credentials=True)
+# 页面与接口同源（serve.py 把接口挂载在 /api 下），默认不需要也不允许跨域；
+# 其他来源的页面需要调用接口时，在 CORS_ORIGINS 中列出允许的来源（逗号分隔，如 http://host:8080）
+CORS_ORIGINS = {origin.strip() for origin in os.environ.get('CORS_ORIGINS', '').split(',') if origin.strip()}
+if CORS_ORIGINS:
+    CORS(app, supports_credentials=True, origins=sorted(CORS_ORIGINS))
 
 # 用户数据文件路径
 USERS_FILE = 'users.json'
-# 访问记录文件路径
-ACCESS_LOG_FILE = 'access_log.json'
+# 访问记录文件路径（旧版为整体重写的JSON，新版为追加写入）
+LEGACY_ACCESS_LOG_FILE = 'access_log.json'
+# 访问记录后端: jsonl（JSON Lines追加写入）或 sqlite（WAL模式）
+ACCESS_LOG_BACKEND = os.environ.get('ACCESS_LOG_BACKEND', 'jsonl')
+ACCESS_LOG_FILE = 'access_log.db' if ACCESS_LOG_BACKEND == 'sqlite' else 'access_log.jsonl'
+# 访问记录文件大小上限，超过后轮转（不再按条数截断）
+ACCESS_LOG_MAX_BYTES = int(os.environ.get('ACCESS_LOG_MAX_BYTES', 10 * 1024 * 1024))
+
+# 共享目录（默认为当前目录，与 generate_index.py 的默认值一致）
+SHARE_DIRECTORY = os.environ.get('SHARE_DIRECTORY', '.')
+
+_access_backend = create_backend(ACCESS_LOG_BACKEND, ACCESS_LOG_FILE, ACCESS_LOG_MAX_BYTES)
+import_legacy_log(LEGACY_ACCESS_LOG_FILE, _access_backend)
+# 多进程部署（serve.py --workers N）时由启动脚本设置，最近记录改为从共享的后端读取
+ACCESS_LOG_SHARED = os.environ.get('ACCESS_LOG_SHARED') == '1'
+# 访问统计（热门文件、用户/IP活跃度、失败登录、按小时/按天汇总）在每批记录落盘时增量更新，
+# 首次启用时从已有的访问记录导入一次
+ACCESS_STATS_FILE = 'access_log.stats.db'
+access_analytics = AccessAnalytics(ACCESS_STATS_FILE)
+access_analytics.backfill(_access_backend.iter_all())
+access_store = AccessLogStore(_access_backend, shared=ACCESS_LOG_SHARED).add_listener(access_analytics.record).start()
+
+# 会话保存在服务端（Cookie中只有随机会话ID），空闲超时后失效，管理员可强制下线
+# memory: 进程内存储；sqlite: 重启后仍有效，可在多个工作进程间共享（多进程部署时默认使用）
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sqlite' if ACCESS_LOG_SHARED else 'memory')
+SESSION_FILE = 'sessions.db'
+SESSION_IDLE_TIMEOUT = int(os.environ.get('SESSION_IDLE_TIMEOUT', 2 * 60 * 60))
+SESSION_MAX_COUNT = int(os.environ.get('SESSION_MAX_COUNT', 10000))
+session_store = create_session_store(SESSION_BACKEND, SESSION_FILE, SESSION_IDLE_TIMEOUT, SESSION_MAX_COUNT)
+app.session_interface = ServerSessionInterface(session_store)
+
+# 登录限流（每个工作进程各自计数）：每IP每秒补充的尝试次数/突发上限，
+# 每用户名每秒补充的失败次数/突发上限，连续失败多少次后开始指数退避及最长封禁秒数
+login_guard = LoginGuard(
+    ip_rate=float(os.environ.get('LOGIN_IP_RATE', 0.2)),
+    ip_burst=int(os.environ.get('LOGIN_IP_BURST', 10)),
+    user_rate=float(os.environ.get('LOGIN_USER_RATE', 0.5)),
+    user_burst=int(os.environ.get('LOGIN_USER_BURST', 30)),
+    backoff_after=int(os.environ.get('LOGIN_BACKOFF_AFTER', 5)),
+    backoff_max=float(os.environ.get('LOGIN_BACKOFF_MAX', 300)),
+)
+
+# 用户数据常驻内存，仅在文件变化时重新加载
+user_store = UserStore(USERS_FILE)
+# 共享目录的内存索引，供分页文件列表和搜索接口使用（子目录的索引在首次访问时创建）
+share_index = ShareIndex(SHARE_DIRECTORY)
+_share_indexes = {'': share_index}
+
+# 打包下载一次最多包含的文件数
+ARCHIVE_MAX_FILES = int(os.environ.get('ARCHIVE_MAX_FILES', 10000))
+
+# 允许上传文件的角色（users.json 中的 role 字段，逗号分隔）和单个文件的大小上限（字节，0 表示不限）
+UPLOAD_ROLES = {role.strip() for role in os.environ.get('UPLOAD_ROLES', 'admin,uploader').split(',') if role.strip()}
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 0)) or None
+upload_manager = UploadManager(SHARE_DIRECTORY, UPLOAD_MAX_BYTES)
+# 上传完成后等待多少秒再重新生成静态索引页（合并连续的上传）
+INDEX_REBUILD_DELAY = 2.0
+_index_rebuild_timer = None
+_index_rebuild_lock = threading.Lock()
+
+# 下载限速（总带宽、单连接、每用户及按角色的上限），配置文件修改后自动生效，
+# 也可以由管理员通过 /bandwidth 接口修改；serve.py 的文件下载和打包下载都经过它
+bandwidth = BandwidthShaper(BANDWIDTH_FILE)
+
+# 共享文件的下载链接由 /download 签发（HMAC签名，绑定用户、路径、过期时间和客户端IP），
+# 文件服务只校验签名，不查询会话
+url_signer = UrlSigner(load_signing_key())
+
+# 除本机和管理员外，允许读取 /metrics 的地址（逗号分隔，如 Prometheus 服务器）
+METRICS_ALLOW = {ip.strip() for ip in os.environ.get('METRICS_ALLOW', '').split(',') if ip.strip()}
+
+@app.before_request
+def _start_request_metrics():
+    g.metrics_route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    g.metrics_start = time.perf_counter()
+    IN_FLIGHT.inc(route=g.metrics_route)
+
+@app.after_request
+def _record_request_status(response):
+    """记录响应的状态码；未处理的异常不经过这里，按500计"""
+    g.metrics_status = response.status_code
+    return response
+
+@app.teardown_request
+def _record_request_metrics(exc):
+    """记录每个路由的请求数（按状态码）、耗时直方图和正在处理的请求数（请求出错时也会执行）"""
+    route = g.pop('metrics_route', None)
+    if route is not None:
+        IN_FLIGHT.dec(route=route)
+        REQUEST_SECONDS.observe(time.perf_counter() - g.metrics_start, route=route)
+        REQUESTS.inc(route=route, method=request.method, status=str(g.pop('metrics_status', 500)))
+
+def get_share_index(rel_dir):
+    """获取子目录的内存索引，路径非法或不存在时返回None"""
+    rel_dir = rel_dir.strip('/')
+    index = _share_indexes.get(rel_dir)
+    if index is not None:
+        return index
+    parts = rel_dir.split('/')
+    # 不允许 ..、空段以及隐藏目录
+    if any(not part or part in ('.', '..') or is_hidden(part) for part in parts):
+        return None
+    path = os.path.join(SHARE_DIRECTORY, *parts)
+    # 与文件服务相同：经符号链接指向共享目录之外的目录不提供
+    if not os.path.isdir(path) or not is_within(path, os.path.realpath(SHARE_DIRECTORY)):
+        return None
+    index = _share_indexes.setdefault(rel_dir, ShareIndex(path, SHARE_DIRECTORY))
+    return index
 
 def load_users():
     """加载用户数据"""
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    return user_store.all()
 
 def save_users(users):
-    """保存用户数据"""
-    with open(USERS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(users, f, indent=4, ensure_ascii=False)
-
-def log_access(username, action, filename=None):
-    """记录用户访问行为"""
-    access_log = load_access_log()
-    log_entry = {
+    """保存用户数据（原子写入）"""
+    user_store.save(users)
+
+def log_access(username, action, filename=None, members=None):
+    """记录用户访问行为（写入内存缓冲，由后台线程批量落盘）；members 为打包下载包含的文件"""
+    entry = {
         'timestamp': time.time(),
         'time_str': time.strftime('%Y-%m-%d %H:%M:%S'),
         'username': username,
@@ -39,27 +159,26 @@ def log_access(username, action, filename=None):
         'filename': filename,
         'ip': request.remote_addr
     }
-    
-    # 将新记录添加到日志开头
-    access_log.insert(0, log_entry)
-    
-    # 只保留最近1000条记录
-    if len(access_log) > 1000:
-        access_log = access_log[:1000]
-    
-    save_access_log(access_log)
+    if members is not None:
+        entry['members'] = members
+    access_store.append(entry)
 
-def load_access_log():
-    """加载访问记录"""
-    if os.path.exists(ACCESS_LOG_FILE):
-        with open(ACCESS_LOG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return []
+def session_user(sid):
+    """按会话ID查找登录用户，返回 (用户名, 角色)，供文件服务按用户限速；无效时返回None"""
+    record = session_store.get(sid)
+    if record is None or 'username' not in record[0]:
+        return None
+    username = record[0]['username']
+    return username, user_role(username)
 
-def save_access_log(access_log):
-    """保存访问记录"""
-    with open(ACCESS_LOG_FILE, 'w', encoding='utf-8') as f:
-        json.dump(access_log, f, indent=4, ensure_ascii=False)
+def user_role(username):
+    """用户的角色，用户不存在时返回None"""
+    user = user_store.get(username)
+    return user.get('role') if user is not None else None
+
+def load_access_log(limit=50):
+    """加载最近的访问记录（最新在前，直接读取内存缓冲）"""
+    return access_store.recent(limit)
 
 @app.route('/login', methods=['POST', 'OPTIONS'])
 def login():
@@ -67,13 +186,27 @@ def login():
     if request.method == 'OPTIONS':
         return _build_cors_preflight_response()
     
+    # 超出限制的请求直接返回429：不解析表单、不查用户、不写访问记录
+    ip = request.remote_addr
+    wait = login_guard.check_ip(ip)
+    if wait:
+        return _too_many_attempts(wait)
+    
     username = request.form.get('username')
     password = request.form.get('password')
     
-    users = load_users()
+    wait = login_guard.check_user(username, ip)
+    if wait:
+        return _too_many_attempts(wait)
+    
+    user = user_store.get(username)
     
     # 检查用户是否存在且密码正确
-    if username in users and users[username]['password'] == password:
+    if verify_password(password, user['password'] if user is not None else None):
+        if needs_rehash(user['password']):
+            _upgrade_password(username, password)
+        login_guard.success(ip, username)
+        session.regenerate()
         session['username'] = username
         # 记录登录成功
         log_access(username, 'login_success')
@@ -81,10 +214,24 @@ def login():
         return _corsify_actual_response(response)
     else:
         # 记录登录失败
+        login_guard.failure(ip, username)
         log_access(username, 'login_failed')
         response = jsonify({'success': False, 'message': '用户名或密码错误'})
         return _corsify_actual_response(response)
 
+def _too_many_attempts(wait):
+    response = jsonify({'success': False, 'message': f'尝试次数过多，请 {math.ceil(wait)} 秒后再试'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(math.ceil(wait))
+    return _corsify_actual_response(response)
+
+def _upgrade_password(username, password):
+    """登录成功后把明文密码或旧参数的哈希升级为当前配置"""
+    users = {name: dict(info) for name, info in load_users().items()}
+    if username in users:
+        users[username]['password'] = rehash_password(password)
+        save_users(users)
+
 @app.route('/logout', methods=['GET', 'OPTIONS'])
 def logout():
     """处理退出登录"""
@@ -105,9 +252,11 @@ def check_auth():
     if request.method == 'OPTIONS':
         return _build_cors_preflight_response()
     
-    if 'username' in session:
+    # 会话查找是一次字典/主键查询；用户已被删除时会话随之失效
+    if 'username' in session and user_store.get(session['username']) is not None:
         response = jsonify({'authenticated': True, 'username': session['username']})
     else:
+        session.clear()
         response = jsonify({'authenticated': False})
     return _corsify_actual_response(response)
 
@@ -123,32 +272,496 @@ def get_access_logs():
         return _corsify_actual_response(response)
     
     # 只允许管理员查看访问记录
-    users = load_users()
-    username = session['username']
-    if username in users and users[username].get('role') == 'admin':
-        logs = load_access_log()
+    if _is_admin():
         # 限制返回最近50条记录
-        response = jsonify({'success': True, 'logs': logs[:50]})
+        logs = load_access_log(50)
+        response = jsonify({'success': True, 'logs': logs})
+    else:
+        response = jsonify({'success': False, 'message': '权限不足'})
+    
+    return _corsify_actual_response(response)
+
+@app.route('/analytics', methods=['GET', 'OPTIONS'])
+def get_analytics():
+    """访问统计汇总（仅管理员）：热门文件、用户和IP排行、失败登录趋势、按小时/按天汇总"""
+    if request.method == 'OPTIONS':
+        return _build_cors_preflight_response()
+    
+    if 'username' not in session:
+        response = jsonify({'success': False, 'message': '未登录'})
+        return _corsify_actual_response(response)
+    
+    if not _is_admin():
+        response = jsonify({'success': False, 'message': '权限不足'})
+        return _corsify_actual_response(response)
+    
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    hours = min(max(request.args.get('hours', 24, type=int), 1), 24 * 14)
+    days = min(max(request.args.get('days', 30, type=int), 1), 400)
+    # 先把本进程缓冲中的记录写入，统计包含刚发生的访问；写入失败时返回已有的统计
+    try:
+        access_store.flush()
+    except Exception as e:
+        print(f"写入访问记录失败: {e}")
+    response = jsonify(dict(access_analytics.summary(limit, hours, days), success=True))
+    return _corsify_actual_response(response)
+
+def _is_admin():
+    user = user_store.get(session.get('username'))
+    return user is not None and user.get('role') == 'admin'
+
+@app.route('/sessions', methods=['GET', 'OPTIONS'])
+def list_sessions():
+    """查看当前有效的会话（仅管理员）"""
+    if request.method == 'OPTIONS':
+        return _build_cors_preflight_response()
+    
+    if 'username' not in session:
+        response = jsonify({'success': False, 'message': '未登录'})
+        return _corsify_actual_response(response)
+    
+    if _is_admin():
+        response = jsonify({'success': True, 'sessions': session_store.sessions()})
+    else:
+        response = jsonify({'success': False, 'message': '权限不足'})
+    return _corsify_actual_response(response)
+
+@app.route('/sessions/revoke', methods=['POST', 'OPTIONS'])
+def revoke_sessions():
+    """强制用户下线：删除该用户的所有会话（仅管理员）"""
+    if request.method == 'OPTIONS':
+        return _build_cors_preflight_response()
+    
+    if 'username' not in session:
+        response = jsonify({'success': False, 'message': '未登录'})
+        return _corsify_actual_response(response)
+    
+    if not _is_admin():
+        response = jsonify({'success': False, 'message': '权限不足'})
+        return _corsify_actual_response(response)
+    
+    username = request.form.get('username') or (request.get_json(silent=True) or {}).get('username')
+    if not username:
+        response = jsonify({'success': False, 'message': '缺少用户名'})
+        return _corsify_actual_response(response)
+    
+    revoked = session_store.revoke_user(username)
+    log_access(session['username'], 'revoke_sessions', username)
+    response = jsonify({'success': True, 'revoked': revoked})
+    return _corsify_actual_response(response)
+
+@app.route('/bandwidth', methods=['GET', 'POST', 'OPTIONS'])
+def bandwidth_settings():
+    """查看限速配置和本进程每个用户/IP的当前下载速率；POST JSON 修改配置（仅管理员）"""
+    if request.method == 'OPTIONS':
+        return _build_cors_preflight_response()
+    
+    if 'username' not in session:
+        response = jsonify({'success': False, 'message': '未登录'})
+        return _corsify_actual_response(response)
+    
+    if not _is_admin():
+        response = jsonify({'success': False, 'message': '权限不足'})
+        return _corsify_actual_response(response)
+    
+    if request.method == 'POST':
+        try:
+            config = bandwidth.update(request.get_json(silent=True) or {})
+        except ValueError as e:
+            response = jsonify({'success': False, 'message': str(e)})
+            return _corsify_actual_response(response)
+        log_access(session['username'], 'bandwidth_update', json.dumps(config, ensure_ascii=False))
+    
+    response = jsonify(dict(bandwidth.stats(), success=True))
+    return _corsify_actual_response(response)
+
+def _metrics_allowed():
+    return (request.remote_addr in ('127.0.0.1', '::1') or request.remote_addr in METRICS_ALLOW or
+            ('username' in session and _is_admin()))
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 文本格式的指标（本进程）"""
+    if not _metrics_allowed():
+        return Response('forbidden\n', status=403, mimetype='text/plain')
+    return Response(registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics.json', methods=['GET', 'OPTIONS'])
+def metrics_json():
+    """JSON 格式的指标快照，另附登录限流和会话的统计"""
+    if request.method == 'OPTIONS':
+        return _build_cors_preflight_response()
+    
+    if not _metrics_allowed():
+        response = jsonify({'success': False, 'message': '权限不足'})
+        return _corsify_actual_response(response)
+    
+    snapshot = registry.snapshot()
+    snapshot['login_guard'] = login_guard.stats()
+    snapshot['sessions'] = len(session_store.sessions())
+    snapshot['bandwidth'] = bandwidth.stats()
+    response = jsonify(dict(snapshot, success=True))
+    return _corsify_actual_response(response)
+
+@app.route('/files', methods=['GET', 'OPTIONS'])
+def list_files():
+    """分页获取文件列表（游标分页，支持排序和前缀过滤）"""
+    if request.method == 'OPTIONS':
+        return _build_cors_preflight_response()
+    
+    if 'username' not in session:
+        response = jsonify({'success': False, 'message': '未登录'})
+        return _corsify_actual_response(response)
+    
+    index = get_share_index(request.args.get('dir', ''))
+    if index is None:
+        response = jsonify({'success': False, 'message': '目录不存在'})
+        return _corsify_actual_response(response)
+    
+    try:
+        items, total, next_cursor = index.list(
+            sort=request.args.get('sort', 'name'),
+            order=request.args.get('order', 'asc'),
+            prefix=request.args.get('prefix', ''),
+            limit=request.args.get('limit', 100),
+            cursor=request.args.get('cursor') or None,
+        )
+    except ValueError as e:
+        response = jsonify({'success': False, 'message': str(e)})
+        return _corsify_actual_response(response)
+    
+    response = jsonify({
+        'success': True,
+        'total': total,
+        'files': [entry_to_json(entry) for entry in items],
+        'next_cursor': next_cursor
+    })
+    return _corsify_actual_response(response)
+
+def _optional_number(name):
+    """读取可选的数字参数，缺省时返回None"""
+    value = request.args.get(name, '')
+    if value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"参数 {name} 必须是数字")
+
+@app.route('/search', methods=['GET', 'OPTIONS'])
+def search_files():
+    """按文件名搜索（子串或模糊匹配），可按类型、大小和修改时间过滤"""
+    if request.method == 'OPTIONS':
+        return _build_cors_preflight_response()
+    
+    if 'username' not in session:
+        response = jsonify({'success': False, 'message': '未登录'})
+        return _corsify_actual_response(response)
+    
+    index = get_share_index(request.args.get('dir', ''))
+    if index is None:
+        response = jsonify({'success': False, 'message': '目录不存在'})
+        return _corsify_actual_response(response)
+    
+    start = time.perf_counter()
+    try:
+        items, total = index.search(
+            query=request.args.get('q', ''),
+            fuzzy=request.args.get('fuzzy', '') in ('1', 'true'),
+            category=request.args.get('type') or None,
+            min_size=_optional_number('min_size'),
+            max_size=_optional_number('max_size'),
+            after=_optional_number('after'),
+            before=_optional_number('before'),
+            limit=request.args.get('limit', 50),
+        )
+    except ValueError as e:
+        response = jsonify({'success': False, 'message': str(e)})
+        return _corsify_actual_response(response)
+    
+    response = jsonify({
+        'success': True,
+        'total': total,
+        'files': [entry_to_json(entry) for entry in items],
+        'took_ms': round((time.perf_counter() - start) * 1000, 2)
+    })
+    return _corsify_actual_response(response)
+
+# 单次请求最多接受的文件访问事件数
+MAX_EVENTS_PER_REQUEST = 500
+
+@app.route('/log_file_access', methods=['POST', 'OPTIONS'])
+def log_file_access():
+    """记录文件访问（支持页面批量上报）"""
+    if request.method == 'OPTIONS':
+        return _build_cors_preflight_response()
+    
+    if 'username' not in session:
+        response = jsonify({'success': False, 'message': '未登录'})
+        return _corsify_actual_response(response)
+    
+    # 兼容三种格式: filename=单个文件 / events=JSON数组（sendBeacon） / JSON请求体
+    if request.form.get('events'):
+        try:
+            events = json.loads(request.form['events'])
+        except ValueError:
+            events = None
+    elif request.is_json:
+        events = (request.get_json(silent=True) or {}).get('events')
+    else:
+        events = [{'filename': request.form.get('filename')}]
+    
+    if not isinstance(events, list):
+        response = jsonify({'success': False, 'message': '请求格式错误'})
+        return _corsify_actual_response(response)
+    
+    username = session['username']
+    now = time.time()
+    time_str = time.strftime('%Y-%m-%d %H:%M:%S')
+    ip = request.remote_addr
+    entries = [{
+        'timestamp': now,
+        'time_str': time_str,
+        'username': username,
+        'action': 'file_access',
+        'filename': event.get('filename'),
+        'ip': ip
+    } for event in events[:MAX_EVENTS_PER_REQUEST]
+        if isinstance(event, dict) and isinstance(event.get('filename'), str)]
+    # 只放入内存队列，由后台线程落盘，请求立即返回
+    access_store.extend(entries)
+    
+    response = jsonify({'success': True, 'accepted': len(entries)})
+    return _corsify_actual_response(response)
+
+@app.route('/download', methods=['GET'])
+def issue_download():
+    """签发下载链接：检查会话并记录一次文件访问，然后重定向到带签名的文件地址
+
+    视频等文件之后的每个Range请求都使用同一个签名链接，不再逐次记录。
+    """
+    rel_path = request.args.get('path', '').strip('/')
+    parent, _, name = rel_path.rpartition('/')
+    if 'username' not in session:
+        # 浏览器直接打开的链接：回到所在目录的页面登录
+        return redirect('/' + quote(parent + '/' if parent else ''))
+    
+    index = get_share_index(parent)
+    if index is None or not name or index.get(name) is None:
+        response = jsonify({'success': False, 'message': '文件不存在'})
+        return _corsify_actual_response(response), 404
+    
+    log_access(session['username'], 'file_access', rel_path)
+    response = redirect(url_signer.sign('/' + rel_path, session['username'], request.remote_addr))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/archive', methods=['GET', 'POST', 'OPTIONS'])
+def download_archive():
+    """把目录中选中的文件（files，可重复；不指定时为全部文件）流式打包为 ZIP 或 TAR 下载"""
+    if request.method == 'OPTIONS':
+        return _build_cors_preflight_response()
+    
+    if 'username' not in session:
+        response = jsonify({'success': False, 'message': '未登录'})
+        return _corsify_actual_response(response)
+    
+    params = request.values
+    rel_dir = params.get('dir', '').strip('/')
+    archive_format = params.get('format', 'zip')
+    index = get_share_index(rel_dir)
+    if index is None:
+        response = jsonify({'success': False, 'message': '目录不存在'})
+        return _corsify_actual_response(response)
+    if archive_format not in FORMATS:
+        response = jsonify({'success': False, 'message': '不支持的打包格式'})
+        return _corsify_actual_response(response)
+    
+    # 只允许索引中存在的文件（隐藏文件和其他目录的文件不会被打包）
+    requested = params.getlist('files')
+    if requested:
+        names = [name for name in dict.fromkeys(requested) if index.get(name) is not None]
     else:
+        names = index.names()
+    if not names:
+        response = jsonify({'success': False, 'message': '没有可下载的文件'})
+        return _corsify_actual_response(response)
+    if len(names) > ARCHIVE_MAX_FILES:
+        response = jsonify({'success': False, 'message': f'一次最多打包 {ARCHIVE_MAX_FILES} 个文件'})
+        return _corsify_actual_response(response)
+    
+    members = stat_members(((name, os.path.join(index.directory, name)) for name in names),
+                           os.path.realpath(SHARE_DIRECTORY))
+    mimetype, ext = FORMATS[archive_format]
+    archive_name = (rel_dir.rsplit('/', 1)[-1] or 'files') + ext
+    # 一条访问记录列出所有成员，代替逐个文件上报
+    path = f'{rel_dir}/{archive_name}' if rel_dir else archive_name
+    log_access(session['username'], 'archive_download', path, [name for name, _, _, _ in members])
+    
+    if archive_format == 'tar':
+        response = Response(stream_tar(members), mimetype=mimetype, direct_passthrough=True)
+        response.headers['Content-Length'] = str(tar_length(members))
+    else:
+        response = Response(stream_zip(members), mimetype=mimetype, direct_passthrough=True)
+    response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(archive_name)}"
+    return _corsify_actual_response(response)
+
+def _can_upload():
+    user = user_store.get(session.get('username'))
+    return user is not None and user.get('role') in UPLOAD_ROLES
+
+def _upload_error(error):
+    body = {'success': False, 'message': error.message}
+    if error.offset is not None:
+        body['offset'] = error.offset
+    response = jsonify(body)
+    response.status_code = error.status
+    return _corsify_actual_response(response)
+
+def _upload_status(record):
+    return {'upload_id': record['id'], 'dir': record['dir'], 'filename': record['filename'],
+            'size': record['size'], 'offset': record['offset'], 'chunk_size': CLIENT_CHUNK_SIZE}
+
+def _get_own_upload(upload_id):
+    """读取上传状态；只有发起上传的用户和管理员可以操作"""
+    record = upload_manager.get(upload_id)
+    if record['username'] != session['username'] and not _is_admin():
+        raise UploadError(404, '上传不存在')
+    return record
+
+@app.route('/uploads', methods=['POST', 'OPTIONS'])
+def create_upload():
+    """开始一个可续传的上传：filename、size（字节），可选 dir 和 sha256"""
+    if request.method == 'OPTIONS':
+        return _build_cors_preflight_response()
+    
+    if 'username' not in session:
+        response = jsonify({'success': False, 'message': '未登录'})
+        return _corsify_actual_response(response)
+    
+    if not _can_upload():
+        response = jsonify({'success': False, 'message': '权限不足'})
+        return _corsify_actual_response(response)
+    
+    params = (request.get_json(silent=True) if request.is_json else request.form) or {}
+    try:
+        size = int(params.get('size'))
+    except (TypeError, ValueError):
+        size = None
+    try:
+        record = upload_manager.create(session['username'], str(params.get('dir') or ''),
+                                       str(params.get('filename') or ''), size,
+                                       str(params['sha256']) if params.get('sha256') else None)
+    except UploadError as e:
+        return _upload_error(e)
+    response = jsonify(dict(_upload_status(record), success=True))
+    response.status_code = 201
+    return _corsify_actual_response(response)
+
+@app.route('/uploads/<upload_id>', methods=['GET', 'PUT', 'DELETE', 'OPTIONS'])
+def upload_chunk(upload_id):
+    """GET 查询已接收的字节数；PUT ?offset=N 追加一段数据（请求体为原始字节）；DELETE 放弃上传"""
+    if request.method == 'OPTIONS':
+        return _build_cors_preflight_response()
+    
+    if 'username' not in session:
+        response = jsonify({'success': False, 'message': '未登录'})
+        return _corsify_actual_response(response)
+    
+    if not _can_upload():
         response = jsonify({'success': False, 'message': '权限不足'})
+        return _corsify_actual_response(response)
     
+    try:
+        record = _get_own_upload(upload_id)
+        if request.method == 'DELETE':
+            upload_manager.abort(upload_id)
+            return _corsify_actual_response(jsonify({'success': True}))
+        if request.method == 'PUT':
+            offset = request.args.get('offset', type=int)
+            if offset is None:
+                raise UploadError(400, '缺少 offset 参数', record['offset'])
+            # 直接读取原始请求体（不经过表单解析），边读边写入磁盘
+            record['offset'] = upload_manager.write_chunk(upload_id, offset, request.stream,
+                                                          request.content_length)
+    except UploadError as e:
+        return _upload_error(e)
+    response = jsonify(dict(_upload_status(record), success=True))
     return _corsify_actual_response(response)
 
+@app.route('/uploads/<upload_id>/complete', methods=['POST', 'OPTIONS'])
+def complete_upload(upload_id):
+    """数据全部上传后调用：校验大小和SHA-256，移动到目标目录并加入文件索引"""
+    if request.method == 'OPTIONS':
+        return _build_cors_preflight_response()
+    
+    if 'username' not in session:
+        response = jsonify({'success': False, 'message': '未登录'})
+        return _corsify_actual_response(response)
+    
+    if not _can_upload():
+        response = jsonify({'success': False, 'message': '权限不足'})
+        return _corsify_actual_response(response)
+    
+    params = (request.get_json(silent=True) if request.is_json else request.form) or {}
+    try:
+        record = _get_own_upload(upload_id)
+        directory, filename, digests = upload_manager.complete(upload_id, params.get('sha256') or None)
+    except UploadError as e:
+        return _upload_error(e)
+    
+    # 只把新文件加入已有的内存索引，不重新扫描目录；静态页面在后台重新生成
+    index = get_share_index(record['dir'])
+    entry = index.add_file(filename, digests['sha256']) if index is not None else None
+    schedule_index_rebuild()
+    path = f"{record['dir']}/{filename}" if record['dir'] else filename
+    log_access(session['username'], 'upload', path)
+    response = jsonify({'success': True, 'path': path, 'sha256': digests['sha256'],
+                        'file': entry_to_json(entry) if entry is not None else None})
+    return _corsify_actual_response(response)
+
+def schedule_index_rebuild():
+    """稍后按上次的参数重新生成 index.html（内联卡片的页面不会自动出现新上传的文件），
+    连续上传多个文件时只生成一次"""
+    global _index_rebuild_timer
+    with _index_rebuild_lock:
+        if _index_rebuild_timer is None:
+            _index_rebuild_timer = threading.Timer(INDEX_REBUILD_DELAY, _rebuild_index)
+            _index_rebuild_timer.daemon = True
+            _index_rebuild_timer.start()
+
+def _rebuild_index():
+    global _index_rebuild_timer
+    with _index_rebuild_lock:
+        _index_rebuild_timer = None
+    try:
+        regenerate_index(SHARE_DIRECTORY)
+    except OSError as e:
+        print(f"重新生成索引失败: {e}")
+
 def _build_cors_preflight_response():
-    """处理预检请求"""
+    """处理预检请求（同源请求没有预检，只有 CORS_ORIGINS 中的来源会得到允许）"""
     response = jsonify()
-    response.headers.add("Access-Control-Allow-Origin", "*")
-    response.headers.add("Access-Control-Allow-Headers", "*")
-    response.headers.add("Access-Control-Allow-Methods", "*")
-    response.headers.add("Access-Control-Allow-Credentials", "true")
+    origin = request.headers.get('Origin')
+    if origin in CORS_ORIGINS:
+        response.headers.add("Access-Control-Allow-Origin", origin)
+        response.headers.add("Access-Control-Allow-Headers", request.headers.get('Access-Control-Request-Headers', '*'))
+        response.headers.add("Access-Control-Allow-Methods", "GET, POST, PUT, DELETE, OPTIONS")
+        response.headers.add("Access-Control-Allow-Credentials", "true")
+        response.headers.add("Vary", "Origin")
     return response
 
 def _corsify_actual_response(response):
-    """添加CORS头到实际响应"""
-    response.headers.add("Access-Control-Allow-Origin", request.headers.get('Origin', '*'))
-    response.headers.add("Access-Control-Allow-Credentials", "true")
+    """为 CORS_ORIGINS 中的来源添加CORS头，同源请求不需要"""
+    origin = request.headers.get('Origin')
+    if origin in CORS_ORIGINS and 'Access-Control-Allow-Origin' not in response.headers:
+        response.headers.add("Access-Control-Allow-Origin", origin)
+        response.headers.add("Access-Control-Allow-Credentials", "true")
+        response.headers.add("Vary", "Origin")
     return response
 
 if __name__ == '__main__':
-    # 修改为在所有网络接口上运行，而不仅仅是本地
+    # 开发调试用，接口与 serve.py 一样挂载在 API_PREFIX 下；正式使用请运行 serve.py（页面和接口同源）
+    from werkzeug.middleware.dispatcher import DispatcherMiddleware
+    app.wsgi_app = DispatcherMiddleware(Response('Not Found', status=404), {API_PREFIX: app.wsgi_app})
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,359 @@
+import heapq
+import itertools
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+from metrics import THROTTLE_SECONDS
+
+# 限速配置文件（JSON），修改后自动生效，不需要重启
+BANDWIDTH_FILE = 'bandwidth.json'
+# 速率单位均为 字节/秒，0 表示不限
+DEFAULT_CONFIG = {
+    'global': 0,          # 所有下载的总出口带宽
+    'per_connection': 0,  # 单个连接
+    'per_client': 0,      # 每个用户（未登录时每个IP）
+    'roles': {},          # 按 users.json 中的角色覆盖 per_client，如 {"guest": 2097152}
+    'small_bytes': 1024 * 1024,  # 每个响应的前这么多字节不排队，索引页、接口和小文件优先发送
+}
+# 限速时每次发送的最大字节数，也是公平调度的粒度
+QUANTUM = 256 * 1024
+# 令牌桶最多积累多少秒的流量（空闲后的突发上限）
+BURST_SECONDS = 0.1
+# 吞吐量统计的平滑时间常数（秒）
+RATE_WINDOW = 5.0
+# 两次检查配置文件之间的最短间隔（秒）
+CHECK_INTERVAL = 1.0
+
+
+def validate_config(config):
+    """校验并补全配置，返回新字典；不合法时抛出 ValueError"""
+    if not isinstance(config, dict):
+        raise ValueError('配置必须是 JSON 对象')
+    result = dict(DEFAULT_CONFIG, roles={})
+    for key, value in config.items():
+        if key not in DEFAULT_CONFIG:
+            raise ValueError(f'未知的配置项: {key}')
+        if key == 'roles':
+            if not isinstance(value, dict):
+                raise ValueError('roles 必须是 {角色: 速率} 对象')
+            for role, rate in value.items():
+                if not isinstance(rate, int) or isinstance(rate, bool) or rate < 0:
+                    raise ValueError(f'角色 {role} 的速率必须是非负整数')
+            result['roles'] = dict(value)
+        elif not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise ValueError(f'{key} 必须是非负整数')
+        else:
+            result[key] = value
+    return result
+
+
+class TokenBucket:
+    """允许透支的令牌桶：先取走令牌，透支的部分换算成发送前需要等待的秒数"""
+
+    def __init__(self, rate, now):
+        self.rate = rate
+        self.burst = max(QUANTUM, rate * BURST_SECONDS)
+        self.tokens = self.burst
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, n, now):
+        self.refill(now)
+        self.tokens -= n
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class _Meter:
+    """指数衰减的吞吐量估计"""
+
+    def __init__(self, now):
+        self.value = 0.0
+        self.total = 0
+        self.updated = now
+
+    def add(self, n, now):
+        self._decay(now)
+        self.value += n
+        self.total += n
+
+    def rate(self, now):
+        self._decay(now)
+        return self.value / RATE_WINDOW
+
+    def _decay(self, now):
+        self.value *= math.exp(-(now - self.updated) / RATE_WINDOW)
+        self.updated = now
+
+
+class _Client:
+    """一个用户或IP的所有进行中的下载"""
+
+    def __init__(self, key, role, now):
+        self.key = key
+        self.role = role
+        self.transfers = 0
+        self.vtime = 0.0  # 公平队列中的虚拟时间（已获得的字节数）
+        self.meter = _Meter(now)
+        self.bucket = None
+        self.generation = -1
+
+
+class Transfer:
+    """单个响应的发送配额；每次发送前调用 throttle，响应结束后调用 close"""
+
+    def __init__(self, shaper, identify):
+        self.shaper = shaper
+        self.identify = identify
+        self.sent = 0
+        self.client = None
+        self.bucket = None
+        self.generation = -1
+
+    def throttle(self, n):
+        """发送 n 字节之前调用：按需等待，返回本次可以发送的字节数（不超过 n）"""
+        return self.shaper.throttle(self, n)
+
+    def close(self):
+        if self.client is not None:
+            self.shaper.leave(self.client)
+            self.client = None
+
+
+class BandwidthShaper:
+    """下载限速与公平调度
+
+    每个响应的前 small_bytes 字节直接发送（只计入全局流量），超出后成为大文件传输：
+    依次受单连接、每用户（按角色）和全局令牌桶限制，每次最多发送 QUANTUM 字节。
+    全局带宽不足时，等待中的传输按所属用户已获得的字节数排队（起始时间公平队列），
+    多个用户平分带宽，一个用户开再多连接也只占一份；小响应透支的全局令牌由大文件传输补回，
+    因此索引页和接口请求不会排在大文件后面。
+    配置保存在 JSON 文件中，文件变化后所有工作进程在一秒内生效。
+    """
+
+    def __init__(self, path=None, config=None):
+        self.path = path
+        self._cond = threading.Condition()
+        self._clients = {}
+        self._queue = []  # [(起始虚拟时间, 序号, 用户)]
+        self._seq = itertools.count()
+        self._vclock = 0.0
+        self._active = 0
+        now = time.monotonic()
+        self._meter = _Meter(now)
+        self._global = None
+        self._signature = None
+        self._next_check = 0.0
+        self.generation = 0
+        self.config = validate_config(config or {})
+        if path is not None:
+            self._reload()
+        self._apply(self.config)
+
+    def transfer(self, identify):
+        """开始一个响应；identify(full) 返回 (用户或IP, 角色)，只在响应超过 small_bytes 时调用一次
+
+        full 为假时（没有配置每用户或按角色的限速）只能使用请求自带的身份（签名链接中的用户名或IP），
+        不查询会话和用户数据
+        """
+        return Transfer(self, identify)
+
+    def update(self, changes):
+        """修改部分配置并写入配置文件，返回新配置；不合法时抛出 ValueError"""
+        config = dict(self.config)
+        config.update(changes)
+        config = validate_config(config)
+        if self.path is not None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(prefix='.bandwidth-', suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(config, f, indent=4, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._signature = self._stat_signature()
+        self._apply(config)
+        return config
+
+    def maybe_reload(self):
+        if self.path is None:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + CHECK_INTERVAL
+        if self._stat_signature() != self._signature and self._reload():
+            self._apply(self.config)
+
+    def throttle(self, transfer, n):
+        self.maybe_reload()
+        config = self.config
+        now = time.monotonic()
+        if transfer.sent + n <= config['small_bytes']:
+            # 小响应：不等待，只透支全局令牌
+            with self._cond:
+                if self._global is not None:
+                    self._global.reserve(n, now)
+                self._meter.add(n, now)
+            transfer.sent += n
+            return n
+
+        if transfer.client is None:
+            key, role = transfer.identify(bool(config['per_client'] or config['roles']))
+            transfer.client = self._join(key, role, now)
+        client = transfer.client
+        with self._cond:
+            if transfer.generation != self.generation:
+                rate = config['per_connection']
+                transfer.bucket = TokenBucket(rate, now) if rate else None
+                transfer.generation = self.generation
+            if client.generation != self.generation:
+                rate = config['roles'].get(client.role, config['per_client'])
+                client.bucket = TokenBucket(rate, now) if rate else None
+                client.generation = self.generation
+            if transfer.bucket is not None or client.bucket is not None or self._global is not None:
+                n = min(n, QUANTUM)
+            delay = 0.0
+            if transfer.bucket is not None:
+                delay = transfer.bucket.reserve(n, now)
+            if client.bucket is not None:
+                delay = max(delay, client.bucket.reserve(n, now))
+        if delay > 0:
+            time.sleep(delay)
+            THROTTLE_SECONDS.inc(delay, scope='client')
+        waited = self._acquire_global(client, n)
+        if waited > 0:
+            THROTTLE_SECONDS.inc(waited, scope='global')
+        now = time.monotonic()
+        with self._cond:
+            client.meter.add(n, now)
+            self._meter.add(n, now)
+        transfer.sent += n
+        return n
+
+    def leave(self, client):
+        with self._cond:
+            client.transfers -= 1
+            self._active -= 1
+            if client.transfers <= 0 and self._clients.get(client.key) is client:
+                del self._clients[client.key]
+
+    def stats(self):
+        """当前配置、总吞吐量和每个用户/IP的进行中下载"""
+        now = time.monotonic()
+        config = self.config
+        with self._cond:
+            clients = [{
+                'client': c.key,
+                'role': c.role,
+                'transfers': c.transfers,
+                'rate': round(c.meter.rate(now)),
+                'bytes': c.meter.total,
+                'limit': config['roles'].get(c.role, config['per_client']),
+            } for c in self._clients.values()]
+            result = {
+                'pid': os.getpid(),
+                'config': config,
+                'rate': round(self._meter.rate(now)),
+                'bytes': self._meter.total,
+                'active_transfers': self._active,
+                'waiting': len(self._queue),
+            }
+        clients.sort(key=lambda c: c['rate'], reverse=True)
+        result['clients'] = clients
+        return result
+
+    def _join(self, key, role, now):
+        with self._cond:
+            client = self._clients.get(key)
+            if client is None or client.role != role:
+                client = _Client(key, role, now)
+                client.vtime = self._vclock
+                self._clients[key] = client
+            client.transfers += 1
+            self._active += 1
+            return client
+
+    def _acquire_global(self, client, n):
+        """按公平队列取得全局令牌，返回等待的秒数"""
+        with self._cond:
+            if self._global is None:
+                return 0.0
+            # 排队时就推进用户的虚拟时间，同一用户的多个连接依次排在后面
+            start = max(client.vtime, self._vclock)
+            client.vtime = start + n
+            now = time.monotonic()
+            self._global.refill(now)
+            if not self._queue and self._global.tokens > 0:
+                self._grant(n, start)
+                return 0.0
+            entry = (start, next(self._seq), client)
+            heapq.heappush(self._queue, entry)
+            began = now
+            while True:
+                if self._global is None:
+                    # 全局限速已取消
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self._cond.notify_all()
+                    break
+                if self._queue[0] is entry:
+                    self._global.refill(time.monotonic())
+                    if self._global.tokens > 0:
+                        heapq.heappop(self._queue)
+                        self._grant(n, start)
+                        self._cond.notify_all()
+                        break
+                    self._cond.wait(-self._global.tokens / self._global.rate + 0.001)
+                else:
+                    self._cond.wait(1.0)
+            return time.monotonic() - began
+
+    def _grant(self, n, start):
+        self._global.tokens -= n
+        self._vclock = start
+
+    def _apply(self, config):
+        with self._cond:
+            self.config = config
+            self.generation += 1
+            rate = config['global']
+            if rate <= 0:
+                self._global = None
+            elif self._global is None or self._global.rate != rate:
+                self._global = TokenBucket(rate, time.monotonic())
+            self._cond.notify_all()
+
+    def _reload(self):
+        """读取配置文件；文件不存在时使用默认配置，内容不合法时保留当前配置"""
+        signature = self._stat_signature()
+        if signature is None:
+            config = {}
+        else:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                config = validate_config(config)
+            except (OSError, ValueError) as e:
+                print(f"限速配置无效，继续使用当前配置: {e}")
+                self._signature = signature
+                return False
+        self._signature = signature
+        self.config = validate_config(config)
+        return True
+
+    def _stat_signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
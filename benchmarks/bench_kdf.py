@@ -0,0 +1,64 @@
+"""不同密码哈希强度下的登录验证吞吐量（logins/s），用于选择部署参数
+
+用法: python benchmarks/bench_kdf.py [--seconds 3] [--workers 4]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import passwords
+
+# 候选强度设置
+SETTINGS = [
+    ('scrypt', {'n': 2 ** 13, 'r': 8, 'p': 1}),
+    ('scrypt', {'n': 2 ** 14, 'r': 8, 'p': 1}),
+    ('scrypt', {'n': 2 ** 15, 'r': 8, 'p': 1}),
+    ('pbkdf2_sha256', {'iterations': 100000}),
+    ('pbkdf2_sha256', {'iterations': 300000}),
+    ('pbkdf2_sha256', {'iterations': 600000}),
+]
+
+
+def bench_setting(algorithm, params, seconds, workers):
+    """用 workers 个并发线程持续验证 seconds 秒，返回 (logins/s, 单次耗时ms)"""
+    stored = passwords.hash_password('correct horse', algorithm, **params)
+
+    start = time.perf_counter()
+    passwords._verify_uncached('correct horse', stored)
+    single_ms = (time.perf_counter() - start) * 1000
+
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        count = 0
+        while time.perf_counter() < deadline:
+            passwords._verify_uncached('correct horse', stored)
+            count += 1
+        return count
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        total = sum(pool.map(lambda _: worker(), range(workers)))
+    return total / (time.perf_counter() - start), single_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=3.0, help='每种设置的测试时长')
+    parser.add_argument('--workers', type=int, default=passwords.KDF_WORKERS, help='并发验证线程数')
+    args = parser.parse_args()
+
+    print(f"并发线程数: {args.workers}")
+    for algorithm, params in SETTINGS:
+        rate, single_ms = bench_setting(algorithm, params, args.seconds, args.workers)
+        desc = ', '.join(f'{k}={v}' for k, v in params.items())
+        print(f"{algorithm:<14} {desc:<24} 单次 {single_ms:7.1f} ms   {rate:8.1f} logins/s")
+
+
+if __name__ == '__main__':
+    main()
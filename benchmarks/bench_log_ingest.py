@@ -0,0 +1,77 @@
+"""文件访问记录上报的吞吐量测试：单条上报 vs 批量上报
+
+用法: python benchmarks/bench_log_ingest.py [--events 20000] [--batch 50]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def prepare_workdir():
+    """在临时目录中运行，避免污染真实的访问记录"""
+    workdir = tempfile.mkdtemp(prefix='lan_bench_')
+    with open(os.path.join(workdir, 'users.json'), 'w', encoding='utf-8') as f:
+        json.dump({'bench': {'password': 'bench', 'role': 'admin'}}, f)
+    os.chdir(workdir)
+    return workdir
+
+
+def bench_store(store, total, batch):
+    """直接测量内存队列的入队速度"""
+    entry = {'timestamp': 0, 'username': 'bench', 'action': 'file_access', 'filename': 'a.mp4'}
+    start = time.perf_counter()
+    for _ in range(total // batch):
+        store.extend([entry] * batch)
+    elapsed = time.perf_counter() - start
+    store.flush()
+    return total / elapsed
+
+
+def bench_endpoint(client, total, batch):
+    """通过Flask测试客户端测量 /log_file_access 的吞吐量"""
+    requests = total // batch
+    if batch == 1:
+        payload = {'filename': 'a.mp4'}
+    else:
+        payload = {'events': json.dumps([{'filename': f'file{i}.mp4'} for i in range(batch)])}
+    start = time.perf_counter()
+    for _ in range(requests):
+        resp = client.post('/log_file_access', data=payload)
+        assert resp.json['accepted'] == batch
+    elapsed = time.perf_counter() - start
+    return requests * batch / elapsed, requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=20000, help='每组测试的事件总数')
+    parser.add_argument('--batch', type=int, default=50, help='批量上报时每个请求的事件数')
+    args = parser.parse_args()
+
+    workdir = prepare_workdir()
+    try:
+        import auth
+        client = auth.app.test_client()
+        client.post('/login', data={'username': 'bench', 'password': 'bench'})
+
+        print(f"内存队列 单条入队: {bench_store(auth.access_store, args.events, 1):,.0f} events/s")
+        print(f"内存队列 批量入队: {bench_store(auth.access_store, args.events, args.batch):,.0f} events/s")
+        for batch in (1, args.batch):
+            events_per_sec, requests_per_sec = bench_endpoint(client, args.events, batch)
+            print(f"/log_file_access 每请求{batch}条: {events_per_sec:,.0f} events/s "
+                  f"({requests_per_sec:,.0f} req/s)")
+        auth.access_store.close()
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
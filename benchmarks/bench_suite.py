@@ -0,0 +1,325 @@
+"""基准测试套件：合成共享目录上的索引生成 + 认证接口的吞吐量和延迟，结果写为JSON便于对比
+
+索引生成：分别在 1k/10k/100k 个文件（扩展名和大小混合）的目录上运行 generate_index，
+记录首次生成、无变化时再次生成的各阶段耗时（扫描/渲染/写入），以及首次生成的内存峰值。
+认证接口：通过 Flask 测试客户端逐个请求，再启动 serve.py 用本地HTTP压测，
+报告 /login、/check_auth、/access_logs、/log_file_access 的 req/s 和 p50/p99。
+
+用法:
+    python benchmarks/bench_suite.py --output before.json
+    python benchmarks/bench_suite.py --output after.json --compare before.json
+    python benchmarks/bench_suite.py --sizes 1000,10000 --skip-http
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from urllib.parse import urlencode
+
+try:
+    import resource  # 仅在类Unix系统上可用，用于读取进程的最大常驻内存
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from loadtest import login, percentile, run_load
+
+# 登录接口的限流会让压测只剩429，测试时放宽到不会触发
+BENCH_ENV = {
+    'LOGIN_IP_RATE': '1000000',
+    'LOGIN_IP_BURST': '1000000',
+    'LOGIN_USER_RATE': '1000000',
+    'LOGIN_USER_BURST': '1000000',
+}
+BENCH_USER = 'bench'
+BENCH_PASSWORD = 'bench-password'
+# 合成目录中文件大小的分布: (权重, 最小, 最大)；文件用 truncate 创建（稀疏文件），创建很快
+SIZE_CLASSES = [(70, 0, 16 * 1024), (27, 16 * 1024, 1024 * 1024), (3, 1024 * 1024, 16 * 1024 * 1024)]
+WORDS = ['report', 'photo', 'backup', 'lecture', 'notes', 'episode', 'dataset', 'draft', 'scan', 'build']
+# 数值越小越好 / 越大越好的结果字段，用于 --compare
+LOWER_IS_BETTER = ('_ms', '_seconds', '_mb')
+HIGHER_IS_BETTER = ('requests_per_sec',)
+
+
+def make_share(directory, count, seed=0):
+    """创建含 count 个文件的合成共享目录，扩展名覆盖所有文件分类"""
+    from generate_index import (VIDEO_EXTENSIONS, CODE_EXTENSIONS, IMAGE_EXTENSIONS,
+                                DOCUMENT_EXTENSIONS, ARCHIVE_EXTENSIONS)
+    rng = random.Random(seed)
+    extensions = sorted(set(VIDEO_EXTENSIONS + CODE_EXTENSIONS + IMAGE_EXTENSIONS +
+                            DOCUMENT_EXTENSIONS + ARCHIVE_EXTENSIONS)) + ['.bin', '.dat', '']
+    weights = [w for w, _, _ in SIZE_CLASSES]
+    os.makedirs(directory, exist_ok=True)
+    for i in range(count):
+        _, low, high = rng.choices(SIZE_CLASSES, weights)[0]
+        name = f'{rng.choice(WORDS)}_{i:06d}{rng.choice(extensions)}'
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.truncate(rng.randint(low, high))
+
+
+def reset_outputs(directory):
+    """删除生成的页面和缓存，下一次运行相当于首次生成"""
+    from generate_index import MANIFEST_FILE
+    from hashing import HASH_CACHE_FILE, SUMS_FILES, JSON_MANIFEST_FILE
+    names = ['index.html', 'index.html.gz', 'index.html.br', MANIFEST_FILE, HASH_CACHE_FILE,
+             JSON_MANIFEST_FILE] + list(SUMS_FILES.values())
+    for name in names:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(directory, name))
+
+
+def run_index(directory, hash_files, trace=False):
+    """运行一次 generate_index，返回总耗时、各阶段耗时（毫秒），trace 为真时另附内存峰值"""
+    from generate_index import generate_index
+    from metrics import INDEX_PHASE_SECONDS
+
+    before = INDEX_PHASE_SECONDS.snapshot()
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate_index(directory, hash_files=hash_files)
+    elapsed = time.perf_counter() - start
+    result = {'total_ms': round(elapsed * 1000, 1)}
+    if trace:
+        result['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        tracemalloc.stop()
+    for phase, stats in INDEX_PHASE_SECONDS.snapshot().items():
+        seconds = stats['sum'] - before.get(phase, {}).get('sum', 0.0)
+        result[f'{phase}_ms'] = round(seconds * 1000, 1)
+    return result
+
+
+def best_of(runs):
+    return min(runs, key=lambda result: result['total_ms'])
+
+
+def bench_index(workdir, sizes, hash_files, repeat):
+    """每种规模取 repeat 次中总耗时最短的一次，减少偶然波动对对比的影响"""
+    results = {}
+    for count in sizes:
+        directory = os.path.join(workdir, f'share_{count}')
+        start = time.perf_counter()
+        make_share(directory, count)
+        setup = time.perf_counter() - start
+        # 内存峰值单独跑一次：tracemalloc 会明显拖慢运行，不计入耗时
+        traced = run_index(directory, hash_files, trace=True)
+        cold_runs = []
+        for _ in range(repeat):
+            reset_outputs(directory)
+            cold_runs.append(run_index(directory, hash_files))
+        cold = best_of(cold_runs)
+        warm = best_of([run_index(directory, hash_files) for _ in range(repeat)])
+        results[str(count)] = {
+            'files': count,
+            'setup_time': round(setup, 2),
+            'cold': cold,
+            'warm': warm,
+            'peak_mb': traced['peak_mb'],
+        }
+        print(f"[index] {count} 个文件: 首次 {cold['total_ms']} ms，再次 {warm['total_ms']} ms，"
+              f"内存峰值 {traced['peak_mb']} MB", file=sys.stderr)
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def prepare_workdir():
+    """临时工作目录：测试用户和访问记录都放在这里，不影响真实数据"""
+    from passwords import hash_password
+    workdir = tempfile.mkdtemp(prefix='lan_bench_')
+    with open(os.path.join(workdir, 'users.json'), 'w', encoding='utf-8') as f:
+        json.dump({BENCH_USER: {'password': hash_password(BENCH_PASSWORD), 'role': 'admin'}}, f)
+    return workdir
+
+
+def endpoint_requests():
+    """(名称, 方法, 路径, 表单数据)；表单数据为None时发送GET"""
+    login_form = {'username': BENCH_USER, 'password': BENCH_PASSWORD}
+    batch = json.dumps([{'filename': f'file{i}.mp4'} for i in range(20)])
+    return [
+        ('login', 'POST', '/login', login_form),
+        ('check_auth', 'GET', '/check_auth', None),
+        ('access_logs', 'GET', '/access_logs', None),
+        ('log_file_access', 'POST', '/log_file_access', {'filename': 'a.mp4'}),
+        ('log_file_access_batch20', 'POST', '/log_file_access', {'events': batch}),
+    ]
+
+
+def bench_test_client(seconds):
+    """通过 Flask 测试客户端顺序请求（不含网络开销，反映接口本身的处理耗时）"""
+    import auth
+    client = auth.app.test_client()
+    client.post('/login', data={'username': BENCH_USER, 'password': BENCH_PASSWORD})
+    results = {}
+    for name, method, path, form in endpoint_requests():
+        # 登录会更换会话ID，用单独的客户端，避免影响其他接口
+        target = auth.app.test_client() if name == 'login' else client
+        latencies = []
+        start = time.perf_counter()
+        deadline = start + seconds
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            if method == 'GET':
+                resp = target.get(path)
+            else:
+                resp = target.post(path, data=form)
+            latencies.append(time.perf_counter() - t0)
+            assert resp.status_code == 200, (name, resp.status_code)
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        results[name] = {
+            'requests': len(latencies),
+            'requests_per_sec': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        }
+        print(f"[test_client] {name}: {results[name]['requests_per_sec']} req/s", file=sys.stderr)
+    auth.access_store.close()
+    return results
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"serve.py 未能在 {timeout} 秒内启动")
+
+
+def bench_http(workdir, seconds, concurrency, workers):
+    """启动 serve.py，用保持连接的并发客户端压测各接口"""
+    port = free_port()
+    env = dict(os.environ, **BENCH_ENV)
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'serve.py'), workdir, '--host', '127.0.0.1',
+         '--port', str(port), '--workers', str(workers)],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{port}'
+    results = {}
+    try:
+        wait_for_port(port)
+        cookie = login(base, BENCH_USER, BENCH_PASSWORD)
+        for name, method, path, form in endpoint_requests():
+            headers = {'Cookie': cookie}
+            body = None
+            if form is not None:
+                body = urlencode(form)
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            results[name] = run_load([base + '/api' + path], concurrency, seconds, method, body, headers)
+            print(f"[http] {name}: {results[name]['requests_per_sec']} req/s", file=sys.stderr)
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+    return results
+
+
+def flatten(data, prefix=''):
+    items = {}
+    for key, value in data.items():
+        path = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            items.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            items[path] = value
+    return items
+
+
+def compare(previous, current, threshold):
+    """打印与上次结果相比变差超过 threshold（比例）的指标，返回变差的数量"""
+    old = flatten(previous)
+    regressions = 0
+    for path, value in sorted(flatten(current).items()):
+        name = path.rsplit('.', 1)[-1]
+        before = old.get(path)
+        if not before:
+            continue
+        change = (value - before) / before
+        if name.endswith(LOWER_IS_BETTER):
+            worse = change > threshold
+        elif name.endswith(HIGHER_IS_BETTER):
+            worse = change < -threshold
+        else:
+            continue
+        if worse:
+            regressions += 1
+        mark = '变差' if worse else '    '
+        print(f"{mark} {path}: {before} -> {value} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000', help='合成目录的文件数（逗号分隔）')
+    parser.add_argument('--hash', action='store_true', help='索引生成时计算SHA-256（默认不计算）')
+    parser.add_argument('--repeat', type=int, default=3, help='索引生成每项重复次数（取最快的一次）')
+    parser.add_argument('--seconds', type=float, default=5.0, help='每个接口的测试时长')
+    parser.add_argument('--concurrency', type=int, default=16, help='HTTP压测的并发连接数')
+    parser.add_argument('--server-workers', type=int, default=1, help='serve.py 的工作进程数')
+    parser.add_argument('--skip-index', action='store_true')
+    parser.add_argument('--skip-http', action='store_true', help='跳过测试客户端和HTTP压测')
+    parser.add_argument('--output', default=None, help='结果JSON的保存路径（默认只打印）')
+    parser.add_argument('--compare', default=None, help='与之前保存的结果JSON对比')
+    parser.add_argument('--threshold', type=float, default=0.1, help='对比时视为变差的比例')
+    args = parser.parse_args()
+
+    results = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': {'sizes': args.sizes, 'hash': args.hash, 'repeat': args.repeat, 'seconds': args.seconds,
+                   'concurrency': args.concurrency, 'server_workers': args.server_workers},
+    }
+    for key, value in BENCH_ENV.items():
+        os.environ[key] = value
+    workdir = prepare_workdir()
+    os.chdir(workdir)
+    try:
+        if not args.skip_index:
+            sizes = [int(size) for size in args.sizes.split(',') if size]
+            results['index'] = bench_index(workdir, sizes, args.hash, args.repeat)
+        if not args.skip_http:
+            results['test_client'] = bench_test_client(args.seconds)
+            results['http'] = bench_http(workdir, args.seconds, args.concurrency, args.server_workers)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+    if resource is not None:
+        # ru_maxrss 在 Linux 上以KB为单位
+        results['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        if compare(previous, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
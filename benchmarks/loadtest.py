@@ -0,0 +1,127 @@
+"""对运行中的服务做HTTP压测，报告吞吐量和延迟分位数
+
+用法:
+    python serve.py . --port 8000 --workers 4 &
+    python benchmarks/loadtest.py http://127.0.0.1:8000/api/check_auth --concurrency 32 --seconds 10 \
+        --login admin:password123 --server-workers 4
+"""
+import argparse
+import http.client
+import json
+import os
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def login(url, username, password):
+    """登录并返回会话Cookie"""
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+    body = urlencode({'username': username, 'password': password})
+    conn.request('POST', '/api/login', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+    resp = conn.getresponse()
+    resp.read()
+    cookie = resp.getheader('Set-Cookie', '')
+    conn.close()
+    return cookie.split(';', 1)[0]
+
+
+def run_load(urls, concurrency, seconds, method='GET', body=None, headers=None):
+    """用 concurrency 个保持连接的客户端循环请求 urls，返回结果字典"""
+    headers = dict(headers or {})
+    deadline = time.perf_counter() + seconds
+    latencies = []
+    errors = [0]
+    transferred = [0]
+    lock = threading.Lock()
+
+    def worker(offset):
+        local = []
+        local_errors = 0
+        local_bytes = 0
+        conns = {}
+        i = offset
+        while time.perf_counter() < deadline:
+            parts = urlsplit(urls[i % len(urls)])
+            i += 1
+            key = (parts.hostname, parts.port)
+            path = parts.path + ('?' + parts.query if parts.query else '')
+            start = time.perf_counter()
+            try:
+                conn = conns.get(key)
+                if conn is None:
+                    conn = conns[key] = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+                conn.request(method, path, body, headers)
+                resp = conn.getresponse()
+                data = resp.read()
+                if resp.status >= 500:
+                    local_errors += 1
+                local_bytes += len(data)
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conns.pop(key, None)
+                continue
+            local.append(time.perf_counter() - start)
+        for conn in conns.values():
+            conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+            transferred[0] += local_bytes
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'seconds': round(elapsed, 3),
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'mbytes_per_sec': round(transferred[0] / elapsed / 1024 / 1024, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('urls', nargs='+', help='要请求的URL（多个时轮流请求）')
+    parser.add_argument('--concurrency', type=int, default=16, help='并发连接数')
+    parser.add_argument('--seconds', type=float, default=10.0, help='压测时长')
+    parser.add_argument('--method', default='GET')
+    parser.add_argument('--data', default=None, help='请求体（表单编码）')
+    parser.add_argument('--login', default=None, help='先以 用户名:密码 登录，携带会话Cookie')
+    parser.add_argument('--server-workers', type=int, default=None,
+                        help='服务端工作进程数，用于计算每核吞吐量')
+    args = parser.parse_args()
+
+    headers = {}
+    if args.login:
+        username, _, password = args.login.partition(':')
+        headers['Cookie'] = login(args.urls[0], username, password)
+    if args.data is not None:
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+    result = run_load(args.urls, args.concurrency, args.seconds, args.method, args.data, headers)
+    if args.server_workers:
+        result['requests_per_sec_per_worker'] = round(result['requests_per_sec'] / args.server_workers, 1)
+    result['client_cpus'] = os.cpu_count()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
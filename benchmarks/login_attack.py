@@ -0,0 +1,114 @@
+"""模拟密码爆破攻击，同时测量正常用户的登录是否仍然成功
+
+攻击者和正常用户使用不同的源地址（Linux 上整个 127.0.0.0/8 都指向本机），
+攻击线程分散在多个源地址上（每个地址都不超过单IP限流），正常用户的登录必须全部成功，否则退出码为1。
+
+用法:
+    python serve.py . --port 8000 &
+    python benchmarks/login_attack.py http://127.0.0.1:8000 --user admin:password123 --seconds 20
+"""
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from loadtest import percentile
+
+
+def post_login(conn, username, password):
+    body = urlencode({'username': username, 'password': password})
+    conn.request('POST', '/api/login', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+    resp = conn.getresponse()
+    data = resp.read()
+    return resp.status, data
+
+
+def attacker(host, port, source, target_user, deadline, counts, lock):
+    conn = http.client.HTTPConnection(host, port, timeout=30, source_address=(source, 0))
+    attempt = 0
+    local = {}
+    while time.perf_counter() < deadline:
+        attempt += 1
+        try:
+            status, _ = post_login(conn, target_user, f'guess-{attempt}')
+        except (OSError, http.client.HTTPException):
+            status = 'error'
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30, source_address=(source, 0))
+        local[status] = local.get(status, 0) + 1
+    conn.close()
+    with lock:
+        for status, n in local.items():
+            counts[status] = counts.get(status, 0) + n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('url', help='服务地址，如 http://127.0.0.1:8000')
+    parser.add_argument('--user', required=True, help='正常用户的 用户名:密码')
+    parser.add_argument('--target', default=None, help='攻击的用户名（默认与正常用户相同）')
+    parser.add_argument('--attackers', type=int, default=8, help='攻击线程数')
+    parser.add_argument('--attacker-sources', type=int, default=8,
+                        help='攻击者使用的源地址数（从 127.0.0.2 开始依次递增）')
+    parser.add_argument('--legit-interval', type=float, default=0.5, help='正常用户每隔多少秒登录一次')
+    parser.add_argument('--seconds', type=float, default=20.0)
+    args = parser.parse_args()
+
+    parts = urlsplit(args.url)
+    host, port = parts.hostname, parts.port or 80
+    username, _, password = args.user.partition(':')
+    target = args.target or username
+
+    deadline = time.perf_counter() + args.seconds
+    counts = {}
+    lock = threading.Lock()
+    sources = [f'127.0.0.{2 + i}' for i in range(args.attacker_sources)]
+    threads = [threading.Thread(target=attacker,
+                                args=(host, port, sources[i % len(sources)], target, deadline, counts, lock))
+               for i in range(args.attackers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+
+    # 正常用户：从另一个地址定期用正确密码登录
+    latencies = []
+    legit = {'ok': 0, 'failed': 0}
+    while time.perf_counter() < deadline:
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        t0 = time.perf_counter()
+        try:
+            status, data = post_login(conn, username, password)
+            ok = status == 200 and json.loads(data).get('success')
+        except (OSError, http.client.HTTPException, ValueError):
+            ok = False
+        latencies.append(time.perf_counter() - t0)
+        legit['ok' if ok else 'failed'] += 1
+        conn.close()
+        time.sleep(args.legit_interval)
+
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    attack_total = sum(counts.values())
+    print(json.dumps({
+        'seconds': round(elapsed, 2),
+        'attack_requests': attack_total,
+        'attack_requests_per_sec': round(attack_total / elapsed, 1),
+        'attacker_sources': len(sources),
+        'attack_status_counts': {str(k): v for k, v in sorted(counts.items(), key=str)},
+        'legit_logins_ok': legit['ok'],
+        'legit_logins_failed': legit['failed'],
+        'legit_p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'legit_p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }, indent=2, ensure_ascii=False))
+    if legit['failed'] or not legit['ok']:
+        print("正常用户的登录被拒绝")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import gzip
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # brotli 是可选依赖，没有时只提供gzip
+    brotli = None
+
+# 压缩有意义的内容类型（图片、视频、压缩包本身已经压缩过）
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'application/xhtml+xml',
+    'image/svg+xml',
+)
+# 小于此大小的文件压缩后节省不了几个字节，不压缩
+MIN_COMPRESS_SIZE = 1024
+# 大于此大小的文件不做即时压缩（避免一个请求占用大量CPU和缓存）
+MAX_COMPRESS_SIZE = 8 * 1024 * 1024
+# 即时压缩结果缓存的总字节数上限
+CACHE_MAX_BYTES = int(os.environ.get('COMPRESS_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# 预压缩文件的扩展名，按优先顺序排列
+ENCODING_SUFFIXES = OrderedDict([('br', '.br'), ('gzip', '.gz')])
+
+
+def available_encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def is_compressible(content_type):
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(data, encoding, level=None):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if level is None else level)
+    # mtime=0 使相同内容的压缩结果完全相同
+    return gzip.compress(data, compresslevel=9 if level is None else level, mtime=0)
+
+
+def negotiate_encoding(accept_encoding, encodings):
+    """根据 Accept-Encoding 从 encodings（按服务端偏好排序）中选择编码，都不接受时返回None"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    best = None
+    best_q = 0.0
+    for encoding in encodings:
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if encoding == 'gzip' and 'x-gzip' in accepted:
+            q = max(q, accepted['x-gzip'])
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def write_precompressed(path):
+    """在 path 旁边写入 .gz（以及可用时的 .br）压缩版本，供服务端直接发送"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    st = os.stat(path)
+    for encoding in available_encodings():
+        target = path + ENCODING_SUFFIXES[encoding]
+        tmp_path = os.path.join(os.path.dirname(target), '.' + os.path.basename(target) + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(compress(data, encoding))
+        # 与原文件保持相同的修改时间，服务端据此判断压缩版本是否过期
+        os.utime(tmp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(tmp_path, target)
+    if brotli is None:
+        # 之前安装过brotli时留下的 .br 已经过期
+        try:
+            os.remove(path + ENCODING_SUFFIXES['br'])
+        except OSError:
+            pass
+
+
+def find_precompressed(path, st, encoding):
+    """返回与原文件修改时间一致的预压缩文件路径，不存在或已过期时返回None"""
+    target = path + ENCODING_SUFFIXES[encoding]
+    try:
+        if os.stat(target).st_mtime_ns == st.st_mtime_ns:
+            return target
+    except OSError:
+        pass
+    return None
+
+
+class CompressionCache:
+    """即时压缩结果的LRU缓存，按 (路径, 修改时间, 大小, 编码) 作为键，总大小有上限"""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, st, encoding, fd, raw=None):
+        """返回文件压缩后的内容；未命中时压缩 raw（热点缓存中的原文件内容），没有时从已打开的 fd 读取"""
+        key = (path, st.st_mtime_ns, st.st_size, encoding)
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+        # 压缩在锁外进行，不阻塞其他请求；同一文件并发未命中时可能重复压缩一次
+        if raw is None:
+            raw = read_all(fd, st.st_size)
+        # 即时压缩使用较低的压缩级别，预压缩的索引页才用最高级别
+        data = compress(raw, encoding, level=5 if encoding == 'br' else 6)
+        if len(data) > self.max_bytes:
+            return data
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = data
+                self._bytes += len(data)
+                while self._bytes > self.max_bytes:
+                    _, old = self._items.popitem(last=False)
+                    self._bytes -= len(old)
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._items), 'bytes': self._bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+def read_all(fd, size):
+    """从已打开文件的开头读取 size 字节（文件变短时返回的内容更少）"""
+    if hasattr(os, 'pread'):
+        return os.pread(fd, size, 0)
+    os.lseek(fd, 0, os.SEEK_SET)
+    chunks = []
+    while size > 0:
+        chunk = os.read(fd, min(size, 1024 * 1024))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
@@ -0,0 +1,134 @@
+import os
+import stat
+import threading
+from collections import OrderedDict
+
+from compression import read_all
+from metrics import FILE_CACHE_BYTES, FILE_CACHE_ENTRIES, FILE_CACHE_HIT_RATIO, FILE_CACHE_REQUESTS
+
+# 热点文件缓存的总字节数上限（0 表示不缓存）
+CACHE_MAX_BYTES = int(os.environ.get('FILE_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# 不超过此大小的文件才进入缓存，更大的文件始终用 sendfile
+FILE_MAX_SIZE = int(os.environ.get('FILE_CACHE_FILE_MAX', str(64 * 1024 * 1024)))
+# 文件被请求多少次后才进入缓存，只访问一次的文件不会挤掉热点文件
+ADMIT_AFTER = 2
+# 访问次数统计最多跟踪的文件数；每累计这么多次访问（或跟踪的文件超出上限）时所有计数减半，旧的热度逐渐衰减
+MAX_TRACKED = 10000
+
+
+class FileCache:
+    """热点文件内容缓存：文件内容复制为 bytes 保存在内存中
+
+    命中时只需要一次 stat（修改时间、大小或inode变化即失效），不再 open/read/close。
+    不使用 mmap：共享目录中的文件常被 cp 原地改写，映射的文件被截断时读取会出错甚至触发 SIGBUS，
+    复制的内容与文件无关，正在发送的响应始终完整。
+    淘汰按最近使用顺序选出候选，再比较访问频率：新文件只有比要淘汰的文件都更常被访问时才放入，
+    少数几个被反复下载的文件不会被一次性的大量访问冲掉。
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, file_max=FILE_MAX_SIZE):
+        self.max_bytes = max_bytes
+        self.file_max = min(file_max, max_bytes)
+        self._items = OrderedDict()  # 路径 -> (签名, 内容)，最近使用的在末尾
+        self._frequency = {}
+        self._touches = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, st):
+        """返回缓存的文件内容，未命中或已失效时返回None"""
+        if not self.cacheable(st):
+            return None
+        signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        with self._lock:
+            self._touch(path)
+            item = self._items.get(path)
+            if item is not None and item[0] != signature:
+                self._remove(path)
+                item = None
+            if item is None:
+                self.misses += 1
+            else:
+                self._items.move_to_end(path)
+                self.hits += 1
+            hits, total = self.hits, self.hits + self.misses
+        FILE_CACHE_REQUESTS.inc(result='miss' if item is None else 'hit')
+        FILE_CACHE_HIT_RATIO.set(round(hits / total, 4))
+        return item[1] if item is not None else None
+
+    def admit(self, path, st, fd):
+        """未命中后调用：文件足够热时从已打开的 fd 读入，返回内容；不缓存时返回None"""
+        if not self.cacheable(st):
+            return None
+        with self._lock:
+            if self._frequency.get(path, 0) < ADMIT_AFTER or path in self._items:
+                return None
+            if not self._make_room(path, st.st_size):
+                return None
+        # 读取在锁外进行；同一文件并发未命中时可能重复读取一次
+        try:
+            content = read_all(fd, st.st_size)
+        except OSError:
+            return None
+        if len(content) != st.st_size:
+            return None  # 读取期间文件被改写
+        signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        with self._lock:
+            if path not in self._items and self._make_room(path, st.st_size):
+                self._items[path] = (signature, content)
+                self._bytes += st.st_size
+                self._publish()
+        return content
+
+    def cacheable(self, st):
+        return stat.S_ISREG(st.st_mode) and 0 < st.st_size <= self.file_max
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._items),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def _touch(self, path):
+        self._frequency[path] = self._frequency.get(path, 0) + 1
+        self._touches += 1
+        if self._touches >= MAX_TRACKED or len(self._frequency) > MAX_TRACKED:
+            self._touches = 0
+            self._frequency = {key: count // 2 for key, count in self._frequency.items() if count > 1}
+
+    def _make_room(self, path, size):
+        """需要时淘汰最久未使用的文件腾出 size 字节；候选中有比新文件更热的则放弃放入"""
+        free = self.max_bytes - self._bytes
+        if free >= size:
+            return True
+        frequency = self._frequency.get(path, 0)
+        victims = []
+        for key, (_, content) in self._items.items():
+            if self._frequency.get(key, 0) > frequency:
+                return False
+            victims.append(key)
+            free += len(content)
+            if free >= size:
+                break
+        if free < size:
+            return False
+        for key in victims:
+            self._remove(key)
+        return True
+
+    def _remove(self, path):
+        _, content = self._items.pop(path)
+        self._bytes -= len(content)
+        self._publish()
+
+    def _publish(self):
+        FILE_CACHE_BYTES.set(self._bytes)
+        FILE_CACHE_ENTRIES.set(len(self._items))
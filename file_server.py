@@ -0,0 +1,529 @@
+import argparse
+import email.utils
+import mimetypes
+import os
+import posixpath
+import socket
+import stat
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import quote, unquote, urlsplit
+
+from bandwidth import BANDWIDTH_FILE, BandwidthShaper
+from file_cache import FileCache
+from compression import (CompressionCache, MAX_COMPRESS_SIZE, MIN_COMPRESS_SIZE, available_encodings,
+                         find_precompressed, is_compressible, negotiate_encoding)
+from generate_index import is_hidden, is_within
+from metrics import BYTES_SENT, IN_FLIGHT, REQUESTS, REQUEST_SECONDS
+from signed_urls import UrlSigner, load_signing_key
+from static_assets import STATIC_DIR
+
+# 虽然不出现在文件列表中，但需要对外提供的生成文件
+SERVED_GENERATED_FILES = ['index.html', 'SHA256SUMS', 'B2SUMS', 'SHA256SUMS.json', STATIC_DIR]
+# 静态资源的文件名带内容指纹，内容变化时URL随之变化，可以永久缓存
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# 单个请求最多接受的Range段数，超出时忽略Range返回完整文件（RFC 9110 允许）
+MAX_RANGES = 16
+# 每次 sendfile 调用发送的最大字节数
+SENDFILE_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(header, size):
+    """解析 Range 请求头，返回 [(起始, 结束)]（闭区间），不需要处理时返回None"""
+    if not header or not header.startswith('bytes='):
+        return None
+    ranges = []
+    for spec in header[6:].split(','):
+        spec = spec.strip()
+        if not spec:
+            continue
+        start, sep, end = spec.partition('-')
+        if not sep:
+            return None
+        try:
+            if start:
+                first = int(start)
+                last = int(end) if end else size - 1
+                if end and first > last:
+                    return None  # 语法错误的Range按无Range处理
+            else:
+                # 后缀形式: bytes=-500 表示最后500字节
+                length = int(end)
+                if length == 0:
+                    continue
+                first = max(0, size - length)
+                last = size - 1
+        except ValueError:
+            return None
+        if first >= size:
+            continue
+        ranges.append((first, min(last, size - 1)))
+    if not ranges:
+        raise RangeNotSatisfiable()
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def make_etag(st):
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+class FileRequestHandler(BaseHTTPRequestHandler):
+    """共享目录的静态文件处理：零拷贝发送、Range/多段Range、ETag/Last-Modified 缓存验证"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'LANFileServer/1.0'
+    # 保持连接的空闲超时
+    timeout = 30
+    # 响应头和响应体分开写出，关闭Nagle算法以免小响应被延迟确认拖慢约40ms
+    disable_nagle_algorithm = True
+
+    def parse_request(self):
+        # 已读到请求行，说明这个连接正在处理请求（用于优雅退出时区分空闲连接）
+        self.server.connection_busy(self.connection, True)
+        return super().parse_request()
+
+    def handle_one_request(self):
+        # 签名链接校验通过时为链接中的用户名
+        self.signed_user = None
+        # 每个响应的发送都经过限速（小响应直接发送）
+        self.transfer = self.server.bandwidth.transfer(self.client_identity)
+        try:
+            super().handle_one_request()
+        finally:
+            self.transfer.close()
+            self.server.connection_busy(self.connection, False)
+            if self.server.closing:
+                self.close_connection = True
+
+    def do_GET(self):
+        self.handle_file_request(send_body=True)
+
+    def do_HEAD(self):
+        self.handle_file_request(send_body=False)
+
+    def client_identity(self, full=False):
+        """限速按谁计算：返回 (用户或IP, 角色)；签名链接中已校验的用户名优先，否则按IP"""
+        return self.signed_user or self.client_address[0], None
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def resolve_path(self, url_path):
+        """把URL路径转换为共享目录中的文件路径，不允许访问的路径返回None"""
+        parts = [p for p in posixpath.normpath(unquote(url_path)).split('/') if p and p != '.']
+        for part in parts:
+            if part == '..' or '\\' in part or '\0' in part:
+                return None
+            if is_hidden(part) and part not in SERVED_GENERATED_FILES:
+                return None
+        path = os.path.join(self.server.root, *parts)
+        # 防止符号链接指向共享目录之外
+        if not is_within(path, self.server.real_root):
+            return None
+        return path
+
+    def send_response(self, code, message=None):
+        self.status_code = int(code)
+        super().send_response(code, message)
+
+    def handle_file_request(self, send_body):
+        """处理静态文件请求，并记录请求数、耗时和每个文件的发送字节数"""
+        url_path = urlsplit(self.path).path
+        self.status_code = 0
+        self.bytes_sent = 0
+        IN_FLIGHT.inc(route='file')
+        start = time.perf_counter()
+        try:
+            self.serve_path(url_path, send_body)
+        finally:
+            IN_FLIGHT.dec(route='file')
+            REQUEST_SECONDS.observe(time.perf_counter() - start, route='file')
+            REQUESTS.inc(route='file', method=self.command, status=str(self.status_code))
+            if self.bytes_sent:
+                BYTES_SENT.inc(self.bytes_sent, file=unquote(url_path))
+
+    def serve_path(self, url_path, send_body):
+        path = self.resolve_path(url_path)
+        if path is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        if stat.S_ISDIR(st.st_mode):
+            if not url_path.endswith('/'):
+                # 目录需要以/结尾，页面中的相对链接才能正确解析
+                self.send_response(HTTPStatus.MOVED_PERMANENTLY)
+                self.send_header('Location', quote(url_path) + '/')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            path = os.path.join(path, 'index.html')
+            try:
+                st = os.stat(path)
+            except OSError:
+                self.send_error(HTTPStatus.NOT_FOUND)
+                return
+        elif self.server.url_signer is not None and self.requires_signature(path):
+            # 共享文件只能通过认证服务签发的链接下载（只校验HMAC，不查会话）
+            query = urlsplit(self.path).query
+            signed_path = posixpath.normpath(unquote(url_path))
+            self.signed_user = self.server.url_signer.verify(signed_path, query, self.client_address[0])
+            if self.signed_user is None:
+                self.unsigned_request(url_path)
+                return
+        # 热点文件直接从内存发送，不打开文件
+        content = self.server.file_cache.get(path, st)
+        if content is not None:
+            self.send_file(None, path, st, send_body, content)
+            return
+        try:
+            fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        try:
+            st = os.fstat(fd)
+            content = self.server.file_cache.admit(path, st, fd)
+            self.send_file(fd, path, st, send_body, content)
+        finally:
+            os.close(fd)
+
+    def requires_signature(self, path):
+        """索引页、校验文件和静态资源公开访问，其余共享文件需要签名"""
+        rel_path = os.path.relpath(path, self.server.root)
+        return (os.path.basename(path) not in SERVED_GENERATED_FILES and
+                rel_path.split(os.sep, 1)[0] != STATIC_DIR)
+
+    def unsigned_request(self, url_path):
+        """没有有效签名的下载请求；独立的文件服务无法签发链接，直接拒绝"""
+        self.send_error(HTTPStatus.FORBIDDEN)
+
+    def not_modified(self, etag, st):
+        """根据 If-None-Match / If-Modified-Since 判断是否可以返回304"""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = [t.strip() for t in if_none_match.split(',')]
+            return '*' in tags or etag in tags or ('W/' + etag) in tags
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+            return int(st.st_mtime) <= since
+        return False
+
+    def range_applies(self, etag, st):
+        """If-Range 不匹配时应返回完整文件"""
+        if_range = self.headers.get('If-Range')
+        if not if_range:
+            return True
+        if if_range.startswith('"') or if_range.startswith('W/'):
+            return if_range == etag
+        try:
+            return int(email.utils.parsedate_to_datetime(if_range).timestamp()) == int(st.st_mtime)
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return False
+
+    def content_type(self, path):
+        ctype, _ = mimetypes.guess_type(path)
+        if ctype is None:
+            return 'application/octet-stream'
+        if ctype.startswith('text/') or ctype in ('application/javascript', 'application/json'):
+            ctype += '; charset=utf-8'
+        return ctype
+
+    def send_common_headers(self, path, st, etag, vary=False):
+        self.send_header('ETag', etag)
+        if vary:
+            self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Last-Modified', email.utils.formatdate(st.st_mtime, usegmt=True))
+        self.send_header('Accept-Ranges', 'bytes')
+        if os.path.dirname(path) == os.path.join(self.server.root, STATIC_DIR):
+            self.send_header('Cache-Control', IMMUTABLE_CACHE_CONTROL)
+        elif os.path.basename(path) in SERVED_GENERATED_FILES:
+            self.send_header('Cache-Control', 'no-cache')  # 索引页和校验文件每次都要验证
+        else:
+            # 需要签名的文件不允许共享缓存保存
+            self.send_header('Cache-Control', 'private, max-age=60')
+
+    def select_encoding(self, path, st):
+        """选择响应的内容编码，返回 (编码, 预压缩文件路径)；不压缩时返回 (None, None)
+
+        有与原文件同步的 .br/.gz 预压缩文件时直接发送，否则在大小合适时即时压缩（结果进入LRU缓存）。
+        带 Range 的请求始终返回原始内容，便于断点续传。
+        """
+        if 'Range' in self.headers:
+            return None, None
+        accept = self.headers.get('Accept-Encoding')
+        precompressed = [e for e in available_encodings() if find_precompressed(path, st, e)]
+        encoding = negotiate_encoding(accept, precompressed)
+        if encoding:
+            return encoding, find_precompressed(path, st, encoding)
+        if MIN_COMPRESS_SIZE <= st.st_size <= MAX_COMPRESS_SIZE:
+            return negotiate_encoding(accept, available_encodings()), None
+        return None, None
+
+    def send_file(self, fd, path, st, send_body, content=None):
+        """发送文件；content 是热点缓存中的文件内容，有时 fd 可以为None"""
+        size = st.st_size
+        etag = make_etag(st)
+        ctype = self.content_type(path)
+        vary = is_compressible(ctype)
+
+        if vary:
+            encoding, encoded_path = self.select_encoding(path, st)
+            if encoding:
+                self.send_encoded(fd, path, st, ctype, encoding, encoded_path, send_body, content)
+                return
+
+        if self.not_modified(etag, st):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_common_headers(path, st, etag, vary)
+            self.end_headers()
+            return
+
+        ranges = None
+        if self.range_applies(etag, st):
+            try:
+                ranges = parse_range_header(self.headers.get('Range'), size)
+            except RangeNotSatisfiable:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+        if ranges is None:
+            self.send_response(HTTPStatus.OK)
+            self.send_common_headers(path, st, etag, vary)
+            self.send_header('Content-Type', ctype)
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+            if send_body:
+                self.copy_range(fd, 0, size, content)
+            return
+
+        if len(ranges) == 1:
+            first, last = ranges[0]
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_common_headers(path, st, etag)
+            self.send_header('Content-Type', ctype)
+            self.send_header('Content-Range', f'bytes {first}-{last}/{size}')
+            self.send_header('Content-Length', str(last - first + 1))
+            self.end_headers()
+            if send_body:
+                self.copy_range(fd, first, last - first + 1, content)
+            return
+
+        # 多段Range: multipart/byteranges
+        boundary = uuid.uuid4().hex
+        parts = []
+        length = 0
+        for first, last in ranges:
+            part_header = (f'\r\n--{boundary}\r\n'
+                           f'Content-Type: {ctype}\r\n'
+                           f'Content-Range: bytes {first}-{last}/{size}\r\n\r\n').encode('latin-1')
+            parts.append((part_header, first, last - first + 1))
+            length += len(part_header) + last - first + 1
+        closing = f'\r\n--{boundary}--\r\n'.encode('latin-1')
+        length += len(closing)
+
+        self.send_response(HTTPStatus.PARTIAL_CONTENT)
+        self.send_common_headers(path, st, etag)
+        self.send_header('Content-Type', f'multipart/byteranges; boundary={boundary}')
+        self.send_header('Content-Length', str(length))
+        self.end_headers()
+        if send_body:
+            for part_header, offset, count in parts:
+                self.write_body(part_header)
+                self.copy_range(fd, offset, count, content)
+            self.write_body(closing)
+
+    def send_encoded(self, fd, path, st, ctype, encoding, encoded_path, send_body, content=None):
+        """发送压缩后的内容（不同编码使用不同的ETag，缓存不会混用）"""
+        etag = make_etag(st)[:-1] + '-' + encoding + '"'
+        if self.not_modified(etag, st):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_common_headers(path, st, etag, vary=True)
+            self.end_headers()
+            return
+
+        if encoded_path is None:
+            data = self.server.compression_cache.get(path, st, encoding, fd, content)
+            self.send_response(HTTPStatus.OK)
+            self.send_common_headers(path, st, etag, vary=True)
+            self.send_header('Content-Type', ctype)
+            self.send_header('Content-Encoding', encoding)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            if send_body:
+                self.write_body(data)
+                self.bytes_sent += len(data)
+            return
+
+        try:
+            encoded_fd = os.open(encoded_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        except OSError:
+            # 预压缩文件刚好被替换，下次请求再用
+            encoded_fd = None
+        if encoded_fd is None:
+            self.send_encoded(fd, path, st, ctype, encoding, None, send_body, content)
+            return
+        try:
+            length = os.fstat(encoded_fd).st_size
+            self.send_response(HTTPStatus.OK)
+            self.send_common_headers(path, st, etag, vary=True)
+            self.send_header('Content-Type', ctype)
+            self.send_header('Content-Encoding', encoding)
+            self.send_header('Content-Length', str(length))
+            self.end_headers()
+            if send_body:
+                self.copy_range(encoded_fd, 0, length)
+        finally:
+            os.close(encoded_fd)
+
+    def copy_range(self, fd, offset, count, content=None):
+        """发送文件的一段：socket.sendfile 在支持的平台上使用 os.sendfile 零拷贝，
+        否则自动退化为分块读写；分块发送以便在连接超时设置下正确等待可写。
+        有缓存的内容时直接从内存发送"""
+        if content is not None:
+            data = memoryview(content)[offset:offset + count]
+            self.write_body(data)
+            self.bytes_sent += len(data)
+            return
+        with os.fdopen(fd, 'rb', closefd=False) as f:
+            while count > 0:
+                chunk = self.transfer.throttle(min(count, SENDFILE_CHUNK_SIZE))
+                sent = self.connection.sendfile(f, offset, chunk)
+                if sent == 0:
+                    break
+                offset += sent
+                count -= sent
+                self.bytes_sent += sent
+
+    def write_body(self, data):
+        """发送内存中的响应体（按限速分段）"""
+        view = memoryview(data)
+        while view:
+            n = self.transfer.throttle(len(view))
+            self.wfile.write(view[:n])
+            view = view[n:]
+
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """用固定大小的线程池处理连接（保持连接时每个连接占用一个线程）"""
+
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, root, workers=64, verbose=False,
+                 bind_and_activate=True, bandwidth=None, url_signer=None):
+        self.root = os.path.abspath(root)
+        self.real_root = os.path.realpath(root)
+        self.verbose = verbose
+        self.closing = False
+        self.compression_cache = CompressionCache()
+        self.file_cache = FileCache()
+        # 未指定时不限速，只统计吞吐量
+        self.bandwidth = bandwidth or BandwidthShaper()
+        # 下载链接签名校验，未指定时共享文件公开访问
+        self.url_signer = url_signer
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http')
+        # 连接 -> 是否正在处理请求
+        self._connections = {}
+        self._connections_lock = threading.Lock()
+        super().__init__(server_address, handler_class, bind_and_activate)
+
+    def process_request(self, request, client_address):
+        with self._connections_lock:
+            self._connections[request] = False
+        self._pool.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self._connections_lock:
+                self._connections.pop(request, None)
+            self.shutdown_request(request)
+
+    def connection_busy(self, connection, busy):
+        with self._connections_lock:
+            if connection in self._connections:
+                self._connections[connection] = busy
+
+    def handle_error(self, request, client_address):
+        # 客户端中途断开（如取消下载）很常见，不打印堆栈
+        exc = sys.exc_info()[1]
+        if isinstance(exc, (ConnectionError, socket.timeout)):
+            return
+        super().handle_error(request, client_address)
+
+    def graceful_shutdown(self, timeout=30.0):
+        """停止接受新连接，关闭空闲的保持连接，等待进行中的请求完成（最多 timeout 秒）
+
+        必须在 serve_forever 之外的线程中调用。
+        """
+        self.closing = True
+        self.shutdown()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._connections_lock:
+                idle = [conn for conn, busy in self._connections.items() if not busy]
+                remaining = len(self._connections)
+            for conn in idle:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            if not remaining:
+                break
+            time.sleep(0.1)
+        self.server_close()
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False)
+
+
+def serve(directory='.', host='0.0.0.0', port=8000, workers=64, verbose=False, signed_urls=True):
+    """启动文件服务器（阻塞运行）；signed_urls 为真时共享文件只能通过签名链接下载"""
+    server = ThreadPoolHTTPServer((host, port), FileRequestHandler, directory, workers, verbose,
+                                  bandwidth=BandwidthShaper(BANDWIDTH_FILE),
+                                  url_signer=UrlSigner(load_signing_key()) if signed_urls else None)
+    print(f"文件服务已启动: http://{host}:{port}/ （目录: {server.root}，线程数: {workers}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='共享目录文件服务器（替代 python -m http.server）')
+    parser.add_argument('directory', nargs='?', default='.', help='共享目录')
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    parser.add_argument('--port', type=int, default=8000, help='监听端口')
+    parser.add_argument('--workers', type=int, default=64, help='处理连接的线程数')
+    parser.add_argument('--verbose', action='store_true', help='打印每个请求的日志')
+    parser.add_argument('--public', action='store_true', help='不要求签名链接，任何人都可以直接下载')
+    args = parser.parse_args()
+    serve(args.directory, args.host, args.port, args.workers, args.verbose, not args.public)
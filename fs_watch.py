@@ -0,0 +1,170 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+# inotify 事件掩码（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _load_inotify():
+    """加载libc中的inotify接口，不支持时返回None"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class DirectoryWatcher:
+    """监视目录变化，把一连串事件合并成一次回调
+
+    Linux 上使用 inotify（空闲时阻塞等待，几乎不占CPU），其他平台退化为定时轮询。
+    directory 可以是单个目录或目录列表（递归索引时监视每个子目录）。
+    debounce: 事件停止后等待多久再触发回调；max_latency: 从第一个事件起最长等待多久。
+    """
+
+    def __init__(self, directory, callback, debounce=0.5, max_latency=2.0,
+                 poll_interval=2.0, ignore=None):
+        self.directories = []
+        self.callback = callback
+        self.debounce = debounce
+        self.max_latency = max(max_latency, debounce)
+        self.poll_interval = poll_interval
+        self.ignore = ignore or (lambda name: False)
+        self._stop = threading.Event()
+        self._libc = _load_inotify()
+        self._fd = None
+        if self._libc is not None:
+            fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                self._fd = fd
+        for path in ([directory] if isinstance(directory, str) else directory):
+            self.add_directory(path)
+
+    def add_directory(self, path):
+        """增加一个要监视的目录（已在监视中的目录会被忽略）"""
+        if path in self.directories:
+            return
+        if self._fd is not None and self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK) < 0:
+            if not self.directories:
+                # 连第一个目录都无法监视（如inotify数量达到上限），改用轮询
+                os.close(self._fd)
+                self._fd = None
+            else:
+                return
+        self.directories.append(path)
+
+    @property
+    def backend(self):
+        return 'inotify' if self._fd is not None else 'polling'
+
+    def run(self):
+        """阻塞运行，直到调用 stop()"""
+        try:
+            if self._fd is not None:
+                self._run_inotify()
+            else:
+                self._run_polling()
+        finally:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def stop(self):
+        self._stop.set()
+
+    def _run_inotify(self):
+        first_event = None
+        last_event = None
+        while not self._stop.is_set():
+            if first_event is None:
+                timeout = 1.0  # 空闲时每秒醒来一次检查是否需要退出
+            else:
+                now = time.monotonic()
+                timeout = max(0.0, min(last_event + self.debounce, first_event + self.max_latency) - now)
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+            if readable and self._read_events():
+                now = time.monotonic()
+                first_event = first_event or now
+                last_event = now
+            if first_event is not None:
+                now = time.monotonic()
+                if now >= last_event + self.debounce or now >= first_event + self.max_latency:
+                    first_event = last_event = None
+                    self.callback()
+
+    def _read_events(self):
+        """读取所有待处理事件，返回其中是否有需要关注的变化"""
+        relevant = False
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return relevant
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+                offset += length
+                if mask & IN_Q_OVERFLOW or not name or not self.ignore(name):
+                    relevant = True
+
+    def _run_polling(self):
+        snapshot = self._snapshot()
+        first_change = None
+        last_change = None
+        while not self._stop.wait(self.poll_interval if first_change is None else min(self.poll_interval, self.debounce)):
+            current = self._snapshot()
+            now = time.monotonic()
+            if current != snapshot:
+                snapshot = current
+                first_change = first_change or now
+                last_change = now
+            if first_change is not None and (now >= last_change + self.debounce or
+                                             now >= first_change + self.max_latency):
+                first_change = last_change = None
+                self.callback()
+
+    def _snapshot(self):
+        result = {}
+        for directory in list(self.directories):
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if self.ignore(entry.name):
+                            continue
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        result[os.path.join(directory, entry.name)] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                pass
+        return result
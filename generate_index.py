@@ -1,23 +1,91 @@
 import os
-import sys
-import socket
+import argparse
 import json
+import html
+import marshal
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import quote
 
-def get_local_ip():
-    """获取本机局域网IP地址"""
-    try:
-        # 创建一个临时连接来获取本机IP
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))  # 连接到一个公共DNS服务器
-        ip = s.getsockname()[0]
-        s.close()
-        return ip
-    except Exception:
-        return "127.0.0.1"  # 失败时返回回环地址
+from compression import write_precompressed
+from static_assets import write_static_assets
+from hashing import hash_tree, SUMS_FILES, JSON_MANIFEST_FILE
+from metrics import INDEX_PHASE_SECONDS
+
+try:
+    import fcntl  # 仅在类Unix系统上可用，防止多个进程同时生成索引
+except ImportError:
+    fcntl = None
+
+# 需要隐藏的文件列表（登录相关文件）
+HIDDEN_FILES = [
+    'auth.py', 
+    'users.json', 
+    'config.py', 
+    'requirements.txt',
+    'generate_index.py',
+    'generate_index.py.bak',
+    'user_store.py',
+    'passwords.py',
+    'fs_watch.py',
+    'share_index.py',
+    'file_server.py',
+    'serve.py',
+    'compression.py',
+    'file_cache.py',
+    'hashing.py',
+    'search_index.py',
+    'session_store.py',
+    'rate_limit.py',
+    'metrics.py',
+    'analytics.py',
+    'static_assets.py',
+    'uploads.py',
+    'archives.py',
+    'bandwidth.py',
+    'bandwidth.json',
+    'signed_urls.py',
+    'download.key',
+    '_static',
+    'sessions.db',
+    'sessions.db-wal',
+    'sessions.db-shm',
+    'SHA256SUMS',
+    'B2SUMS',
+    'SHA256SUMS.json',
+    '__pycache__',
+    'benchmarks',
+    '.htaccess',
+    'access_log.json'  # 添加访问记录文件到隐藏列表
+]
+
+# 文件卡片缓存（按 文件名 -> (大小, 修改时间) 记录已渲染的HTML）
+# 使用marshal格式，几万个文件的缓存也能在几十毫秒内读写
+MANIFEST_FILE = '.index_manifest'
+# 上次生成索引时的参数，认证服务在上传完成后按相同参数重新生成
+OPTIONS_FILE = '.index_options'
+# 生成索引期间持有的锁文件（--watch 与认证服务可能同时生成）
+LOCK_FILE = '.index_lock'
+# 卡片模板变化时递增，使旧缓存失效
+CARD_TEMPLATE_VERSION = 2
+# 文件数超过此值时不再内联卡片，改为页面通过分页接口按需加载
+LAZY_THRESHOLD = 1000
+# 认证接口挂载在与共享文件相同的源下（serve.py），页面用相对地址访问，与本机IP无关
+API_PREFIX = '/api'
+
+VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov', '.wmv', '.flv', '.webm']
+CODE_EXTENSIONS = ['.py', '.js', '.html', '.css', '.java', '.c', '.cpp', '.php', '.rb', '.go']
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg']
+DOCUMENT_EXTENSIONS = ['.pdf', '.doc', '.docx', '.txt', '.rtf']
+ARCHIVE_EXTENSIONS = ['.zip', '.rar', '.7z', '.tar', '.gz']
 
 def get_file_size(file_path):
     """获取文件大小并转换为易读格式"""
-    size = os.path.getsize(file_path)
+    return format_size(os.path.getsize(file_path))
+
+def format_size(size):
+    """把字节数转换为易读格式"""
     for unit in ['B', 'KB', 'MB', 'GB']:
         if size < 1024.0:
             return f"{size:.1f} {unit}"
@@ -27,422 +95,375 @@ def get_file_size(file_path):
 def get_file_icon(filename):
     """根据文件扩展名返回对应的图标类"""
     ext = os.path.splitext(filename)[1].lower()
-    if ext in ['.mp4', '.avi', '.mov', '.wmv', '.flv', '.webm']:
+    if ext in VIDEO_EXTENSIONS:
         return 'fas fa-file-video', '视频文件'
-    elif ext in ['.py', '.js', '.html', '.css', '.java', '.c', '.cpp', '.php', '.rb', '.go']:
+    elif ext in CODE_EXTENSIONS:
         return 'fas fa-file-code', '代码文件'
-    elif ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg']:
+    elif ext in IMAGE_EXTENSIONS:
         return 'fas fa-file-image', '图片文件'
-    elif ext in ['.pdf', '.doc', '.docx', '.txt', '.rtf']:
+    elif ext in DOCUMENT_EXTENSIONS:
         return 'fas fa-file-alt', '文档文件'
-    elif ext in ['.zip', '.rar', '.7z', '.tar', '.gz']:
+    elif ext in ARCHIVE_EXTENSIONS:
         return 'fas fa-file-archive', '压缩文件'
     else:
         return 'fas fa-file', '其他文件'
 
-def generate_index(directory):
-    # 获取本机IP
-    local_ip = get_local_ip()
-    print(f"检测到本机IP: {local_ip}")
-    
-    # 需要隐藏的文件列表（登录相关文件）
-    hidden_files = [
-        'auth.py', 
-        'users.json', 
-        'config.py', 
-        'requirements.txt',
-        'generate_index.py',
-        'generate_index.py.bak',
-        '.htaccess',
-        'access_log.json'  # 添加访问记录文件到隐藏列表
-    ]
+def is_hidden(name):
+    """判断文件是否不应出现在索引中"""
+    return (name.startswith('.') or
+            name == 'index.html' or
+            name.startswith('index.html.') or  # 预压缩的 .gz/.br
+            name in HIDDEN_FILES or
+            name.startswith('access_log.'))  # 访问记录及其轮转文件
+
+def is_within(path, real_root):
+    """path 解析符号链接后是否仍在 real_root（已经 realpath 过的共享目录）之内"""
+    real = os.path.realpath(path)
+    return real == real_root or real.startswith(real_root + os.sep)
+
+def scan_directory_entries(directory, follow_symlinks=True, real_root=None):
+    """一次 os.scandir 遍历目录，复用 DirEntry 的 stat 结果
+
+    返回 (文件列表, 子目录列表)，文件为按名称排序的 (文件名, 大小, 修改时间ns)，
+    子目录为 (目录名, (st_dev, st_ino))，用于检测符号链接循环。
+    给出 real_root 时跳过指向共享目录之外的符号链接（文件服务也拒绝访问它们）
+    """
+    files = []
+    dirs = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if is_hidden(entry.name):
+                continue
+            if real_root is not None and entry.is_symlink() and not is_within(entry.path, real_root):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=follow_symlinks):
+                    st = entry.stat(follow_symlinks=follow_symlinks)
+                    dirs.append((entry.name, (st.st_dev, st.st_ino)))
+                elif entry.is_file():
+                    st = entry.stat()
+                    files.append((entry.name, st.st_size, st.st_mtime_ns))
+            except OSError:
+                continue  # 扫描期间被删除的文件
+    files.sort()
+    dirs.sort()
+    return files, dirs
+
+def scan_directory(directory, real_root=None):
+    """扫描单个目录，返回按文件名排序的 (文件名, 大小, 修改时间ns) 列表"""
+    return scan_directory_entries(directory, real_root=real_root)[0]
+
+def make_listing(files, subdirs):
+    """生成单个目录的清单，同时统计本目录的文件类型和大小"""
+    file_types = {}
+    size = 0
+    for name, file_size, _ in files:
+        ext = os.path.splitext(name)[1].lower()
+        file_types[ext] = file_types.get(ext, 0) + 1
+        size += file_size
+    return {
+        'files': files,
+        'dirs': subdirs,
+        'file_types': file_types,
+        'size': size,
+        # 包含所有子目录的汇总，由 aggregate_tree 填充
+        'total_files': len(files),
+        'total_size': size,
+        'total_file_types': dict(file_types),
+    }
+
+def aggregate_tree(tree):
+    """自底向上把各目录的统计累加到上级目录（不需要再次遍历磁盘）"""
+    for rel_dir in sorted(tree, key=lambda d: d.count('/') if d else -1, reverse=True):
+        if not rel_dir:
+            continue
+        parent = tree.get(rel_dir.rpartition('/')[0])
+        if parent is None:
+            continue
+        listing = tree[rel_dir]
+        parent['total_files'] += listing['total_files']
+        parent['total_size'] += listing['total_size']
+        for ext, count in listing['total_file_types'].items():
+            parent['total_file_types'][ext] = parent['total_file_types'].get(ext, 0) + count
+
+def scan_tree(directory, max_depth=None, workers=8, follow_symlinks=False):
+    """用线程池并行扫描整个目录树（网络盘或慢速磁盘上stat是IO密集的）
+
+    返回 {相对路径: 目录清单}，根目录的相对路径为 ''，路径分隔符统一为 '/'。
+    max_depth 限制递归深度（0 表示只扫描根目录）；跟随符号链接时按 (st_dev, st_ino)
+    记录已访问的目录，避免符号链接循环。
+    """
+    root_st = os.stat(directory)
+    real_root = os.path.realpath(directory)
+    visited = {(root_st.st_dev, root_st.st_ino)}
+    tree = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(scan_directory_entries, directory, follow_symlinks, real_root): ('', 0)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                rel_dir, depth = pending.pop(future)
+                try:
+                    files, dirs = future.result()
+                except OSError:
+                    files, dirs = [], []  # 没有权限或扫描期间被删除
+                subdirs = []
+                if max_depth is None or depth < max_depth:
+                    for name, key in dirs:
+                        if key in visited:
+                            continue  # 符号链接循环或同一目录被多次挂载
+                        visited.add(key)
+                        subdirs.append(name)
+                        child = f'{rel_dir}/{name}' if rel_dir else name
+                        path = os.path.join(directory, *child.split('/'))
+                        pending[pool.submit(scan_directory_entries, path, follow_symlinks, real_root)] = (child, depth + 1)
+                tree[rel_dir] = make_listing(files, subdirs)
+    aggregate_tree(tree)
+    return tree
+
+def render_file_card(name, size, sha256=None):
+    """渲染单个文件卡片"""
+    icon_class, file_type = get_file_icon(name)
+    file_ext = os.path.splitext(name)[1].upper().replace('.', '') or '文件'
+    escaped = html.escape(name)
+    file_hash = f'''
+                        <div class="file-hash" title="SHA-256">{sha256}</div>''' if sha256 else ''
+    return f'''
+                <div class="file-card">
+                    <div class="file-card-header">
+                        <i class="{icon_class}"></i>
+                        <div>{file_type}</div>
+                    </div>
+                    <div class="file-card-body">
+                        <div class="file-name">{escaped}</div>
+                        <div class="file-meta">
+                            <span>{html.escape(file_ext)}</span>
+                            <span>{format_size(size)}</span>
+                        </div>{file_hash}
+                    </div>
+                    <div class="file-card-footer">
+                        <a href="{quote(name)}" class="download-btn" data-filename="{escaped}">查看</a>
+                    </div>
+                </div>
+'''
+
+def render_dir_card(name, listing=None):
+    """渲染子目录卡片（name 为 '..' 时表示返回上级目录）"""
+    if name == '..':
+        icon_class, title, meta = 'fas fa-level-up-alt', '返回上级', ''
+    else:
+        icon_class, title = 'fas fa-folder', html.escape(name)
+        meta = f'''
+                        <div class="file-meta">
+                            <span>{listing['total_files']} 个文件</span>
+                            <span>{format_size(listing['total_size'])}</span>
+                        </div>'''
+    return f'''
+                <div class="file-card">
+                    <div class="file-card-header">
+                        <i class="{icon_class}"></i>
+                        <div>文件夹</div>
+                    </div>
+                    <div class="file-card-body">
+                        <div class="file-name">{title}</div>{meta}
+                    </div>
+                    <div class="file-card-footer">
+                        <a href="{quote(name)}/" class="download-btn">打开</a>
+                    </div>
+                </div>
+'''
+
+def load_manifest(directory):
+    """加载卡片缓存，模板版本不一致时丢弃"""
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), 'rb') as f:
+            version, cards = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return {}
+    if version != CARD_TEMPLATE_VERSION:
+        return {}
+    return cards
+
+def save_manifest(directory, cards):
+    """保存卡片缓存"""
+    path = os.path.join(directory, MANIFEST_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        marshal.dump((CARD_TEMPLATE_VERSION, cards), f)
+    os.replace(tmp_path, path)
+
+def render_cards(directory, entries, digests=None):
+    """渲染全部文件卡片，只重新渲染大小、修改时间或摘要变化的文件
+
+    返回 (卡片HTML列表, 重新渲染的数量)
+    """
+    cached = load_manifest(directory)
+    digests = digests or {}
+    cards = {}
+    parts = []
+    rendered = 0
+    for name, size, mtime_ns in entries:
+        sha256 = digests.get(name, {}).get('sha256')
+        hit = cached.get(name)
+        if hit is not None and hit[:3] == (size, mtime_ns, sha256):
+            card = hit[3]
+        else:
+            card = render_file_card(name, size, sha256)
+            rendered += 1
+        cards[name] = (size, mtime_ns, sha256, card)
+        parts.append(card)
+    # 有新增、修改或删除时才回写缓存
+    if rendered or len(cards) != len(cached):
+        save_manifest(directory, cards)
+    return parts, rendered
+
+@contextmanager
+def index_lock(directory):
+    """跨进程的索引生成锁，不支持fcntl的平台上退化为无锁"""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, LOCK_FILE), 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def generate_index(directory, lazy=None, recursive=False, max_depth=None, workers=8,
+                   follow_symlinks=False, hash_files=True, hash_workers=4, blake2=False):
+    """生成索引页面；recursive 为真时为每个子目录各生成一个 index.html，返回目录树
+
+    hash_files 为真时计算每个文件的SHA-256（blake2 为真时另外计算BLAKE2b），
+    显示在文件卡片上并写入 SHA256SUMS 和 JSON 清单。
+    """
+    options = {'lazy': lazy, 'recursive': recursive, 'max_depth': max_depth, 'workers': workers,
+               'follow_symlinks': follow_symlinks, 'hash_files': hash_files,
+               'hash_workers': hash_workers, 'blake2': blake2}
+    with index_lock(directory):
+        tree = _generate_index(directory, **options)
+        tmp_path = os.path.join(directory, OPTIONS_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(options, f)
+        os.replace(tmp_path, os.path.join(directory, OPTIONS_FILE))
+    return tree
+
+def regenerate_index(directory):
+    """按上次生成时的参数重新生成索引页面；从未生成过时不做任何事，返回None"""
+    try:
+        with open(os.path.join(directory, OPTIONS_FILE), 'r', encoding='utf-8') as f:
+            options = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return generate_index(directory, **options)
+
+def _generate_index(directory, lazy, recursive, max_depth, workers, follow_symlinks, hash_files,
+                    hash_workers, blake2):
+    start = time.perf_counter()
     
     # 获取目录中的所有文件（排除隐藏文件、index.html本身和指定文件）
-    files = [f for f in os.listdir(directory) 
-             if os.path.isfile(os.path.join(directory, f)) and 
-             not f.startswith('.') and 
-             f != 'index.html' and
-             f not in hidden_files]
+    phases = {}
+    phase_start = time.perf_counter()
+    if recursive:
+        tree = scan_tree(directory, max_depth, workers, follow_symlinks)
+    else:
+        tree = {'': make_listing(scan_directory(directory, os.path.realpath(directory)), [])}
+    phases['scan'] = time.perf_counter() - phase_start
     
-    # 统计文件类型
-    file_types = {}
-    for file in files:
-        _, ext = os.path.splitext(file)
-        ext = ext.lower()
-        file_types[ext] = file_types.get(ext, 0) + 1
+    digests, hashed = {}, 0
+    if hash_files:
+        phase_start = time.perf_counter()
+        algorithms = ('sha256', 'blake2b') if blake2 else ('sha256',)
+        digests, hashed = hash_tree(directory, tree, hash_workers, algorithms)
+        phases['hash'] = time.perf_counter() - phase_start
+    
+    phase_start = time.perf_counter()
+    rendered = 0
+    timings = {'write': 0.0}
+    # 样式表（含图标）写入根目录下带指纹的静态文件，各页面只引用它，不依赖外网
+    stylesheet = write_static_assets(directory)
+    for rel_dir, listing in tree.items():
+        path = os.path.join(directory, *rel_dir.split('/')) if rel_dir else directory
+        rendered += write_index_page(path, rel_dir, listing, tree, lazy,
+                                     digests.get(rel_dir) if hash_files else None, timings, stylesheet)
+    phases['render'] = time.perf_counter() - phase_start - timings['write']
+    phases['write'] = timings['write']
+    for phase, seconds in phases.items():
+        INDEX_PHASE_SECONDS.observe(seconds, phase=phase)
+    
+    root = tree['']
+    elapsed = (time.perf_counter() - start) * 1000
+    if recursive:
+        print(f"已生成 {len(tree)} 个目录的索引页面，共 {root['total_files']} 个文件，"
+              f"{format_size(root['total_size'])}（重新渲染 {rendered} 个，耗时 {elapsed:.1f} ms）")
+    else:
+        print(f"已生成美化索引页面，包含 {len(root['files'])} 个文件（重新渲染 {rendered} 个，耗时 {elapsed:.1f} ms）")
+    names = {'scan': '扫描', 'hash': '计算摘要', 'render': '渲染', 'write': '写入'}
+    print('各阶段耗时: ' + '，'.join(f"{names[p]} {s * 1000:.1f} ms" for p, s in phases.items()))
+    if hash_files:
+        print(f"已计算 {hashed} 个新增或修改文件的SHA-256，校验文件: {SUMS_FILES['sha256']}")
+    print(f"已隐藏以下文件: {', '.join(HIDDEN_FILES)}")
+    print(f"请用 python serve.py 启动服务（共享文件和 {API_PREFIX}/ 下的认证接口使用同一端口）")
+    return tree
+
+def write_index_page(directory, rel_dir, listing, tree, lazy=None, digests=None, timings=None,
+                     stylesheet=None):
+    """为单个目录写入 index.html，返回重新渲染的卡片数；digests 为 {文件名: {算法: 摘要}}
+
+    timings 为字典时，把写入文件（含预压缩）的耗时累加到 timings['write']；
+    stylesheet 为 write_static_assets 返回的样式表路径（相对共享目录根部）
+    """
+    depth = rel_dir.count('/') + 1 if rel_dir else 0
+    if stylesheet is None:
+        stylesheet = write_static_assets(os.path.join(directory, *[os.pardir] * depth))
+    # 子目录页面通过相对路径引用根目录下的样式表
+    stylesheet = '../' * depth + stylesheet
+    entries = listing['files']
+    files = [name for name, _, _ in entries]
+    
+    # 统计文件类型（扫描时已完成）
+    file_types = listing['file_types']
+    video_count = sum(file_types.get(ext, 0) for ext in VIDEO_EXTENSIONS)
+    code_count = sum(file_types.get(ext, 0) for ext in CODE_EXTENSIONS)
+    
+    # 子目录卡片（非根目录时第一张为返回上级）
+    dir_cards = ['' if not rel_dir else render_dir_card('..')]
+    for name in listing['dirs']:
+        child = f'{rel_dir}/{name}' if rel_dir else name
+        dir_cards.append(render_dir_card(name, tree[child]))
+    dir_grid = ''
+    if len(dir_cards) > 1 or rel_dir:
+        dir_grid = '<div class="file-grid dir-grid">' + ''.join(dir_cards) + '</div>'
+    
+    # 大目录只生成页面框架，卡片由浏览器分页加载并虚拟滚动渲染
+    if lazy is None:
+        lazy = len(files) > LAZY_THRESHOLD
+    if lazy:
+        grid_open = '''<div class="virtual-grid" id="fileGrid">
+                <div class="file-grid" id="fileGridWindow">'''
+        grid_close = '''</div>
+            </div>'''
+        sort_control = '''
+                <select id="sortSelect" class="sort-select">
+                    <option value="name:asc">按名称</option>
+                    <option value="mtime:desc">最近修改</option>
+                    <option value="size:desc">从大到小</option>
+                    <option value="size:asc">从小到大</option>
+                    <option value="type:asc">按类型</option>
+                </select>'''
+    else:
+        grid_open = '<div class="file-grid">'
+        grid_close = '</div>'
+        sort_control = ''
     
     # 生成HTML内容
-    html_content = f'''<!DOCTYPE html>
+    page_head = f'''<!DOCTYPE html>
 <html lang="zh-CN">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>文件共享服务器</title>
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
-    <style>
-        :root {{
-            --primary-color: #1a2980;
-            --secondary-color: #26d0ce;
-            --accent-color: #ff7e5f;
-            --light-color: #ffffff;
-            --dark-color: #2c3e50;
-            --success-color: #38ef7d;
-            --card-shadow: 0 10px 30px rgba(0, 0, 0, 0.15);
-            --transition: all 0.3s ease;
-        }}
-        
-        * {{
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }}
-        
-        body {{
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            background: linear-gradient(135deg, var(--primary-color) 0%, var(--secondary-color) 100%);
-            color: var(--light-color);
-            line-height: 1.6;
-            min-height: 100vh;
-            padding: 20px;
-            background-attachment: fixed;
-        }}
-        
-        .container {{
-            max-width: 1000px;
-            margin: 0 auto;
-        }}
-        
-        header {{
-            text-align: center;
-            margin-bottom: 40px;
-            padding: 20px;
-        }}
-        
-        h1 {{
-            font-size: 2.8rem;
-            color: white;
-            margin-bottom: 10px;
-            font-weight: 700;
-            position: relative;
-            display: inline-block;
-            text-shadow: 0 2px 10px rgba(0, 0, 0, 0.2);
-        }}
-        
-        h1:after {{
-            content: '';
-            position: absolute;
-            bottom: -10px;
-            left: 50%;
-            transform: translateX(-50%);
-            width: 60px;
-            height: 4px;
-            background: var(--accent-color);
-            border-radius: 2px;
-        }}
-        
-        .subtitle {{
-            color: rgba(255, 255, 255, 0.85);
-            font-size: 1.2rem;
-            margin-top: 20px;
-        }}
-        
-        .search-box {{
-            max-width: 500px;
-            margin: 30px auto;
-            position: relative;
-        }}
-        
-        .search-box input {{
-            width: 100%;
-            padding: 15px 20px;
-            border: none;
-            border-radius: 50px;
-            box-shadow: 0 5px 20px rgba(0, 0, 0, 0.2);
-            font-size: 1rem;
-            transition: var(--transition);
-            background: rgba(255, 255, 255, 0.9);
-        }}
-        
-        .search-box input:focus {{
-            outline: none;
-            box-shadow: 0 5px 25px rgba(0, 0, 0, 0.3);
-            background: white;
-        }}
-        
-        .search-box i {{
-            position: absolute;
-            right: 20px;
-            top: 50%;
-            transform: translateY(-50%);
-            color: var(--primary-color);
-        }}
-        
-        .file-grid {{
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
-            gap: 25px;
-            margin-top: 20px;
-        }}
-        
-        .file-card {{
-            background: rgba(255, 255, 255, 0.95);
-            border-radius: 12px;
-            overflow: hidden;
-            box-shadow: var(--card-shadow);
-            transition: var(--transition);
-            display: flex;
-            flex-direction: column;
-            height: 100%;
-            backdrop-filter: blur(10px);
-            border: 1px solid rgba(255, 255, 255, 0.2);
-        }}
-        
-        .file-card:hover {{
-            transform: translateY(-8px);
-            box-shadow: 0 15px 35px rgba(0, 0, 0, 0.25);
-        }}
-        
-        .file-card-header {{
-            background: linear-gradient(135deg, var(--primary-color) 0%, var(--secondary-color) 100%);
-            color: white;
-            padding: 15px;
-            text-align: center;
-        }}
-        
-        .file-card-header i {{
-            font-size: 2.2rem;
-            margin-bottom: 10px;
-            text-shadow: 0 2px 5px rgba(0, 0, 0, 0.2);
-        }}
-        
-        .file-card-body {{
-            padding: 20px;
-            flex-grow: 1;
-        }}
-        
-        .file-name {{
-            font-weight: 600;
-            font-size: 1.1rem;
-            margin-bottom: 10px;
-            color: var(--dark-color);
-            display: -webkit-box;
-            -webkit-line-clamp: 2;
-            -webkit-box-orient: vertical;
-            overflow: hidden;
-        }}
-        
-        .file-meta {{
-            display: flex;
-            justify-content: space-between;
-            color: #6c757d;
-            font-size: 0.85rem;
-            margin-top: 15px;
-            padding-top: 15px;
-            border-top: 1px solid #eee;
-        }}
-        
-        .file-card-footer {{
-            padding: 0 20px 20px;
-        }}
-        
-        .download-btn {{
-            display: block;
-            width: 100%;
-            padding: 12px;
-            background: var(--success-color);
-            color: white;
-            text-align: center;
-            border-radius: 6px;
-            text-decoration: none;
-            font-weight: 600;
-            transition: var(--transition);
-            box-shadow: 0 4px 10px rgba(56, 239, 125, 0.4);
-        }}
-        
-        .download-btn:hover {{
-            background: #2dd56a;
-            transform: translateY(-2px);
-            box-shadow: 0 6px 15px rgba(56, 239, 125, 0.5);
-        }}
-        
-        .stats {{
-            display: flex;
-            justify-content: space-around;
-            background: rgba(255, 255, 255, 0.2);
-            border-radius: 12px;
-            padding: 20px;
-            box-shadow: 0 8px 20px rgba(0, 0, 0, 0.1);
-            margin-bottom: 30px;
-            backdrop-filter: blur(10px);
-            border: 1px solid rgba(255, 255, 255, 0.15);
-        }}
-        
-        .stat-item {{
-            text-align: center;
-        }}
-        
-        .stat-number {{
-            font-size: 2.2rem;
-            font-weight: 700;
-            color: white;
-            text-shadow: 0 2px 5px rgba(0, 0, 0, 0.2);
-        }}
-        
-        .stat-label {{
-            color: rgba(255, 255, 255, 0.85);
-            font-size: 0.9rem;
-        }}
-        
-        footer {{
-            text-align: center;
-            margin-top: 50px;
-            padding: 20px;
-            color: rgba(255, 255, 255, 0.8);
-            font-size: 0.9rem;
-        }}
-        
-        @media (max-width: 768px) {{
-            .file-grid {{
-                grid-template-columns: 1fr;
-            }}
-            
-            h1 {{
-                font-size: 2.2rem;
-            }}
-            
-            .stats {{
-                flex-direction: column;
-                gap: 20px;
-            }}
-        }}
-        
-        /* 登录相关样式 */
-        .login-container {{
-            background: rgba(255, 255, 255, 0.95);
-            border-radius: 12px;
-            box-shadow: var(--card-shadow);
-            padding: 40px;
-            width: 100%;
-            max-width: 400px;
-            backdrop-filter: blur(10px);
-            border: 1px solid rgba(255, 255, 255, 0.2);
-            position: fixed;
-            top: 50%;
-            left: 50%;
-            transform: translate(-50%, -50%);
-            z-index: 1000;
-        }}
-        
-        .login-header {{
-            text-align: center;
-            margin-bottom: 30px;
-        }}
-        
-        .login-header h1 {{
-            font-size: 2rem;
-            color: var(--primary-color);
-            margin-bottom: 10px;
-        }}
-        
-        .login-header p {{
-            color: #6c757d;
-        }}
-        
-        .form-group {{
-            margin-bottom: 20px;
-        }}
-        
-        .form-group label {{
-            display: block;
-            margin-bottom: 8px;
-            color: var(--dark-color);
-            font-weight: 600;
-        }}
-        
-        .form-group input {{
-            width: 100%;
-            padding: 12px 15px;
-            border: 1px solid #ddd;
-            border-radius: 6px;
-            font-size: 1rem;
-            transition: var(--transition);
-        }}
-        
-        .form-group input:focus {{
-            outline: none;
-            border-color: var(--primary-color);
-            box-shadow: 0 0 0 3px rgba(26, 41, 128, 0.1);
-        }}
-        
-        .login-btn {{
-            width: 100%;
-            padding: 12px;
-            background: linear-gradient(135deg, var(--primary-color) 0%, var(--secondary-color) 100%);
-            color: white;
-            border: none;
-            border-radius: 6px;
-            font-size: 1rem;
-            font-weight: 600;
-            cursor: pointer;
-            transition: var(--transition);
-            box-shadow: 0 4px 10px rgba(0, 0, 0, 0.1);
-        }}
-        
-        .login-btn:hover {{
-            transform: translateY(-2px);
-            box-shadow: 0 6px 15px rgba(0, 0, 0, 0.2);
-        }}
-        
-        .file-container {{
-            display: none;
-        }}
-        
-        /* 访问记录表格样式 */
-        .access-logs {{
-            margin: 30px 0;
-            background: rgba(255, 255, 255, 0.95);
-            border-radius: 12px;
-            padding: 20px;
-            box-shadow: var(--card-shadow);
-            backdrop-filter: blur(10px);
-            border: 1px solid rgba(255, 255, 255, 0.2);
-        }}
-        
-        .access-logs h2 {{
-            color: var(--primary-color);
-            text-align: center;
-            margin-bottom: 20px;
-            font-size: 1.8rem;
-        }}
-        
-        .access-table {{
-            width: 100%;
-            border-collapse: collapse;
-            margin-top: 15px;
-        }}
-        
-        .access-table th,
-        .access-table td {{
-            padding: 12px 15px;
-            text-align: left;
-            border-bottom: 1px solid #eee;
-        }}
-        
-        .access-table th {{
-            background-color: var(--primary-color);
-            color: white;
-            font-weight: 600;
-        }}
-        
-        .access-table tr:hover {{
-            background-color: rgba(26, 41, 128, 0.05);
-        }}
-        
-        .access-table-container {{
-            max-height: 400px;
-            overflow-y: auto;
-        }}
-    </style>
+    <link rel="stylesheet" href="{stylesheet}">
 </head>
 <body>
     <div class="login-container" id="loginContainer">
@@ -479,6 +500,27 @@ def generate_index(directory):
                         欢迎, <span id="userName">用户</span> | 
                         <a href="#" onclick="logout()" style="color: white; text-decoration: underline;">退出</a>
                     </div>
+                </div>{sort_control}
+                <div class="search-filters">
+                    <select id="typeFilter" class="sort-select">
+                        <option value="">全部类型</option>
+                        <option value="video">视频文件</option>
+                        <option value="code">代码文件</option>
+                        <option value="image">图片文件</option>
+                        <option value="document">文档文件</option>
+                        <option value="archive">压缩文件</option>
+                        <option value="other">其他文件</option>
+                    </select>
+                    <label><input type="checkbox" id="fuzzySearch"> 模糊匹配</label>
+                </div>
+                <div class="archive-toolbar">
+                    <button type="button" id="selectToggle">选择文件</button>
+                    <select id="archiveFormat" class="sort-select">
+                        <option value="zip">ZIP</option>
+                        <option value="tar">TAR</option>
+                    </select>
+                    <button type="button" id="downloadSelected" disabled>下载选中 (0)</button>
+                    <button type="button" id="downloadAll">全部下载</button>
                 </div>
             </header>
             
@@ -488,17 +530,35 @@ def generate_index(directory):
                     <div class="stat-label">总文件数</div>
                 </div>
                 <div class="stat-item">
-                    <div class="stat-number">{sum(1 for f in files if os.path.splitext(f)[1].lower() in ['.mp4', '.avi', '.mov', '.wmv', '.flv', '.webm'])}</div>
+                    <div class="stat-number">{video_count}</div>
                     <div class="stat-label">视频文件</div>
                 </div>
                 <div class="stat-item">
-                    <div class="stat-number">{sum(1 for f in files if os.path.splitext(f)[1].lower() in ['.py', '.js', '.html', '.css', '.java', '.c', '.cpp', '.php', '.rb', '.go'])}</div>
+                    <div class="stat-number">{code_count}</div>
                     <div class="stat-label">代码文件</div>
                 </div>
+                <div class="stat-item">
+                    <div class="stat-number">{format_size(listing['total_size'])}</div>
+                    <div class="stat-label">总大小</div>
+                </div>
             </div>
             
             <!-- 访问记录区域 -->
             <div class="access-logs" id="accessLogs" style="display: none;">
+                <h2>访问统计</h2>
+                <div id="analyticsSummary" style="display: none;">
+                    <div class="trend-bars" id="hourlyTrend"></div>
+                    <div class="trend-label" id="hourlyTrendLabel"></div>
+                    <div class="trend-bars" id="dailyTrend"></div>
+                    <div class="trend-label" id="dailyTrendLabel"></div>
+                    <div class="analytics-grid">
+                        <div class="analytics-card"><h3>热门文件</h3><table class="access-table" id="topFiles"></table></div>
+                        <div class="analytics-card"><h3>活跃用户</h3><table class="access-table" id="topUsers"></table></div>
+                        <div class="analytics-card"><h3>访问最多的IP</h3><table class="access-table" id="topIps"></table></div>
+                        <div class="analytics-card"><h3>登录失败最多的IP</h3><table class="access-table" id="failedIps"></table></div>
+                        <div class="analytics-card"><h3 id="bandwidthTitle">当前下载</h3><table class="access-table" id="activeTransfers"></table></div>
+                    </div>
+                </div>
                 <h2>最近访问记录</h2>
                 <div class="access-table-container">
                     <table class="access-table">
@@ -518,49 +578,47 @@ def generate_index(directory):
                 </div>
             </div>
             
-            <div class="file-grid">
+            {dir_grid}
+            
+            <div id="searchResults" style="display: none;">
+                <p id="searchStatus" class="search-status"></p>
+                <div class="file-grid" id="searchGrid"></div>
+            </div>
+            
+            <div id="mainListing">
+            {grid_open}
 '''
     
-    # 为每个文件添加卡片
-    for file in files:
-        file_path = os.path.join(directory, file)
-        icon_class, file_type = get_file_icon(file)
-        file_size = get_file_size(file_path)
-        file_ext = os.path.splitext(file)[1].upper().replace('.', '') or '文件'
-        
-        html_content += f'''
-                <div class="file-card">
-                    <div class="file-card-header">
-                        <i class="{icon_class}"></i>
-                        <div>{file_type}</div>
-                    </div>
-                    <div class="file-card-body">
-                        <div class="file-name">{file}</div>
-                        <div class="file-meta">
-                            <span>{file_ext}</span>
-                            <span>{file_size}</span>
-                        </div>
-                    </div>
-                    <div class="file-card-footer">
-                        <a href="{file}" class="download-btn" data-filename="{file}">查看</a>
-                    </div>
-                </div>
-'''
+    # 为每个文件添加卡片（未变化的文件直接复用缓存）
+    if lazy:
+        cards, rendered = [], 0
+    else:
+        cards, rendered = render_cards(directory, entries, digests)
+    
+    # 下载后可用 sha256sum -c SHA256SUMS 校验
+    checksum_links = ''
+    if digests is not None:
+        checksum_links = f'''
+                <p>校验文件: <a href="{SUMS_FILES['sha256']}">{SUMS_FILES['sha256']}</a> | <a href="{JSON_MANIFEST_FILE}">JSON</a></p>'''
     
     # 闭合HTML标签
-    html_content += f'''
+    page_tail = f'''
+            {grid_close}
             </div>
             
             <footer>
-                <p>© 101 文件共享服务器 | 已共享 {len(files)} 个文件</p>
+                <p>© 101 文件共享服务器 | 已共享 {len(files)} 个文件</p>{checksum_links}
             </footer>
         </div>
     </div>
 
     <script>
+        // 认证接口与页面同源，使用相对地址（换IP或换端口后页面仍然有效）
+        const API_BASE = {json.dumps(API_PREFIX)};
+        
         // 检查认证状态
         function checkAuth() {{
-            fetch('http://{local_ip}:5000/check_auth', {{
+            fetch(API_BASE + '/check_auth', {{
                 method: 'GET',
                 credentials: 'include'  // 确保发送cookie
             }})
@@ -576,8 +634,10 @@ def generate_index(directory):
                     document.getElementById('fileContainer').style.display = 'block';
                     document.getElementById('userName').textContent = data.username;
                     
-                    // 设置下载链接的事件监听器
-                    setupDownloadLinks();
+                    if (LAZY_LISTING && !listing.started) {{
+                        listing.started = true;
+                        resetListing();
+                    }}
                     
                     // 如果是管理员，获取访问记录
                     if (data.username === 'admin') {{
@@ -607,7 +667,7 @@ def generate_index(directory):
             formData.append('username', username);
             formData.append('password', password);
             
-            fetch('http://{local_ip}:5000/login', {{
+            fetch(API_BASE + '/login', {{
                 method: 'POST',
                 body: formData,
                 credentials: 'include'  // 确保发送cookie
@@ -634,7 +694,7 @@ def generate_index(directory):
         
         // 退出登录
         function logout() {{
-            fetch('http://{local_ip}:5000/logout', {{
+            fetch(API_BASE + '/logout', {{
                 method: 'GET',
                 credentials: 'include'  // 确保发送cookie
             }})
@@ -646,24 +706,195 @@ def generate_index(directory):
             }});
         }}
         
-        // 文件搜索功能
-        document.querySelector('.search-box input').addEventListener('keyup', function() {{
-            const searchText = this.value.toLowerCase();
-            const fileCards = document.querySelectorAll('.file-card');
+        // 大目录：通过分页接口按需加载，只渲染可见区域内的卡片（虚拟滚动）
+        const LAZY_LISTING = {'true' if lazy else 'false'};
+        const CURRENT_DIR = {json.dumps(rel_dir, ensure_ascii=False)};
+        const CARD_ROW_HEIGHT = 305;  // 卡片高度280px + 间距25px
+        const CARD_MIN_WIDTH = 300;
+        const GRID_GAP = 25;
+        const PAGE_SIZE = 200;
+        const listing = {{
+            items: [], total: 0, cursor: null, loading: false, done: false,
+            sort: 'name', order: 'asc', prefix: '', generation: 0, started: false, range: ''
+        }};
+        
+        function escapeHtml(text) {{
+            return String(text).replace(/[&<>"']/g, c => ({{
+                '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+            }})[c]);
+        }}
+        
+        function renderCard(file) {{
+            const name = escapeHtml(file.name);
+            return `
+                <div class="file-card">
+                    <div class="file-card-header">
+                        <i class="${{file.icon}}"></i>
+                        <div>${{escapeHtml(file.type)}}</div>
+                    </div>
+                    <div class="file-card-body">
+                        <div class="file-name">${{name}}</div>
+                        <div class="file-meta">
+                            <span>${{escapeHtml(file.ext)}}</span>
+                            <span>${{file.size_str}}</span>
+                        </div>${{file.sha256 ? `
+                        <div class="file-hash" title="SHA-256">${{file.sha256}}</div>` : ''}}
+                    </div>
+                    <div class="file-card-footer">
+                        <a href="${{encodeURIComponent(file.name)}}" class="download-btn" data-filename="${{name}}">查看</a>
+                    </div>
+                </div>`;
+        }}
+        
+        function resetListing() {{
+            listing.generation++;
+            listing.items = [];
+            listing.total = 0;
+            listing.cursor = null;
+            listing.loading = false;
+            listing.done = false;
+            listing.range = '';
+            loadMoreFiles();
+        }}
+        
+        function loadMoreFiles() {{
+            if (listing.loading || listing.done) return;
+            listing.loading = true;
+            const generation = listing.generation;
+            const params = new URLSearchParams({{
+                sort: listing.sort, order: listing.order, prefix: listing.prefix, limit: PAGE_SIZE,
+                dir: CURRENT_DIR
+            }});
+            if (listing.cursor) params.append('cursor', listing.cursor);
+            
+            fetch(API_BASE + '/files?' + params.toString(), {{
+                method: 'GET',
+                credentials: 'include'
+            }})
+            .then(response => response.json())
+            .then(data => {{
+                if (generation !== listing.generation) return;  // 排序或搜索条件已改变
+                listing.loading = false;
+                if (!data.success) {{
+                    listing.done = true;
+                    return;
+                }}
+                listing.items.push(...data.files);
+                listing.total = data.total;
+                listing.cursor = data.next_cursor;
+                listing.done = !data.next_cursor;
+                renderVisibleCards();
+            }})
+            .catch(error => {{
+                listing.loading = false;
+                console.error('获取文件列表错误:', error);
+            }});
+        }}
+        
+        function renderVisibleCards() {{
+            const grid = document.getElementById('fileGrid');
+            const windowEl = document.getElementById('fileGridWindow');
+            const columns = Math.max(1, Math.floor((grid.clientWidth + GRID_GAP) / (CARD_MIN_WIDTH + GRID_GAP)));
+            const rows = Math.ceil(listing.total / columns);
+            grid.style.height = (rows * CARD_ROW_HEIGHT) + 'px';
+            
+            // 可见区域前后各多渲染两行，滚动时不会出现空白
+            const offset = -grid.getBoundingClientRect().top;
+            const firstRow = Math.max(0, Math.floor(offset / CARD_ROW_HEIGHT) - 2);
+            const lastRow = Math.min(rows, Math.ceil((offset + window.innerHeight) / CARD_ROW_HEIGHT) + 2);
+            const start = firstRow * columns;
+            const end = Math.min(listing.total, lastRow * columns);
+            if (end > listing.items.length) loadMoreFiles();
+            
+            const range = [start, Math.min(end, listing.items.length), columns].join(':');
+            if (range === listing.range) return;
+            listing.range = range;
+            windowEl.style.transform = `translateY(${{firstRow * CARD_ROW_HEIGHT}}px)`;
+            windowEl.style.gridTemplateColumns = `repeat(${{columns}}, 1fr)`;
+            windowEl.innerHTML = listing.items.slice(start, end).map(renderCard).join('');
+        }}
+        
+        let renderScheduled = false;
+        function scheduleRender() {{
+            if (!LAZY_LISTING || renderScheduled || searchActive()) return;
+            renderScheduled = true;
+            requestAnimationFrame(() => {{
+                renderScheduled = false;
+                renderVisibleCards();
+            }});
+        }}
+        window.addEventListener('scroll', scheduleRender, {{passive: true}});
+        window.addEventListener('resize', scheduleRender);
+        
+        if (LAZY_LISTING) {{
+            document.getElementById('sortSelect').addEventListener('change', function() {{
+                [listing.sort, listing.order] = this.value.split(':');
+                resetListing();
+            }});
+        }}
+        
+        // 文件搜索：输入时（防抖后）查询搜索接口，有搜索条件时用结果代替完整列表
+        const SEARCH_LIMIT = 200;
+        const searchInput = document.querySelector('.search-box input');
+        const searchState = {{ timer: null, generation: 0 }};
+        
+        function searchActive() {{
+            return document.getElementById('searchResults').style.display !== 'none';
+        }}
+        
+        function showSearchResults(active) {{
+            document.getElementById('searchResults').style.display = active ? '' : 'none';
+            document.getElementById('mainListing').style.display = active ? 'none' : '';
+            if (!active) scheduleRender();
+        }}
+        
+        function runSearch() {{
+            const query = searchInput.value.trim();
+            const type = document.getElementById('typeFilter').value;
+            const generation = ++searchState.generation;
+            if (!query && !type) {{
+                showSearchResults(false);
+                return;
+            }}
+            const params = new URLSearchParams({{ q: query, limit: SEARCH_LIMIT, dir: CURRENT_DIR }});
+            if (type) params.append('type', type);
+            if (document.getElementById('fuzzySearch').checked) params.append('fuzzy', '1');
             
-            fileCards.forEach(card => {{
-                const fileName = card.querySelector('.file-name').textContent.toLowerCase();
-                if (fileName.includes(searchText)) {{
-                    card.style.display = '';
+            fetch(API_BASE + '/search?' + params.toString(), {{
+                method: 'GET',
+                credentials: 'include'
+            }})
+            .then(response => response.json())
+            .then(data => {{
+                if (generation !== searchState.generation) return;  // 已有更新的查询
+                const status = document.getElementById('searchStatus');
+                const grid = document.getElementById('searchGrid');
+                if (!data.success) {{
+                    status.textContent = data.message;
+                    grid.innerHTML = '';
                 }} else {{
-                    card.style.display = 'none';
+                    status.textContent = data.total > data.files.length
+                        ? `找到 ${{data.total}} 个文件，显示最匹配的 ${{data.files.length}} 个`
+                        : `找到 ${{data.total}} 个文件`;
+                    grid.innerHTML = data.files.map(renderCard).join('');
                 }}
+                showSearchResults(true);
+            }})
+            .catch(error => {{
+                console.error('搜索错误:', error);
             }});
+        }}
+        
+        searchInput.addEventListener('input', function() {{
+            clearTimeout(searchState.timer);
+            searchState.timer = setTimeout(runSearch, 150);
         }});
+        document.getElementById('typeFilter').addEventListener('change', runSearch);
+        document.getElementById('fuzzySearch').addEventListener('change', runSearch);
         
         // 获取访问记录
         function fetchAccessLogs() {{
-            fetch('http://{local_ip}:5000/access_logs', {{
+            fetch(API_BASE + '/access_logs', {{
                 method: 'GET',
                 credentials: 'include'
             }})
@@ -671,6 +902,7 @@ def generate_index(directory):
             .then(data => {{
                 if (data.success) {{
                     displayAccessLogs(data.logs);
+                    fetchAnalytics();
                 }} else {{
                     console.log('无法获取访问记录:', data.message);
                 }}
@@ -705,6 +937,9 @@ def generate_index(directory):
                 else if (log.action === 'login_failed') actionText = '登录失败';
                 else if (log.action === 'logout') actionText = '退出登录';
                 else if (log.action === 'file_access') actionText = '访问文件';
+                else if (log.action === 'upload') actionText = '上传文件';
+                else if (log.action === 'archive_download') actionText = '打包下载';
+                else if (log.action === 'bandwidth_update') actionText = '修改限速';
                 actionCell.textContent = actionText;
                 
                 const fileCell = document.createElement('td');
@@ -726,45 +961,263 @@ def generate_index(directory):
             document.getElementById('accessLogs').style.display = 'block';
         }}
         
-        // 为所有下载链接添加点击事件监听器
-        function setupDownloadLinks() {{
-            document.querySelectorAll('.download-btn').forEach(link => {{
-                link.addEventListener('click', function(e) {{
-                    const filename = this.getAttribute('data-filename');
-                    
-                    // 记录文件访问
-                    fetch('http://{local_ip}:5000/log_file_access', {{
-                        method: 'POST',
-                        headers: {{
-                            'Content-Type': 'application/x-www-form-urlencoded',
-                        }},
-                        body: 'filename=' + encodeURIComponent(filename),
-                        credentials: 'include'
-                    }}).catch(error => {{
-                        console.error('记录文件访问错误:', error);
-                    }});
-                    
-                    // 允许默认行为（下载文件）
+        // 获取访问统计（服务端增量维护，只返回排行和汇总）
+        function fetchAnalytics() {{
+            fetch(API_BASE + '/analytics', {{
+                method: 'GET',
+                credentials: 'include'
+            }})
+            .then(response => response.json())
+            .then(data => {{
+                if (data.success) displayAnalytics(data);
+            }})
+            .catch(error => {{
+                console.error('获取访问统计错误:', error);
+            }});
+            fetchBandwidth();
+        }}
+        
+        // 本进程正在进行的下载及每个用户/IP的速率
+        function formatRate(bytes) {{
+            const units = ['B/s', 'KB/s', 'MB/s', 'GB/s'];
+            let i = 0;
+            while (bytes >= 1024 && i < units.length - 1) {{
+                bytes /= 1024;
+                i++;
+            }}
+            return bytes.toFixed(i ? 1 : 0) + ' ' + units[i];
+        }}
+        
+        function formatLimit(bytes) {{
+            return bytes ? formatRate(bytes) : '不限';
+        }}
+        
+        function fetchBandwidth() {{
+            fetch(API_BASE + '/bandwidth', {{
+                method: 'GET',
+                credentials: 'include'
+            }})
+            .then(response => response.json())
+            .then(data => {{
+                if (!data.success) return;
+                document.getElementById('bandwidthTitle').textContent =
+                    `当前下载（总速率 ${{formatRate(data.rate)}}，上限 ${{formatLimit(data.config.global)}}）`;
+                fillTable('activeTransfers', ['用户/IP', '连接', '速率', '上限'],
+                    data.clients.map(item => [item.client, item.transfers, formatRate(item.rate),
+                        formatLimit(item.limit)]));
+            }})
+            .catch(error => {{
+                console.error('获取下载速率错误:', error);
+            }});
+        }}
+        
+        function fillTable(tableId, headers, rows) {{
+            const table = document.getElementById(tableId);
+            table.innerHTML = '';
+            const head = document.createElement('tr');
+            headers.forEach(text => {{
+                const th = document.createElement('th');
+                th.textContent = text;
+                head.appendChild(th);
+            }});
+            table.appendChild(head);
+            if (rows.length === 0) {{
+                rows = [['暂无数据'].concat(headers.slice(1).map(() => ''))];
+            }}
+            rows.forEach(cells => {{
+                const row = document.createElement('tr');
+                cells.forEach(text => {{
+                    const td = document.createElement('td');
+                    td.textContent = text;
+                    row.appendChild(td);
                 }});
+                table.appendChild(row);
             }});
         }}
         
+        function drawTrend(barsId, labelId, items, title) {{
+            const bars = document.getElementById(barsId);
+            bars.innerHTML = '';
+            const max = Math.max(1, ...items.map(item => item.total));
+            let total = 0;
+            let failed = 0;
+            items.forEach(item => {{
+                const bar = document.createElement('div');
+                const failures = item.actions.login_failed || 0;
+                bar.style.height = (item.total / max * 100) + '%';
+                if (failures * 2 > item.total) bar.className = 'failed';
+                bar.title = item.bucket + ': ' + item.total + ' 次' + (failures ? '（登录失败 ' + failures + '）' : '');
+                bars.appendChild(bar);
+                total += item.total;
+                failed += failures;
+            }});
+            document.getElementById(labelId).textContent =
+                title + '：共 ' + total + ' 次访问，登录失败 ' + failed + ' 次';
+        }}
+        
+        function displayAnalytics(data) {{
+            drawTrend('hourlyTrend', 'hourlyTrendLabel', data.hourly, '最近' + data.hourly.length + '小时');
+            drawTrend('dailyTrend', 'dailyTrendLabel', data.daily, '最近' + data.daily.length + '天');
+            fillTable('topFiles', ['文件名', '次数'], data.top_files.map(item => [item.filename, item.count]));
+            fillTable('topUsers', ['用户', '操作', '下载', '登录失败'],
+                data.top_users.map(item => [item.username, item.count, item.downloads, item.failed_logins]));
+            fillTable('topIps', ['IP地址', '次数'], data.top_ips.map(item => [item.ip, item.count]));
+            fillTable('failedIps', ['IP地址', '失败次数'],
+                data.failed_logins.ips.map(item => [item.ip, item.count]));
+            document.getElementById('analyticsSummary').style.display = 'block';
+        }}
+        
+        // 多选打包下载：选择模式下点击文件卡片切换选中，选中状态按文件名保存（虚拟滚动重绘后保留）
+        const selectedFiles = new Set();
+        let selectMode = false;
+        
+        function updateSelectionUi() {{
+            const button = document.getElementById('downloadSelected');
+            button.textContent = `下载选中 (${{selectedFiles.size}})`;
+            button.disabled = selectedFiles.size === 0;
+        }}
+        
+        function markSelectedCards() {{
+            document.querySelectorAll('.download-btn[data-filename]').forEach(link => {{
+                link.closest('.file-card').classList.toggle(
+                    'selected', selectedFiles.has(link.getAttribute('data-filename')));
+            }});
+        }}
+        
+        document.getElementById('selectToggle').addEventListener('click', function() {{
+            selectMode = !selectMode;
+            this.classList.toggle('active', selectMode);
+            this.textContent = selectMode ? '完成选择' : '选择文件';
+            document.body.classList.toggle('selecting', selectMode);
+        }});
+        
+        // 捕获阶段处理，选择模式下不触发下载
+        document.addEventListener('click', function(e) {{
+            if (!selectMode) return;
+            const card = e.target.closest('.file-card');
+            const link = card && card.querySelector('.download-btn[data-filename]');
+            if (!link) return;
+            e.preventDefault();
+            e.stopPropagation();
+            const name = link.getAttribute('data-filename');
+            if (selectedFiles.has(name)) selectedFiles.delete(name);
+            else selectedFiles.add(name);
+            card.classList.toggle('selected', selectedFiles.has(name));
+            updateSelectionUi();
+        }}, true);
+        
+        // 卡片重新渲染后恢复选中状态
+        new MutationObserver(markSelectedCards).observe(document.getElementById('fileContainer'),
+            {{childList: true, subtree: true}});
+        
+        // 用表单提交下载，浏览器直接保存服务端流式生成的压缩包
+        function downloadArchive(names) {{
+            const form = document.createElement('form');
+            form.method = 'POST';
+            form.action = API_BASE + '/archive';
+            const fields = [['dir', CURRENT_DIR], ['format', document.getElementById('archiveFormat').value]];
+            names.forEach(name => fields.push(['files', name]));
+            fields.forEach(([key, value]) => {{
+                const input = document.createElement('input');
+                input.type = 'hidden';
+                input.name = key;
+                input.value = value;
+                form.appendChild(input);
+            }});
+            document.body.appendChild(form);
+            form.submit();
+            form.remove();
+        }}
+        
+        document.getElementById('downloadSelected').addEventListener('click', function() {{
+            downloadArchive(Array.from(selectedFiles));
+        }});
+        document.getElementById('downloadAll').addEventListener('click', function() {{
+            downloadArchive([]);
+        }});
+        
         // 页面加载时检查认证状态
         document.addEventListener('DOMContentLoaded', checkAuth);
     </script>
 </body>
 </html>'''
     
-    # 写入index.html文件
-    with open(os.path.join(directory, 'index.html'), 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    # 写入index.html文件（一次性拼接，避免反复的字符串 +=）
+    # 先写临时文件再重命名，浏览器不会读到写了一半的页面
+    write_start = time.perf_counter()
+    index_path = os.path.join(directory, 'index.html')
+    tmp_path = os.path.join(directory, '.index.html.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(page_head)
+        f.write(''.join(cards))
+        f.write(page_tail)
+    os.replace(tmp_path, index_path)
+    # 同时写入压缩版本，文件服务按 Accept-Encoding 直接发送，无需每次请求压缩
+    write_precompressed(index_path)
+    if timings is not None:
+        timings['write'] = timings.get('write', 0.0) + time.perf_counter() - write_start
+    return rendered
+
+def watch(directory, debounce=0.5, max_latency=2.0, poll_interval=2.0, **index_options):
+    """监视目录，文件变化后自动重新生成 index.html"""
+    from fs_watch import DirectoryWatcher
+    
+    def watched_directories(tree):
+        return [os.path.join(directory, *d.split('/')) if d else directory for d in tree]
     
-    print(f"已生成美化索引页面，包含 {len(files)} 个文件")
-    print(f"已隐藏以下文件: {', '.join(hidden_files)}")
-    print(f"认证服务地址: http://{local_ip}:5000")
-    print("请确保认证服务已启动: python auth.py")
+    def regenerate():
+        try:
+            tree = generate_index(directory, **index_options)
+        except OSError as e:
+            print(f"重新生成索引失败: {e}")
+            return
+        # 递归模式下新建的子目录也需要监视
+        for path in watched_directories(tree):
+            watcher.add_directory(path)
+    
+    tree = generate_index(directory, **index_options)
+    watcher = DirectoryWatcher(watched_directories(tree), regenerate, debounce=debounce,
+                               max_latency=max_latency, poll_interval=poll_interval,
+                               ignore=is_hidden)
+    print(f"正在监视目录变化（{watcher.backend}），按 Ctrl+C 退出")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='生成文件共享索引页面')
     # 如果没有指定目录，使用当前目录
-    directory = sys.argv[1] if len(sys.argv) > 1 else "."
-    generate_index(directory)
\ No newline at end of file
+    parser.add_argument('directory', nargs='?', default='.', help='共享目录')
+    parser.add_argument('--watch', action='store_true', help='监视目录变化并自动重新生成')
+    parser.add_argument('--lazy', action='store_true', default=None,
+                        help=f'不内联文件卡片，由页面分页加载（默认在文件数超过 {LAZY_THRESHOLD} 时启用）')
+    parser.add_argument('--recursive', action='store_true', help='递归索引所有子目录')
+    parser.add_argument('--max-depth', type=int, default=None, help='递归的最大深度（0 表示只索引根目录）')
+    parser.add_argument('--workers', type=int, default=8, help='并行扫描的线程数')
+    parser.add_argument('--follow-symlinks', action='store_true', help='进入符号链接指向的目录')
+    parser.add_argument('--debounce', type=float, default=0.5,
+                        help='事件停止多少秒后重新生成（合并批量复制产生的大量事件）')
+    parser.add_argument('--max-latency', type=float, default=2.0,
+                        help='从第一次变化起最多多少秒内完成重新生成')
+    parser.add_argument('--poll-interval', type=float, default=2.0,
+                        help='不支持inotify时的轮询间隔（秒）')
+    parser.add_argument('--no-hash', action='store_true', help='不计算文件的SHA-256')
+    parser.add_argument('--blake2', action='store_true', help='另外计算BLAKE2b并写入 B2SUMS')
+    parser.add_argument('--hash-workers', type=int, default=4, help='并行计算摘要的线程数')
+    args = parser.parse_args()
+    
+    index_options = {
+        'lazy': args.lazy,
+        'recursive': args.recursive,
+        'max_depth': args.max_depth,
+        'workers': args.workers,
+        'follow_symlinks': args.follow_symlinks,
+        'hash_files': not args.no_hash,
+        'hash_workers': args.hash_workers,
+        'blake2': args.blake2,
+    }
+    if args.watch:
+        watch(args.directory, args.debounce, args.max_latency, args.poll_interval, **index_options)
+    else:
+        generate_index(args.directory, **index_options)
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import marshal
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# 哈希缓存（按 文件名 -> ((inode, 大小, 修改时间ns), {算法: 摘要})），只有新增或变化的文件才重新计算
+HASH_CACHE_FILE = '.hash_cache'
+HASH_CACHE_VERSION = 1
+# 发布的校验文件（与 sha256sum/b2sum 的输出格式相同，可以直接 sha256sum -c 校验）
+SUMS_FILES = {'sha256': 'SHA256SUMS', 'blake2b': 'B2SUMS'}
+JSON_MANIFEST_FILE = 'SHA256SUMS.json'
+# 每次读取的字节数；hashlib 处理大块数据时会释放GIL，多个线程可以并行计算
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def hash_file(path, algorithms=('sha256',)):
+    """流式计算文件摘要，返回 {算法: 十六进制摘要}"""
+    hashers = [(name, hashlib.new(name)) for name in algorithms]
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            for _, h in hashers:
+                h.update(view[:n])
+    return {name: h.hexdigest() for name, h in hashers}
+
+
+def load_hash_cache(directory, algorithms=('sha256',)):
+    """加载目录的哈希缓存，版本或算法不一致时丢弃"""
+    try:
+        with open(os.path.join(directory, HASH_CACHE_FILE), 'rb') as f:
+            version, cached_algorithms, entries = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return {}
+    if version != HASH_CACHE_VERSION or not set(algorithms) <= set(cached_algorithms):
+        return {}
+    return entries
+
+
+def save_hash_cache(directory, algorithms, entries):
+    path = os.path.join(directory, HASH_CACHE_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        marshal.dump((HASH_CACHE_VERSION, tuple(algorithms), entries), f)
+    os.replace(tmp_path, path)
+
+
+def add_to_hash_cache(directory, name, st, digests):
+    """把单个文件的摘要加入目录的哈希缓存（如上传时已经算过），下次生成索引时不必重新计算
+
+    缓存要求的算法不全时不写入，留给下次生成索引时计算。
+    """
+    try:
+        with open(os.path.join(directory, HASH_CACHE_FILE), 'rb') as f:
+            version, algorithms, entries = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        version, algorithms, entries = HASH_CACHE_VERSION, tuple(digests), {}
+    if version != HASH_CACHE_VERSION or not set(algorithms) <= set(digests):
+        return False
+    entries[name] = ((st.st_ino, st.st_size, st.st_mtime_ns), {a: digests[a] for a in algorithms})
+    save_hash_cache(directory, algorithms, entries)
+    return True
+
+
+def _sums_current(directory):
+    """校验文件不早于哈希缓存（缓存被 add_to_hash_cache 单独更新后需要重写校验文件）"""
+    try:
+        manifest = os.stat(os.path.join(directory, JSON_MANIFEST_FILE)).st_mtime_ns
+        cache = os.stat(os.path.join(directory, HASH_CACHE_FILE)).st_mtime_ns
+    except OSError:
+        return False
+    return manifest >= cache
+
+
+def _write_text(path, text):
+    tmp_path = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_sums(directory, files, digests, algorithms):
+    """写入 SHA256SUMS（及 B2SUMS）和 JSON 清单"""
+    for algorithm in algorithms:
+        sums_file = SUMS_FILES.get(algorithm)
+        if sums_file is None:
+            continue
+        lines = [f"{digests[name][algorithm]}  {name}\n" for name, _, _ in files if name in digests]
+        _write_text(os.path.join(directory, sums_file), ''.join(lines))
+    manifest = {}
+    for name, size, mtime_ns in files:
+        if name in digests:
+            manifest[name] = dict(digests[name], size=size, mtime=mtime_ns // 1000000000)
+    _write_text(os.path.join(directory, JSON_MANIFEST_FILE),
+                json.dumps(manifest, ensure_ascii=False, indent=1))
+
+
+def hash_tree(directory, tree, workers=4, algorithms=('sha256',)):
+    """为目录树中的所有文件计算摘要，所有目录的文件共用一个线程池
+
+    tree 为 scan_tree 返回的 {相对路径: 目录清单}；返回 ({相对路径: {文件名: {算法: 摘要}}}, 新计算的文件数)。
+    缓存按 (inode, 大小, 修改时间) 判断文件是否变化，重新索引时只计算新增或修改过的文件。
+    """
+    results = {}
+    keys = {}
+    caches = {}
+    jobs = []
+    for rel_dir, listing in tree.items():
+        path = os.path.join(directory, *rel_dir.split('/')) if rel_dir else directory
+        cache = load_hash_cache(path, algorithms)
+        digests = {}
+        dir_keys = keys[rel_dir] = {}
+        for name, _, _ in listing['files']:
+            try:
+                st = os.stat(os.path.join(path, name))
+            except OSError:
+                continue
+            key = dir_keys[name] = (st.st_ino, st.st_size, st.st_mtime_ns)
+            hit = cache.get(name)
+            if hit is not None and tuple(hit[0]) == key:
+                digests[name] = hit[1]
+            else:
+                jobs.append((rel_dir, name, os.path.join(path, name)))
+        results[rel_dir] = digests
+        caches[rel_dir] = (path, cache)
+
+    changed = {rel_dir for rel_dir, _, _ in jobs}
+    if jobs:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(hash_file, file_path, algorithms): (rel_dir, name)
+                       for rel_dir, name, file_path in jobs}
+            for future in as_completed(futures):
+                rel_dir, name = futures[future]
+                try:
+                    results[rel_dir][name] = future.result()
+                except OSError:
+                    continue  # 计算期间被删除或没有读取权限
+
+    for rel_dir, (path, cache) in caches.items():
+        digests = results[rel_dir]
+        files = tree[rel_dir]['files']
+        if rel_dir not in changed and len(digests) == len(cache) and _sums_current(path):
+            continue  # 没有任何变化
+        # 缓存记录计算前的stat结果，计算期间被修改的文件下次会重新计算
+        entries = {name: (keys[rel_dir][name], digest) for name, digest in digests.items()}
+        try:
+            save_hash_cache(path, algorithms, entries)
+            write_sums(path, files, digests, algorithms)
+        except OSError as e:
+            print(f"写入校验文件失败 {path}: {e}")
+    return results, len(jobs)
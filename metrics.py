@@ -0,0 +1,223 @@
+import bisect
+import os
+import threading
+import time
+
+# 延迟直方图的桶上界（秒），覆盖从缓存命中到大文件读写
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 单个指标最多保留的标签组合数，超出后的新组合合并到 other（防止按文件名等标签无限增长）
+MAX_SERIES = 1000
+OTHER = '__other__'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=(), max_series=MAX_SERIES):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.max_series = max_series
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        key = tuple(labels.get(n, '') for n in self.label_names)
+        if key not in self._series and len(self._series) >= self.max_series:
+            key = (OTHER,) * len(self.label_names)
+        return key
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._series.items()]
+
+    def snapshot(self):
+        with self._lock:
+            return {','.join(key) or '': value for key, value in self._series.items()}
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """固定桶的直方图：每个标签组合保存各桶计数、总和与次数"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS, max_series=MAX_SERIES):
+        super().__init__(name, help_text, labels, max_series)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(labels)
+            series = self._series.get(key)
+            if series is None:
+                # [各桶计数..., 超出最大桶的计数, 总和, 次数]
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        result = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                result.append((self.name + '_bucket', key, cumulative, (('le', _format_value(float(bound))),)))
+            result.append((self.name + '_sum', key, series[-2]))
+            result.append((self.name + '_count', key, series[-1]))
+        return result
+
+    def snapshot(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        result = {}
+        for key, series in items:
+            count = series[-1]
+            result[','.join(key) or ''] = {
+                'count': count,
+                'sum': round(series[-2], 6),
+                'avg': round(series[-2] / count, 6) if count else 0.0,
+                'p50': self._quantile(series, 0.5),
+                'p99': self._quantile(series, 0.99),
+            }
+        return result
+
+    def _quantile(self, series, q):
+        """按桶估计分位数（返回所在桶的上界）"""
+        count = series[-1]
+        if not count:
+            return 0.0
+        target = q * count
+        cumulative = 0
+        for bound, n in zip(self.buckets, series):
+            cumulative += n
+            if cumulative >= target:
+                return bound
+        return float('inf')
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=()):
+        return self._register(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, help_text, labels, buckets)
+
+    def render_prometheus(self):
+        """Prometheus 文本格式（0.0.4）"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for sample in metric.samples():
+                name, key, value = sample[:3]
+                extra = sample[3] if len(sample) > 3 else ()
+                lines.append(f'{name}{_format_labels(metric.label_names, key, extra)} {_format_value(value)}')
+        lines.append('# HELP process_start_time_seconds 进程启动时间')
+        lines.append('# TYPE process_start_time_seconds gauge')
+        lines.append(f'process_start_time_seconds {self.started}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """JSON 快照：计数器为数值，直方图为 次数/总和/平均/p50/p99"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            'pid': os.getpid(),
+            'uptime': round(time.time() - self.started, 1),
+            'metrics': {m.name: {'type': m.kind, 'labels': list(m.label_names), 'values': m.snapshot()}
+                        for m in metrics},
+        }
+
+
+# 进程内的全局注册表（多进程部署时每个工作进程各有一份）
+registry = Registry()
+
+REQUESTS = registry.counter('http_requests_total', '按路由和状态码统计的请求数', ('route', 'method', 'status'))
+REQUEST_SECONDS = registry.histogram('http_request_duration_seconds', '按路由统计的请求耗时', ('route',))
+IN_FLIGHT = registry.gauge('http_requests_in_flight', '正在处理的请求数', ('route',))
+IO_SECONDS = registry.histogram('io_operation_duration_seconds', '文件读写等热点操作的耗时', ('operation',))
+BYTES_SENT = registry.counter('file_bytes_sent_total', '按文件统计的发送字节数', ('file',))
+INDEX_PHASE_SECONDS = registry.histogram('index_phase_duration_seconds', '生成索引各阶段的耗时', ('phase',))
+THROTTLE_SECONDS = registry.counter('bandwidth_throttle_seconds_total', '下载因限速等待的累计秒数', ('scope',))
+ACCESS_LOG_DROPPED = registry.counter('access_log_dropped_total', '后端持续写入失败时丢弃的访问记录数')
+FILE_CACHE_REQUESTS = registry.counter('file_cache_requests_total', '热点文件缓存的查询次数', ('result',))
+FILE_CACHE_BYTES = registry.gauge('file_cache_resident_bytes', '热点文件缓存占用的字节数')
+FILE_CACHE_ENTRIES = registry.gauge('file_cache_entries', '热点文件缓存中的文件数')
+FILE_CACHE_HIT_RATIO = registry.gauge('file_cache_hit_ratio', '热点文件缓存的命中率')
@@ -0,0 +1,183 @@
+import base64
+import collections
+import hashlib
+import hmac
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 密码哈希算法: scrypt 或 pbkdf2_sha256，可通过环境变量按部署调整强度
+KDF_ALGORITHM = os.environ.get('KDF_ALGORITHM', 'scrypt')
+SCRYPT_N = int(os.environ.get('SCRYPT_N', 2 ** 14))
+SCRYPT_R = int(os.environ.get('SCRYPT_R', 8))
+SCRYPT_P = int(os.environ.get('SCRYPT_P', 1))
+PBKDF2_ITERATIONS = int(os.environ.get('PBKDF2_ITERATIONS', 600000))
+# 同时进行哈希计算的线程数上限，避免登录高峰占满所有CPU
+KDF_WORKERS = int(os.environ.get('KDF_WORKERS', os.cpu_count() or 2))
+
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+# 验证结果缓存：只缓存成功的验证，失败的尝试每次都要付出完整的哈希代价
+VERIFY_CACHE_SIZE = 1024
+VERIFY_CACHE_TTL = 300
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def _b64decode(text):
+    return base64.b64decode(text.encode('ascii'))
+
+
+def _scrypt(password, salt, n, r, p):
+    # scrypt需要约 128*n*r 字节内存，maxmem 留出余量
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r + 1024 * 1024, dklen=HASH_BYTES)
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations, HASH_BYTES)
+
+
+def hash_password(password, algorithm=None, **params):
+    """生成带随机盐的密码哈希，格式如 scrypt$n$r$p$盐$哈希"""
+    algorithm = algorithm or KDF_ALGORITHM
+    salt = os.urandom(SALT_BYTES)
+    if algorithm == 'scrypt':
+        n = params.get('n', SCRYPT_N)
+        r = params.get('r', SCRYPT_R)
+        p = params.get('p', SCRYPT_P)
+        digest = _scrypt(password, salt, n, r, p)
+        return f'scrypt${n}${r}${p}${_b64encode(salt)}${_b64encode(digest)}'
+    if algorithm == 'pbkdf2_sha256':
+        iterations = params.get('iterations', PBKDF2_ITERATIONS)
+        digest = _pbkdf2(password, salt, iterations)
+        return f'pbkdf2_sha256${iterations}${_b64encode(salt)}${_b64encode(digest)}'
+    raise ValueError(f"不支持的密码哈希算法: {algorithm}")
+
+
+def is_hashed(stored):
+    """判断存储的密码是否已经是哈希（否则为旧版明文）"""
+    return isinstance(stored, str) and stored.split('$', 1)[0] in ('scrypt', 'pbkdf2_sha256')
+
+
+def _verify_uncached(password, stored):
+    if not is_hashed(stored):
+        # 旧版明文密码，使用常量时间比较
+        return hmac.compare_digest(password.encode('utf-8'), str(stored).encode('utf-8'))
+    parts = stored.split('$')
+    try:
+        if parts[0] == 'scrypt':
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            expected = _b64decode(parts[5])
+            digest = _scrypt(password, _b64decode(parts[4]), n, r, p)
+        else:
+            expected = _b64decode(parts[3])
+            digest = _pbkdf2(password, _b64decode(parts[2]), int(parts[1]))
+    except (IndexError, ValueError):
+        return False
+    return hmac.compare_digest(digest, expected)
+
+
+def needs_rehash(stored):
+    """明文密码或哈希参数与当前配置不一致时需要升级"""
+    if not is_hashed(stored):
+        return True
+    parts = stored.split('$')
+    if parts[0] != KDF_ALGORITHM:
+        return True
+    if parts[0] == 'scrypt':
+        return parts[1:4] != [str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)]
+    return parts[1] != str(PBKDF2_ITERATIONS)
+
+
+class _VerifyCache:
+    """成功验证的短期缓存，键为进程内随机密钥对(哈希, 密码)的HMAC，不保存明文"""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._key = os.urandom(32)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cache_key(self, password, stored):
+        msg = str(stored).encode('utf-8') + b'\0' + password.encode('utf-8')
+        return hmac.new(self._key, msg, hashlib.sha256).digest()
+
+    def hit(self, password, stored):
+        key = self._cache_key(password, stored)
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._entries[key]
+                return False
+            self._entries.move_to_end(key)
+            return True
+
+    def add(self, password, stored):
+        key = self._cache_key(password, stored)
+        with self._lock:
+            self._entries[key] = time.monotonic() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+_verify_cache = _VerifyCache(VERIFY_CACHE_SIZE, VERIFY_CACHE_TTL)
+_executor = ThreadPoolExecutor(max_workers=KDF_WORKERS, thread_name_prefix='kdf')
+# 用户不存在时也计算一次哈希，避免通过响应时间判断用户名是否存在
+_DUMMY_HASH = None
+
+
+def verify_password(password, stored):
+    """验证密码（在有界线程池中计算哈希，hashlib计算期间会释放GIL）"""
+    global _DUMMY_HASH
+    if password is None:
+        return False
+    if stored is None:
+        if _DUMMY_HASH is None:
+            _DUMMY_HASH = rehash_password('')
+        _executor.submit(_verify_uncached, password, _DUMMY_HASH).result()
+        return False
+    if _verify_cache.hit(password, stored):
+        return True
+    ok = _executor.submit(_verify_uncached, password, stored).result()
+    if ok:
+        _verify_cache.add(password, stored)
+    return ok
+
+
+def rehash_password(password):
+    """在同一个有界线程池中生成哈希（登录时升级旧密码用），与验证共用并发上限"""
+    return _executor.submit(hash_password, password).result()
+
+
+def migrate_users(user_store):
+    """一次性把所有明文密码升级为哈希，返回升级的用户数"""
+    users = {name: dict(info) for name, info in user_store.all().items()}
+    upgraded = 0
+    for info in users.values():
+        if not is_hashed(info.get('password')):
+            info['password'] = hash_password(str(info.get('password', '')))
+            upgraded += 1
+    if upgraded:
+        user_store.save(users)
+    return upgraded
+
+
+if __name__ == '__main__':
+    # 用法: python passwords.py migrate [users.json]
+    if len(sys.argv) < 2 or sys.argv[1] != 'migrate':
+        print("用法: python passwords.py migrate [users.json]")
+        sys.exit(1)
+    from user_store import UserStore
+    path = sys.argv[2] if len(sys.argv) > 2 else 'users.json'
+    count = migrate_users(UserStore(path))
+    print(f"已将 {count} 个用户的密码升级为 {KDF_ALGORITHM} 哈希")
@@ -0,0 +1,151 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# 同时跟踪的键（IP或 用户名+IP）数量上限，超出时丢弃最久未使用的
+DEFAULT_MAX_KEYS = 100000
+# 清理空闲键的间隔（秒）
+SWEEP_INTERVAL = 60.0
+
+
+class TokenBucketLimiter:
+    """按键的令牌桶：每秒补充 rate 个令牌，最多积累 burst 个
+
+    每个键只保存 (令牌数, 上次更新时间)，检查是O(1)；令牌已补满的键与新建的键等价，
+    定期从最久未使用的一端清理掉，内存占用只与近期活跃的键数有关。
+    """
+
+    def __init__(self, rate, burst, max_keys=DEFAULT_MAX_KEYS):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def consume(self, key, cost=1.0):
+        """尝试取出 cost 个令牌，成功返回0，否则返回需要等待的秒数"""
+        now = time.monotonic()
+        with self._lock:
+            self._maybe_sweep(now)
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                self._buckets.move_to_end(key)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            return (cost - tokens) / self.rate if self.rate > 0 else math.inf
+
+    def available(self, key):
+        """当前可用的令牌数（不消耗）"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            return min(self.burst, tokens + (now - last) * self.rate)
+
+    def refund(self, key, cost=1.0):
+        """退还令牌（不超过上限）"""
+        with self._lock:
+            state = self._buckets.get(key)
+            if state is not None:
+                self._buckets[key] = (min(self.burst, state[0] + cost), state[1])
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _maybe_sweep(self, now):
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + SWEEP_INTERVAL
+        # 令牌补满所需的时间；最久未使用的在最前面，遇到第一个仍未补满的即可停止
+        refill = self.burst / self.rate if self.rate > 0 else math.inf
+        while self._buckets:
+            key, (_, last) = next(iter(self._buckets.items()))
+            if now - last < refill:
+                break
+            del self._buckets[key]
+
+
+class LoginGuard:
+    """登录防暴力破解
+
+    - 每个IP的所有登录请求共用一个令牌桶；
+    - 每个 (用户名, IP) 的失败次数共用一个令牌桶：攻击者从别的地址猜这个账号只会耗尽自己的令牌，
+      正常用户从自己的地址仍然可以登录；
+    - 同一IP连续失败超过 backoff_after 次后进入退避，封禁时间每次翻倍，最长 backoff_max 秒，
+      登录成功后清零，并退还这次请求占用的令牌（正常用户频繁登录不会被限流）。
+    check_ip/check_user 只查字典，不读取用户数据也不写访问记录，被拒绝的请求可以直接返回429。
+    """
+
+    def __init__(self, ip_rate=0.2, ip_burst=10, user_rate=0.5, user_burst=30,
+                 backoff_after=5, backoff_base=1.0, backoff_max=300.0, max_keys=DEFAULT_MAX_KEYS):
+        self.ip_limiter = TokenBucketLimiter(ip_rate, ip_burst, max_keys)
+        self.user_failures = TokenBucketLimiter(user_rate, user_burst, max_keys)
+        self.backoff_after = backoff_after
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_keys = max_keys
+        # IP -> (连续失败次数, 封禁到期时间, 最后失败时间)，最近失败的在末尾
+        self._failures = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def check_ip(self, ip):
+        """在解析请求内容之前调用；返回需要等待的秒数，0 表示放行"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._failures.get(ip)
+            if state is not None and state[1] > now:
+                self.rejected += 1
+                return state[1] - now
+        wait = self.ip_limiter.consume(ip)
+        if wait:
+            with self._lock:
+                self.rejected += 1
+        return wait
+
+    def check_user(self, username, ip):
+        """这个IP对该用户名的失败次数已用完时返回需要等待的秒数"""
+        tokens = self.user_failures.available((username, ip))
+        if tokens >= 1:
+            return 0.0
+        with self._lock:
+            self.rejected += 1
+        return (1 - tokens) / self.user_failures.rate
+
+    def failure(self, ip, username):
+        self.user_failures.consume((username, ip))
+        now = time.monotonic()
+        with self._lock:
+            count = self._failures.pop(ip, (0, 0.0, 0.0))[0] + 1
+            blocked_until = 0.0
+            if count >= self.backoff_after:
+                delay = min(self.backoff_max, self.backoff_base * 2 ** min(count - self.backoff_after, 32))
+                blocked_until = now + delay
+            self._failures[ip] = (count, blocked_until, now)
+            # 长时间没有再失败的IP不再计入连续失败
+            while self._failures:
+                oldest, state = next(iter(self._failures.items()))
+                if len(self._failures) <= self.max_keys and now - state[2] < 2 * self.backoff_max:
+                    break
+                del self._failures[oldest]
+
+    def success(self, ip, username):
+        self.ip_limiter.refund(ip)
+        self.user_failures.reset((username, ip))
+        with self._lock:
+            self._failures.pop(ip, None)
+
+    def stats(self):
+        with self._lock:
+            return {'tracked_ips': len(self.ip_limiter), 'tracked_users': len(self.user_failures),
+                    'backoff_ips': len(self._failures), 'rejected': self.rejected}
@@ -0,0 +1,133 @@
+from collections import Counter
+from itertools import compress, repeat
+from operator import contains
+
+from generate_index import (VIDEO_EXTENSIONS, CODE_EXTENSIONS, IMAGE_EXTENSIONS,
+                            DOCUMENT_EXTENSIONS, ARCHIVE_EXTENSIONS)
+
+# 与 get_file_icon 的分类一致，供搜索接口按类型过滤
+FILE_CATEGORIES = {
+    'video': VIDEO_EXTENSIONS,
+    'code': CODE_EXTENSIONS,
+    'image': IMAGE_EXTENSIONS,
+    'document': DOCUMENT_EXTENSIONS,
+    'archive': ARCHIVE_EXTENSIONS,
+}
+_CATEGORY_BY_EXT = {ext: category for category, exts in FILE_CATEGORIES.items() for ext in exts}
+CATEGORIES = tuple(FILE_CATEGORIES) + ('other',)
+
+# 模糊搜索时至少要有这个比例的查询三元组出现在文件名中
+FUZZY_THRESHOLD = 0.5
+
+
+def file_category(ext):
+    """按扩展名（小写，带点）返回文件分类"""
+    return _CATEGORY_BY_EXT.get(ext, 'other')
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """文件名的三元组倒排索引（不区分大小写），支持增量添加和删除
+
+    子串搜索：取查询中所有三元组的倒排集合求交集，再逐个确认确实包含查询串；
+    查询不足三个字符时退化为遍历所有文件名。
+    模糊搜索：按文件名与查询共有的三元组比例打分（类似 pg_trgm 的相似度）。
+    """
+
+    def __init__(self, names=()):
+        self._ids = {}
+        self._names = []    # id -> 小写文件名，删除后为空串
+        self._originals = []
+        self._free = []
+        self._postings = {}
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, name):
+        return name in self._ids
+
+    def add(self, name):
+        if name in self._ids:
+            return
+        lowered = name.lower()
+        if self._free:
+            doc_id = self._free.pop()
+            self._names[doc_id] = lowered
+            self._originals[doc_id] = name
+        else:
+            doc_id = len(self._names)
+            self._names.append(lowered)
+            self._originals.append(name)
+        self._ids[name] = doc_id
+        for gram in trigrams(lowered):
+            posting = self._postings.get(gram)
+            if posting is None:
+                self._postings[gram] = {doc_id}
+            else:
+                posting.add(doc_id)
+
+    def remove(self, name):
+        doc_id = self._ids.pop(name, None)
+        if doc_id is None:
+            return
+        for gram in trigrams(self._names[doc_id]):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(doc_id)
+                if not posting:
+                    del self._postings[gram]
+        self._names[doc_id] = ''
+        self._originals[doc_id] = None
+        self._free.append(doc_id)
+
+    def substring(self, query):
+        """返回文件名包含 query 的所有文件名（原始大小写）"""
+        query = query.lower()
+        names = self._names
+        originals = self._originals
+        if not query:
+            return list(self._ids)
+        if len(query) < 3:
+            # 逐个比较全部文件名（compress/map 在C层循环，十万个文件名也只需几毫秒）
+            return list(compress(originals, map(contains, names, repeat(query))))
+        postings = []
+        for gram in trigrams(query):
+            posting = self._postings.get(gram)
+            if posting is None:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+        candidates = postings[0].intersection(*postings[1:])
+        if len(query) == 3:
+            return [originals[i] for i in candidates]  # 只有一个三元组时不需要再确认
+        return [originals[i] for i in candidates if query in names[i]]
+
+    def fuzzy(self, query, threshold=FUZZY_THRESHOLD):
+        """返回 [(相似度, 文件名)]，按相似度从高到低排列"""
+        query = query.lower()
+        grams = trigrams(query)
+        if not grams:
+            return [(1.0, name) for name in self.substring(query)]
+        counts = Counter()
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is not None:
+                counts.update(posting)
+        needed = max(1, int(len(grams) * threshold + 0.999))
+        names = self._names
+        originals = self._originals
+        results = []
+        for doc_id, shared in counts.items():
+            if shared < needed:
+                continue
+            # 相似度 = 共有三元组 / 两者三元组的并集（近似为查询三元组数 + 文件名长度）
+            union = len(grams) + max(0, len(names[doc_id]) - 2) - shared
+            results.append((shared / union, originals[doc_id]))
+        results.sort(key=lambda item: (-item[0], item[1]))
+        return results
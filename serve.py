@@ -0,0 +1,321 @@
+import argparse
+import os
+import posixpath
+import signal
+import socket
+import sys
+import threading
+from http import HTTPStatus
+from http.cookies import CookieError, SimpleCookie
+from urllib.parse import quote, unquote, urlsplit
+
+from file_server import FileRequestHandler, ThreadPoolHTTPServer
+from generate_index import API_PREFIX
+
+
+class _BodyReader:
+    """按 Content-Length 限制读取请求体，处理完后丢弃未读部分以便复用连接"""
+
+    def __init__(self, rfile, length):
+        self._rfile = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self._rfile.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self._rfile.readline(size)
+        self.remaining -= len(data)
+        return data
+
+    def readlines(self, hint=-1):
+        return list(iter(self.readline, b''))
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def drain(self):
+        while self.read(64 * 1024):
+            pass
+
+
+class AppRequestHandler(FileRequestHandler):
+    """API_PREFIX 下的请求交给 Flask 应用，其余 GET/HEAD 按静态文件处理"""
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_HEAD(self):
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    def do_PUT(self):
+        self.dispatch()
+
+    def do_DELETE(self):
+        self.dispatch()
+
+    def do_OPTIONS(self):
+        self.dispatch()
+
+    def client_identity(self, full=False):
+        """签名链接按链接中的用户名限速；只有配置了每用户或按角色的限速（full）时才查角色和会话，其余按IP"""
+        if not full:
+            return super().client_identity()
+        if self.signed_user is not None:
+            return self.signed_user, self.server.user_role(self.signed_user)
+        try:
+            cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        except CookieError:
+            cookie = {}
+        morsel = cookie.get(self.server.app.config['SESSION_COOKIE_NAME'])
+        user = self.server.identify(morsel.value) if morsel is not None else None
+        if user is None:
+            return super().client_identity()
+        return user
+
+    def unsigned_request(self, url_path):
+        """没有有效签名时转到认证服务签发链接（已登录则记录访问后重定向回带签名的地址）"""
+        rel_path = posixpath.normpath(unquote(url_path)).lstrip('/')
+        self.send_response(HTTPStatus.FOUND)
+        self.send_header('Location', f'{API_PREFIX}/download?path={quote(rel_path)}')
+        self.send_header('Cache-Control', 'no-store')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def dispatch(self):
+        path = urlsplit(self.path).path
+        if path == API_PREFIX or path.startswith(API_PREFIX + '/'):
+            self.run_wsgi()
+        elif self.command in ('GET', 'HEAD'):
+            self.handle_file_request(send_body=self.command == 'GET')
+        else:
+            self.send_error(HTTPStatus.METHOD_NOT_ALLOWED)
+
+    def run_wsgi(self):
+        """把当前请求交给 WSGI 应用处理"""
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            # 不支持分块编码的请求体
+            self.send_error(HTTPStatus.LENGTH_REQUIRED)
+            self.close_connection = True
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self.send_error(HTTPStatus.BAD_REQUEST)
+            return
+        body = _BodyReader(self.rfile, length)
+        url = urlsplit(self.path)
+        environ = {
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': self.server.multiprocess,
+            'wsgi.run_once': False,
+            'REQUEST_METHOD': self.command,
+            # 应用挂载在 API_PREFIX 下，路由本身不含前缀
+            'SCRIPT_NAME': API_PREFIX,
+            'PATH_INFO': unquote(url.path[len(API_PREFIX):], 'latin-1'),
+            'QUERY_STRING': url.query,
+            'SERVER_NAME': self.server.server_name,
+            'SERVER_PORT': str(self.server.server_port),
+            'SERVER_PROTOCOL': self.request_version,
+            'REMOTE_ADDR': self.client_address[0],
+            'REMOTE_PORT': str(self.client_address[1]),
+            'CONTENT_TYPE': self.headers.get('Content-Type', ''),
+            'CONTENT_LENGTH': str(length) if length else '',
+        }
+        for key, value in self.headers.items():
+            key = 'HTTP_' + key.upper().replace('-', '_')
+            if key in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+                continue
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+
+        state = {'status': None, 'headers': None, 'sent': False, 'chunked': False}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and state['sent']:
+                raise exc_info[1].with_traceback(exc_info[2])
+            state['status'] = status
+            state['headers'] = headers
+            return write
+
+        def send_headers():
+            code, _, reason = state['status'].partition(' ')
+            self.send_response(int(code), reason)
+            has_length = False
+            for name, value in state['headers']:
+                if name.lower() == 'content-length':
+                    has_length = True
+                self.send_header(name, value)
+            if not has_length and self.command != 'HEAD' and int(code) not in (204, 304):
+                # 流式响应（如打包下载）使用分块传输，连接仍可复用
+                self.send_header('Transfer-Encoding', 'chunked')
+                state['chunked'] = True
+            self.end_headers()
+            state['sent'] = True
+
+        def write(data):
+            if not state['sent']:
+                send_headers()
+            if not data or self.command == 'HEAD':
+                return
+            if state['chunked']:
+                # 每段限速后作为一个分块发送
+                view = memoryview(data)
+                while view:
+                    n = self.transfer.throttle(len(view))
+                    self.wfile.write(b'%x\r\n' % n)
+                    self.wfile.write(view[:n])
+                    self.wfile.write(b'\r\n')
+                    view = view[n:]
+            else:
+                self.write_body(data)
+
+        result = self.server.app(environ, start_response)
+        try:
+            for data in result:
+                write(data)
+            if not state['sent']:
+                send_headers()
+            if state['chunked']:
+                self.wfile.write(b'0\r\n\r\n')
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        body.drain()
+
+
+class AppServer(ThreadPoolHTTPServer):
+    """在文件服务器上挂载 WSGI 应用"""
+
+    def __init__(self, server_address, handler_class, root, app, workers=64, verbose=False,
+                 multiprocess=False, bind_and_activate=True, bandwidth=None, identify=None, url_signer=None,
+                 user_role=None):
+        self.app = app
+        self.multiprocess = multiprocess
+        # 按会话ID查找 (用户名, 角色)，未登录或会话无效时返回None
+        self.identify = identify or (lambda sid: None)
+        # 按用户名查找角色（签名链接中只有用户名）
+        self.user_role = user_role or (lambda username: None)
+        super().__init__(server_address, handler_class, root, workers, verbose, bind_and_activate,
+                         bandwidth, url_signer)
+
+
+def load_app():
+    """在工作进程中导入 Flask 应用（各进程各自启动后台线程）"""
+    import auth
+    return auth
+
+
+def run_worker(sock, directory, threads, verbose, multiprocess, grace):
+    """单个工作进程：在共享的监听套接字上提供服务，收到信号后优雅退出"""
+    auth = load_app()
+    server = AppServer(sock.getsockname()[:2], AppRequestHandler, directory, auth.app, threads,
+                       verbose, multiprocess, bind_and_activate=False,
+                       bandwidth=auth.bandwidth, identify=auth.session_user, url_signer=auth.url_signer,
+                       user_role=auth.user_role)
+    server.socket.close()
+    server.socket = sock
+    server.server_name = sock.getsockname()[0]
+    server.server_port = sock.getsockname()[1]
+
+    shutdown_thread = threading.Thread(target=server.graceful_shutdown, args=(grace,), daemon=True)
+
+    def stop(signum, frame):
+        if not shutdown_thread.is_alive() and not server.closing:
+            shutdown_thread.start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    server.serve_forever()
+    # 等待进行中的请求完成后写入剩余的访问记录
+    if shutdown_thread.ident is not None:
+        shutdown_thread.join()
+    auth.access_store.close()
+    auth.access_analytics.close()
+    auth.session_store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='认证接口与文件共享的统一服务')
+    parser.add_argument('directory', nargs='?', default='.', help='共享目录')
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    parser.add_argument('--port', type=int, default=8000, help='监听端口')
+    parser.add_argument('--workers', type=int, default=1, help='工作进程数（Windows上固定为1）')
+    parser.add_argument('--threads', type=int, default=64, help='每个工作进程处理连接的线程数')
+    parser.add_argument('--grace', type=float, default=30.0, help='退出时等待进行中请求的最长秒数')
+    parser.add_argument('--verbose', action='store_true', help='打印每个请求的日志')
+    args = parser.parse_args()
+
+    os.environ.setdefault('SHARE_DIRECTORY', args.directory)
+    sock = socket.create_server((args.host, args.port), backlog=1024)
+    workers = args.workers if hasattr(os, 'fork') else 1
+    print(f"服务已启动: http://{args.host}:{args.port}/ （目录: {os.path.abspath(args.directory)}，"
+          f"{workers} 个工作进程 x {args.threads} 线程）")
+
+    if workers <= 1:
+        run_worker(sock, args.directory, args.threads, args.verbose, False, args.grace)
+        return
+
+    # 多进程：各进程的访问记录写入同一个追加文件，最近记录从文件读取
+    os.environ['ACCESS_LOG_SHARED'] = '1'
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(sock, args.directory, args.threads, args.verbose, True, args.grace)
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            print(f"工作进程 {pid} 异常退出（状态 {status}），重新启动")
+            spawn()
+    sock.close()
+    print("服务已停止")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+# 会话空闲多久后失效（秒）
+DEFAULT_IDLE_TIMEOUT = 2 * 60 * 60
+# 同时保存的会话数上限，超出时淘汰最久未使用的会话
+DEFAULT_MAX_SESSIONS = 10000
+# SQLite 后端最多每隔多久更新一次最后访问时间（避免每个请求都写数据库）
+TOUCH_INTERVAL = 60
+# SQLite 后端清理过期会话的间隔
+PURGE_INTERVAL = 300
+
+
+def new_session_id():
+    return secrets.token_urlsafe(32)
+
+
+class MemorySessionStore:
+    """进程内的会话存储：按最后访问时间排序的有序字典，同时实现空闲超时和LRU淘汰"""
+
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT, max_sessions=DEFAULT_MAX_SESSIONS):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        # 会话ID -> 会话记录，最近访问的在末尾
+        self._sessions = OrderedDict()
+        # 用户名 -> 会话ID集合，用于强制下线
+        self._by_user = {}
+
+    def get(self, sid):
+        """返回 (会话数据, 最后访问时间)，不存在或已过期时返回None"""
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            record = self._sessions.get(sid)
+            if record is None:
+                return None
+            return dict(record['data']), record['last_seen']
+
+    def save(self, sid, data, ip=None):
+        now = time.time()
+        with self._lock:
+            old = self._sessions.pop(sid, None)
+            if old is not None:
+                self._unlink(sid, old['username'])
+            username = data.get('username')
+            self._sessions[sid] = {
+                'data': dict(data),
+                'username': username,
+                'created': old['created'] if old else now,
+                'last_seen': now,
+                'ip': ip,
+            }
+            if username is not None:
+                self._by_user.setdefault(username, set()).add(sid)
+            while len(self._sessions) > self.max_sessions:
+                evicted, record = self._sessions.popitem(last=False)
+                self._unlink(evicted, record['username'])
+
+    def touch(self, sid, last_seen=None):
+        with self._lock:
+            record = self._sessions.get(sid)
+            if record is not None:
+                record['last_seen'] = time.time()
+                self._sessions.move_to_end(sid)
+
+    def delete(self, sid):
+        with self._lock:
+            record = self._sessions.pop(sid, None)
+            if record is not None:
+                self._unlink(sid, record['username'])
+
+    def revoke_user(self, username):
+        """删除用户的所有会话，返回删除的数量"""
+        with self._lock:
+            sids = self._by_user.pop(username, set())
+            for sid in sids:
+                self._sessions.pop(sid, None)
+            return len(sids)
+
+    def sessions(self):
+        with self._lock:
+            self._purge(time.time())
+            return [{'username': r['username'], 'created': r['created'],
+                     'last_seen': r['last_seen'], 'ip': r['ip']}
+                    for r in reversed(self._sessions.values())]
+
+    def close(self):
+        pass
+
+    def _unlink(self, sid, username):
+        sids = self._by_user.get(username)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._by_user[username]
+
+    def _purge(self, now):
+        # 最久未访问的会话在最前面，只需从头检查到第一个未过期的会话
+        while self._sessions:
+            sid, record = next(iter(self._sessions.items()))
+            if now - record['last_seen'] <= self.idle_timeout:
+                break
+            del self._sessions[sid]
+            self._unlink(sid, record['username'])
+
+
+class SqliteSessionStore:
+    """SQLite（WAL模式）会话存储：重启后会话仍然有效，多个工作进程共享，强制下线立即生效"""
+
+    def __init__(self, path, idle_timeout=DEFAULT_IDLE_TIMEOUT, max_sessions=DEFAULT_MAX_SESSIONS):
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self._db_lock = threading.Lock()
+        self._next_purge = 0.0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'sid TEXT PRIMARY KEY, username TEXT, data TEXT, created REAL, last_seen REAL, ip TEXT)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS sessions_username ON sessions (username)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)')
+        self._conn.commit()
+
+    def get(self, sid):
+        now = time.time()
+        with self._db_lock:
+            self._maybe_purge(now)
+            row = self._conn.execute(
+                'SELECT data, last_seen FROM sessions WHERE sid = ?', (sid,)
+            ).fetchone()
+        if row is None or now - row[1] > self.idle_timeout:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def save(self, sid, data, ip=None):
+        now = time.time()
+        with self._db_lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO sessions (sid, username, data, created, last_seen, ip) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(sid) DO UPDATE SET username = excluded.username, data = excluded.data, '
+                'last_seen = excluded.last_seen, ip = excluded.ip',
+                (sid, data.get('username'), json.dumps(data, ensure_ascii=False), now, now, ip)
+            )
+
+    def touch(self, sid, last_seen=None):
+        now = time.time()
+        if last_seen is not None and now - last_seen < min(TOUCH_INTERVAL, self.idle_timeout / 10):
+            return
+        with self._db_lock, self._conn:
+            self._conn.execute('UPDATE sessions SET last_seen = ? WHERE sid = ?', (now, sid))
+
+    def delete(self, sid):
+        with self._db_lock, self._conn:
+            self._conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def revoke_user(self, username):
+        with self._db_lock, self._conn:
+            return self._conn.execute('DELETE FROM sessions WHERE username = ?', (username,)).rowcount
+
+    def sessions(self):
+        with self._db_lock:
+            rows = self._conn.execute(
+                'SELECT username, created, last_seen, ip FROM sessions WHERE last_seen >= ? '
+                'ORDER BY last_seen DESC', (time.time() - self.idle_timeout,)
+            ).fetchall()
+        return [{'username': r[0], 'created': r[1], 'last_seen': r[2], 'ip': r[3]} for r in rows]
+
+    def close(self):
+        with self._db_lock:
+            self._conn.close()
+
+    def _maybe_purge(self, now):
+        """定期删除过期会话，并把会话数控制在上限以内（删除最久未访问的）"""
+        if now < self._next_purge:
+            return
+        self._next_purge = now + PURGE_INTERVAL
+        with self._conn:
+            self._conn.execute('DELETE FROM sessions WHERE last_seen < ?', (now - self.idle_timeout,))
+            self._conn.execute(
+                'DELETE FROM sessions WHERE sid IN (SELECT sid FROM sessions ORDER BY last_seen DESC '
+                'LIMIT -1 OFFSET ?)', (self.max_sessions,)
+            )
+
+
+def create_session_store(kind, path, idle_timeout=DEFAULT_IDLE_TIMEOUT, max_sessions=DEFAULT_MAX_SESSIONS):
+    if kind == 'sqlite':
+        return SqliteSessionStore(path, idle_timeout, max_sessions)
+    if kind == 'memory':
+        return MemorySessionStore(idle_timeout, max_sessions)
+    raise ValueError(f"未知的会话存储类型: {kind}")
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """服务端会话，Cookie 中只保存随机的会话ID"""
+
+    def __init__(self, initial=None, sid=None, last_seen=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = sid is None
+        self.last_seen = last_seen
+        self.modified = False
+        self.rotate = False
+
+    def regenerate(self):
+        """更换会话ID（登录成功后调用，防止会话固定攻击）"""
+        self.rotate = True
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    """把 Flask 的会话保存在服务端存储中
+
+    没有内容的会话不会写入存储，未登录的访问不占用内存；
+    会话内容不变时只更新最后访问时间，Set-Cookie 只在会话ID变化时发送。
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            record = self.store.get(sid)
+            if record is not None:
+                data, last_seen = record
+                return ServerSession(data, sid, last_seen)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        response.vary.add('Cookie')
+
+        if not session:
+            if session.sid is not None:
+                # 退出登录（会话被清空）或会话已失效
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.sid is None or session.rotate:
+            if session.sid is not None:
+                self.store.delete(session.sid)
+            session.sid = new_session_id()
+            self.store.save(session.sid, dict(session), request.remote_addr)
+            response.set_cookie(
+                name, session.sid,
+                httponly=self.get_cookie_httponly(app),
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+                domain=domain,
+                path=path,
+            )
+        elif session.modified:
+            self.store.save(session.sid, dict(session), request.remote_addr)
+        else:
+            self.store.touch(session.sid, session.last_seen)
+
@@ -0,0 +1,287 @@
+import base64
+import bisect
+import heapq
+import json
+import os
+import threading
+import time
+from itertools import repeat
+
+from generate_index import scan_directory, get_file_icon, format_size
+from hashing import load_hash_cache
+from search_index import TrigramIndex, CATEGORIES, file_category
+
+SORT_KEYS = ('name', 'size', 'mtime', 'type')
+MAX_PAGE_SIZE = 500
+
+
+def _sort_key(entry, sort):
+    """排序键，最后都以小写文件名和原文件名兜底，保证顺序稳定且唯一"""
+    name = entry['name']
+    if sort == 'size':
+        return (entry['size'], name.lower(), name)
+    if sort == 'mtime':
+        return (entry['mtime_ns'], name.lower(), name)
+    if sort == 'type':
+        return (entry['ext'], name.lower(), name)
+    return (name.lower(), name)
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """解析游标，格式错误时返回None"""
+    try:
+        return tuple(json.loads(base64.urlsafe_b64decode(cursor.encode('ascii'))))
+    except (ValueError, TypeError):
+        return None
+
+
+class ShareIndex:
+    """共享目录的内存索引，提供按游标分页、排序和前缀过滤的文件列表
+
+    目录的mtime变化（新增/删除/重命名）时立即重新扫描；文件内容修改不改变目录mtime，
+    所以另外每隔 rescan_interval 秒完整扫描一次。
+    """
+
+    def __init__(self, directory, root=None, check_interval=1.0, rescan_interval=30.0):
+        self.directory = directory
+        # 共享目录的根，指向它之外的符号链接不出现在索引中
+        self.real_root = os.path.realpath(directory if root is None else root)
+        self.check_interval = check_interval
+        self.rescan_interval = rescan_interval
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._views = {}
+        self._search = TrigramIndex()
+        self._dir_mtime = None
+        self._next_check = 0.0
+        self._last_scan = 0.0
+        self.refresh()
+
+    def refresh(self):
+        """重新扫描目录，返回 (新增, 删除, 修改) 的文件名集合"""
+        try:
+            dir_mtime = os.stat(self.directory).st_mtime_ns
+            scanned = scan_directory(self.directory, self.real_root)
+        except OSError:
+            dir_mtime, scanned = None, []
+        # generate_index 计算的摘要，文件大小和修改时间一致时才采用
+        hashes = load_hash_cache(self.directory)
+        entries = {}
+        for name, size, mtime_ns in scanned:
+            hit = hashes.get(name)
+            sha256 = hit[1].get('sha256') if hit and tuple(hit[0][1:]) == (size, mtime_ns) else None
+            entries[name] = _make_entry(name, size, mtime_ns, sha256)
+        with self._lock:
+            old = self._entries
+            added = entries.keys() - old.keys()
+            removed = old.keys() - entries.keys()
+            changed = {name for name in entries.keys() & old.keys()
+                       if (entries[name]['size'], entries[name]['mtime_ns'], entries[name]['sha256']) !=
+                          (old[name]['size'], old[name]['mtime_ns'], old[name]['sha256'])}
+            if added or removed or changed:
+                self._entries = entries
+                self._views = {}
+                # 搜索索引只需要增量处理新增和删除的文件名
+                for name in removed:
+                    self._search.remove(name)
+                for name in added:
+                    self._search.add(name)
+            self._dir_mtime = dir_mtime
+            self._last_scan = time.monotonic()
+        return added, removed, changed
+
+    def add_file(self, name, sha256=None):
+        """增量加入单个新文件（如上传完成），不重新扫描目录
+
+        已缓存的排序视图用二分插入更新；目录mtime同步为当前值，避免随后触发完整扫描。
+        """
+        try:
+            st = os.stat(os.path.join(self.directory, name))
+            dir_mtime = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            return None
+        entry = _make_entry(name, st.st_size, st.st_mtime_ns, sha256)
+        with self._lock:
+            old = self._entries.get(name)
+            entries = dict(self._entries)
+            entries[name] = entry
+            self._entries = entries
+            if old is None:
+                self._search.add(name)
+                views = {}
+                for sort, (keys, items) in self._views.items():
+                    key = _sort_key(entry, sort)
+                    i = bisect.bisect_left(keys, key)
+                    # 生成新列表而不是原地插入，正在分页读取旧视图的请求不受影响
+                    views[sort] = (keys[:i] + [key] + keys[i:], items[:i] + [entry] + items[i:])
+                self._views = views
+            else:
+                self._views = {}
+            self._dir_mtime = dir_mtime
+        return entry
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        try:
+            dir_mtime = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            dir_mtime = None
+        if dir_mtime != self._dir_mtime or now - self._last_scan >= self.rescan_interval:
+            self.refresh()
+
+    def _view(self, sort):
+        """按排序方式缓存的 (排序键列表, 条目列表)，目录变化后重建"""
+        with self._lock:
+            view = self._views.get(sort)
+            if view is None:
+                items = sorted(self._entries.values(), key=lambda e: _sort_key(e, sort))
+                view = ([_sort_key(e, sort) for e in items], items)
+                self._views[sort] = view
+            return view
+
+    def __len__(self):
+        self._maybe_refresh()
+        return len(self._entries)
+
+    def get(self, name):
+        self._maybe_refresh()
+        return self._entries.get(name)
+
+    def names(self):
+        """按名称排序的全部文件名"""
+        self._maybe_refresh()
+        _, items = self._view('name')
+        return [entry['name'] for entry in items]
+
+    def list(self, sort='name', order='asc', prefix='', limit=100, cursor=None):
+        """返回一页文件 (条目列表, 符合条件的总数, 下一页游标或None)"""
+        self._maybe_refresh()
+        if sort not in SORT_KEYS:
+            raise ValueError(f"不支持的排序方式: {sort}")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        keys, items = self._view(sort)
+        prefix = prefix.lower()
+
+        if prefix and sort == 'name':
+            # 按名称排序时前缀匹配的文件是连续的一段，直接二分定位
+            lo = bisect.bisect_left(keys, (prefix,))
+            hi = bisect.bisect_left(keys, (prefix + '\U0010ffff',))
+            total = hi - lo
+        else:
+            lo, hi = 0, len(items)
+            total = (sum(1 for e in items if e['name'].lower().startswith(prefix))
+                     if prefix else len(items))
+
+        descending = order == 'desc'
+        if cursor is not None:
+            position = decode_cursor(cursor)
+            if position is None:
+                raise ValueError("无效的分页游标")
+            try:
+                if descending:
+                    hi = max(lo, bisect.bisect_left(keys, position, lo, hi))
+                else:
+                    lo = min(hi, bisect.bisect_right(keys, position, lo, hi))
+            except TypeError:
+                raise ValueError("分页游标与排序方式不匹配")
+
+        page = []
+        indices = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+        last = None
+        for i in indices:
+            entry = items[i]
+            if prefix and not entry['name'].lower().startswith(prefix):
+                continue
+            page.append(entry)
+            last = i
+            if len(page) >= limit:
+                break
+
+        more = last is not None and (last > lo if descending else last < hi - 1) and len(page) >= limit
+        next_cursor = encode_cursor(list(keys[last])) if more else None
+        return page, total, next_cursor
+
+    def search(self, query='', fuzzy=False, category=None, min_size=None, max_size=None,
+               after=None, before=None, limit=50):
+        """按文件名搜索并按类型、大小（字节）、修改时间（Unix秒）过滤，返回 (条目列表, 匹配总数)
+
+        子串匹配按 前缀匹配优先、匹配位置、文件名长度 排序；模糊匹配按三元组相似度排序，
+        包含查询串的文件名始终排在前面；没有查询串时按文件名排序。
+        """
+        self._maybe_refresh()
+        if category and category not in CATEGORIES:
+            raise ValueError(f"不支持的文件类型: {category}")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        query = query.strip()
+        lowered = query.lower()
+        with self._lock:
+            entries = self._entries
+            if not query:
+                names = None
+            elif fuzzy:
+                names = scores = {name: score for score, name in self._search.fuzzy(query)}
+            else:
+                names = self._search.substring(query)
+        after_ns = None if after is None else int(after * 1000000000)
+        before_ns = None if before is None else int(before * 1000000000)
+        filtered = (category or min_size is not None or max_size is not None or
+                    after_ns is not None or before_ns is not None)
+
+        def accept(e):
+            return ((not category or e['category'] == category) and
+                    (min_size is None or e['size'] >= min_size) and
+                    (max_size is None or e['size'] <= max_size) and
+                    (after_ns is None or e['mtime_ns'] >= after_ns) and
+                    (before_ns is None or e['mtime_ns'] <= before_ns))
+
+        if names is None:
+            _, items = self._view('name')
+            if not filtered:
+                return items[:limit], len(items)
+            matches = [e for e in items if accept(e)]
+            return matches[:limit], len(matches)
+
+        if filtered:
+            names = [n for n in names if accept(entries[n])]
+        if fuzzy:
+            ranked = heapq.nsmallest(limit, names, key=lambda n: (lowered not in n.lower(), -scores[n], n.lower()))
+        else:
+            # 排序键 (匹配位置, 长度, 小写名)：位置为0即前缀匹配；用 map/zip 构造，避免逐个调用Python函数
+            lowers = list(map(str.lower, names))
+            ranked = [item[3] for item in heapq.nsmallest(
+                limit, zip(map(str.find, lowers, repeat(lowered)), map(len, lowers), lowers, names))]
+        return [entries[n] for n in ranked], len(names)
+
+
+def _make_entry(name, size, mtime_ns, sha256=None):
+    ext = os.path.splitext(name)[1].lower()
+    return {
+        'name': name,
+        'size': size,
+        'mtime_ns': mtime_ns,
+        'ext': ext,
+        'category': file_category(ext),
+        'sha256': sha256,
+    }
+
+
+def entry_to_json(entry):
+    """把索引条目转换为接口返回的格式"""
+    icon_class, file_type = get_file_icon(entry['name'])
+    return {
+        'name': entry['name'],
+        'size': entry['size'],
+        'size_str': format_size(entry['size']),
+        'mtime': entry['mtime_ns'] // 1000000000,
+        'ext': entry['ext'].upper().replace('.', '') or '文件',
+        'icon': icon_class,
+        'type': file_type,
+        'sha256': entry.get('sha256'),
+    }
@@ -0,0 +1,89 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from urllib.parse import parse_qs, quote, urlencode
+
+# 签名密钥文件：首次使用时随机生成，多个工作进程和独立的文件服务共用
+SIGNING_KEY_FILE = 'download.key'
+# 下载链接的有效期（秒）；只在每次请求开始时检查，进行中的下载不会被中断
+DEFAULT_TTL = int(os.environ.get('DOWNLOAD_URL_TTL', 12 * 60 * 60))
+# 链接是否绑定签发时的客户端IP（客户端经过出口IP会变化的代理时设为0）
+BIND_IP = os.environ.get('DOWNLOAD_BIND_IP', '1') == '1'
+
+
+def load_signing_key(path=SIGNING_KEY_FILE):
+    """读取签名密钥，不存在时生成；环境变量 DOWNLOAD_SIGNING_KEY 优先"""
+    env_key = os.environ.get('DOWNLOAD_SIGNING_KEY')
+    if env_key:
+        return env_key.encode('utf-8')
+    try:
+        with open(path, 'rb') as f:
+            key = f.read().strip()
+        if key:
+            return key
+    except FileNotFoundError:
+        pass
+    # 先写临时文件再硬链接到目标位置：多个进程同时启动时只有一个成功，其余读取它写入的密钥
+    key = secrets.token_urlsafe(32).encode('ascii')
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(key)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            with open(path, 'rb') as f:
+                key = f.read().strip()
+    finally:
+        os.remove(tmp_path)
+    return key
+
+
+class UrlSigner:
+    """无状态的下载链接签名：HMAC-SHA256(路径, 用户名, 过期时间, 客户端IP)
+
+    认证服务在用户点击下载时签发链接，文件服务只需重新计算一次HMAC并做常数时间比较，
+    不查询会话或任何存储，视频的每个Range请求开销都很小。
+    """
+
+    def __init__(self, key, ttl=DEFAULT_TTL, bind_ip=BIND_IP):
+        self.key = key
+        self.ttl = ttl
+        self.bind_ip = bind_ip
+
+    def sign(self, path, username, ip=None, now=None):
+        """为URL路径（未编码，以/开头）签发链接，返回带签名参数的URL"""
+        expires = int((time.time() if now is None else now) + self.ttl)
+        params = {'u': username, 'e': str(expires)}
+        if self.bind_ip:
+            params['b'] = '1'
+        params['s'] = self._mac(path, username, expires, ip if self.bind_ip else '')
+        return quote(path) + '?' + urlencode(params)
+
+    def verify(self, path, query, ip, now=None):
+        """校验请求的签名参数，有效时返回用户名，否则返回None"""
+        params = parse_qs(query)
+        try:
+            username = params['u'][0]
+            expires = int(params['e'][0])
+            signature = params['s'][0]
+        except (KeyError, ValueError):
+            return None
+        if expires < (time.time() if now is None else now):
+            return None
+        bound_ip = ip if params.get('b') == ['1'] else ''
+        expected = self._mac(path, username, expires, bound_ip)
+        if not hmac.compare_digest(signature.encode('utf-8', 'surrogateescape'), expected.encode('ascii')):
+            return None
+        return username
+
+    def _mac(self, path, username, expires, ip):
+        message = '\0'.join((path, username, str(expires), ip or '')).encode('utf-8', 'surrogateescape')
+        digest = hmac.new(self.key, message, hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
@@ -0,0 +1,585 @@
+import hashlib
+import os
+from urllib.parse import quote
+
+from compression import write_precompressed
+
+# 生成的静态资源目录（位于共享目录根部，不出现在文件列表中）
+STATIC_DIR = '_static'
+# 带内容指纹的样式表文件名前缀，内容变化时文件名随之变化，可以永久缓存
+STYLESHEET_PREFIX = 'style.'
+
+# 页面用到的图标（与 Font Awesome 的类名一致，页面和 /files 接口返回的图标类无需改动）。
+# 只包含实际用到的图标，24x24 的单色路径，奇偶填充规则挖出内部图案
+_DOCUMENT = 'M5 1h9l6 6v15a1 1 0 0 1-1 1H5a1 1 0 0 1-1-1V2a1 1 0 0 1 1-1zM14.5 2.5V6.5h4z'
+ICONS = {
+    'fa-file': _DOCUMENT,
+    'fa-file-video': _DOCUMENT + 'M9.5 11v7.5l6-3.75z',
+    'fa-file-code': _DOCUMENT + 'M10.5 11l-3.5 3.75 3.5 3.75 1.1-1.1-2.4-2.65 2.4-2.65zM13.5 11l-1.1 1.1 2.4 2.65-2.4 2.65 1.1 1.1 3.5-3.75z',
+    'fa-file-image': _DOCUMENT + 'M7 20l3-4.5 2 2.5 2.5-3.5 3.5 5.5zM7.5 11.5a1.5 1.5 0 1 0 3 0a1.5 1.5 0 1 0-3 0z',
+    'fa-file-alt': _DOCUMENT + 'M7 11h10v1.6H7zM7 14.5h10v1.6H7zM7 18h7v1.6H7z',
+    'fa-file-archive': _DOCUMENT + 'M8 2.5h2v2H8zM10 4.5h2v2h-2zM8 6.5h2v2H8zM10 8.5h2v2h-2zM8 12h4v6H8zM9.2 15h1.6v1.8H9.2z',
+    'fa-folder': 'M2 5a2 2 0 0 1 2-2h5.5l2 2.5H20a2 2 0 0 1 2 2V19a2 2 0 0 1-2 2H4a2 2 0 0 1-2-2z',
+    'fa-level-up-alt': 'M13 2l6.5 7h-4.75v8.5A3.5 3.5 0 0 1 11.25 21H4v-3.25h6.5V9H6.5z',
+    'fa-search': 'M10 2.5a7.5 7.5 0 1 0 4.45 13.54l5.25 5.25 2.12-2.12-5.25-5.25A7.5 7.5 0 0 0 10 2.5zm0 3a4.5 4.5 0 1 1 0 9a4.5 4.5 0 0 1 0-9z',
+}
+
+# 图标用 CSS mask 绘制：颜色跟随文字颜色，大小跟随字号，与图标字体的用法相同
+ICON_BASE_CSS = """.fas {
+    display: inline-block;
+    width: 1em;
+    height: 1em;
+    vertical-align: -0.125em;
+    background-color: currentColor;
+    -webkit-mask: var(--icon) center / contain no-repeat;
+    mask: var(--icon) center / contain no-repeat;
+}"""
+
+PAGE_CSS = """:root {
+    --primary-color: #1a2980;
+    --secondary-color: #26d0ce;
+    --accent-color: #ff7e5f;
+    --light-color: #ffffff;
+    --dark-color: #2c3e50;
+    --success-color: #38ef7d;
+    --card-shadow: 0 10px 30px rgba(0, 0, 0, 0.15);
+    --transition: all 0.3s ease;
+}
+
+* {
+    margin: 0;
+    padding: 0;
+    box-sizing: border-box;
+}
+
+body {
+    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+    background: linear-gradient(135deg, var(--primary-color) 0%, var(--secondary-color) 100%);
+    color: var(--light-color);
+    line-height: 1.6;
+    min-height: 100vh;
+    padding: 20px;
+    background-attachment: fixed;
+}
+
+.container {
+    max-width: 1000px;
+    margin: 0 auto;
+}
+
+header {
+    text-align: center;
+    margin-bottom: 40px;
+    padding: 20px;
+}
+
+h1 {
+    font-size: 2.8rem;
+    color: white;
+    margin-bottom: 10px;
+    font-weight: 700;
+    position: relative;
+    display: inline-block;
+    text-shadow: 0 2px 10px rgba(0, 0, 0, 0.2);
+}
+
+h1:after {
+    content: '';
+    position: absolute;
+    bottom: -10px;
+    left: 50%;
+    transform: translateX(-50%);
+    width: 60px;
+    height: 4px;
+    background: var(--accent-color);
+    border-radius: 2px;
+}
+
+.subtitle {
+    color: rgba(255, 255, 255, 0.85);
+    font-size: 1.2rem;
+    margin-top: 20px;
+}
+
+.search-box {
+    max-width: 500px;
+    margin: 30px auto;
+    position: relative;
+}
+
+.search-box input {
+    width: 100%;
+    padding: 15px 20px;
+    border: none;
+    border-radius: 50px;
+    box-shadow: 0 5px 20px rgba(0, 0, 0, 0.2);
+    font-size: 1rem;
+    transition: var(--transition);
+    background: rgba(255, 255, 255, 0.9);
+}
+
+.search-box input:focus {
+    outline: none;
+    box-shadow: 0 5px 25px rgba(0, 0, 0, 0.3);
+    background: white;
+}
+
+.search-box i {
+    position: absolute;
+    right: 20px;
+    top: 50%;
+    transform: translateY(-50%);
+    color: var(--primary-color);
+}
+
+.search-filters {
+    display: flex;
+    justify-content: center;
+    align-items: center;
+    gap: 15px;
+    margin-top: 20px;
+    color: white;
+}
+
+.search-filters .sort-select {
+    display: inline-block;
+    margin: 0;
+}
+
+.archive-toolbar {
+    display: flex;
+    justify-content: center;
+    align-items: center;
+    gap: 10px;
+    margin-top: 15px;
+}
+
+.archive-toolbar button {
+    padding: 8px 15px;
+    border: none;
+    border-radius: 50px;
+    background: rgba(255, 255, 255, 0.9);
+    color: var(--dark-color);
+    cursor: pointer;
+    transition: var(--transition);
+}
+
+.archive-toolbar button:disabled {
+    opacity: 0.5;
+    cursor: default;
+}
+
+.archive-toolbar button.active {
+    background: var(--success-color);
+    color: white;
+}
+
+.archive-toolbar .sort-select {
+    display: inline-block;
+    margin: 0;
+}
+
+.selecting .file-card {
+    cursor: pointer;
+}
+
+.file-card.selected {
+    outline: 3px solid var(--success-color);
+    outline-offset: -3px;
+}
+
+.search-status {
+    color: white;
+    text-align: center;
+    margin-top: 20px;
+}
+
+.virtual-grid {
+    position: relative;
+    margin-top: 20px;
+}
+
+.virtual-grid .file-grid {
+    position: absolute;
+    top: 0;
+    left: 0;
+    right: 0;
+    margin-top: 0;
+}
+
+.virtual-grid .file-card {
+    height: 280px;
+}
+
+.sort-select {
+    display: block;
+    margin: -10px auto 0;
+    padding: 8px 15px;
+    border: none;
+    border-radius: 50px;
+    background: rgba(255, 255, 255, 0.9);
+    color: var(--dark-color);
+}
+
+.dir-grid {
+    margin-bottom: 25px;
+}
+
+.file-grid {
+    display: grid;
+    grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
+    gap: 25px;
+    margin-top: 20px;
+}
+
+.file-card {
+    background: rgba(255, 255, 255, 0.95);
+    border-radius: 12px;
+    overflow: hidden;
+    box-shadow: var(--card-shadow);
+    transition: var(--transition);
+    display: flex;
+    flex-direction: column;
+    height: 100%;
+    backdrop-filter: blur(10px);
+    border: 1px solid rgba(255, 255, 255, 0.2);
+}
+
+.file-card:hover {
+    transform: translateY(-8px);
+    box-shadow: 0 15px 35px rgba(0, 0, 0, 0.25);
+}
+
+.file-card-header {
+    background: linear-gradient(135deg, var(--primary-color) 0%, var(--secondary-color) 100%);
+    color: white;
+    padding: 15px;
+    text-align: center;
+}
+
+.file-card-header i {
+    font-size: 2.2rem;
+    margin-bottom: 10px;
+    text-shadow: 0 2px 5px rgba(0, 0, 0, 0.2);
+}
+
+.file-card-body {
+    padding: 20px;
+    flex-grow: 1;
+}
+
+.file-name {
+    font-weight: 600;
+    font-size: 1.1rem;
+    margin-bottom: 10px;
+    color: var(--dark-color);
+    display: -webkit-box;
+    -webkit-line-clamp: 2;
+    -webkit-box-orient: vertical;
+    overflow: hidden;
+}
+
+.file-meta {
+    display: flex;
+    justify-content: space-between;
+    color: #6c757d;
+    font-size: 0.85rem;
+    margin-top: 15px;
+    padding-top: 15px;
+    border-top: 1px solid #eee;
+}
+
+.file-hash {
+    margin-top: 10px;
+    font-family: monospace;
+    font-size: 0.7rem;
+    color: #6c757d;
+    word-break: break-all;
+    user-select: all;
+}
+
+footer a {
+    color: inherit;
+}
+
+.file-card-footer {
+    padding: 0 20px 20px;
+}
+
+.download-btn {
+    display: block;
+    width: 100%;
+    padding: 12px;
+    background: var(--success-color);
+    color: white;
+    text-align: center;
+    border-radius: 6px;
+    text-decoration: none;
+    font-weight: 600;
+    transition: var(--transition);
+    box-shadow: 0 4px 10px rgba(56, 239, 125, 0.4);
+}
+
+.download-btn:hover {
+    background: #2dd56a;
+    transform: translateY(-2px);
+    box-shadow: 0 6px 15px rgba(56, 239, 125, 0.5);
+}
+
+.stats {
+    display: flex;
+    justify-content: space-around;
+    background: rgba(255, 255, 255, 0.2);
+    border-radius: 12px;
+    padding: 20px;
+    box-shadow: 0 8px 20px rgba(0, 0, 0, 0.1);
+    margin-bottom: 30px;
+    backdrop-filter: blur(10px);
+    border: 1px solid rgba(255, 255, 255, 0.15);
+}
+
+.stat-item {
+    text-align: center;
+}
+
+.stat-number {
+    font-size: 2.2rem;
+    font-weight: 700;
+    color: white;
+    text-shadow: 0 2px 5px rgba(0, 0, 0, 0.2);
+}
+
+.stat-label {
+    color: rgba(255, 255, 255, 0.85);
+    font-size: 0.9rem;
+}
+
+footer {
+    text-align: center;
+    margin-top: 50px;
+    padding: 20px;
+    color: rgba(255, 255, 255, 0.8);
+    font-size: 0.9rem;
+}
+
+@media (max-width: 768px) {
+    .file-grid {
+        grid-template-columns: 1fr;
+    }
+
+    h1 {
+        font-size: 2.2rem;
+    }
+
+    .stats {
+        flex-direction: column;
+        gap: 20px;
+    }
+}
+
+/* 登录相关样式 */
+.login-container {
+    background: rgba(255, 255, 255, 0.95);
+    border-radius: 12px;
+    box-shadow: var(--card-shadow);
+    padding: 40px;
+    width: 100%;
+    max-width: 400px;
+    backdrop-filter: blur(10px);
+    border: 1px solid rgba(255, 255, 255, 0.2);
+    position: fixed;
+    top: 50%;
+    left: 50%;
+    transform: translate(-50%, -50%);
+    z-index: 1000;
+}
+
+.login-header {
+    text-align: center;
+    margin-bottom: 30px;
+}
+
+.login-header h1 {
+    font-size: 2rem;
+    color: var(--primary-color);
+    margin-bottom: 10px;
+}
+
+.login-header p {
+    color: #6c757d;
+}
+
+.form-group {
+    margin-bottom: 20px;
+}
+
+.form-group label {
+    display: block;
+    margin-bottom: 8px;
+    color: var(--dark-color);
+    font-weight: 600;
+}
+
+.form-group input {
+    width: 100%;
+    padding: 12px 15px;
+    border: 1px solid #ddd;
+    border-radius: 6px;
+    font-size: 1rem;
+    transition: var(--transition);
+}
+
+.form-group input:focus {
+    outline: none;
+    border-color: var(--primary-color);
+    box-shadow: 0 0 0 3px rgba(26, 41, 128, 0.1);
+}
+
+.login-btn {
+    width: 100%;
+    padding: 12px;
+    background: linear-gradient(135deg, var(--primary-color) 0%, var(--secondary-color) 100%);
+    color: white;
+    border: none;
+    border-radius: 6px;
+    font-size: 1rem;
+    font-weight: 600;
+    cursor: pointer;
+    transition: var(--transition);
+    box-shadow: 0 4px 10px rgba(0, 0, 0, 0.1);
+}
+
+.login-btn:hover {
+    transform: translateY(-2px);
+    box-shadow: 0 6px 15px rgba(0, 0, 0, 0.2);
+}
+
+.file-container {
+    display: none;
+}
+
+/* 访问记录表格样式 */
+.access-logs {
+    margin: 30px 0;
+    background: rgba(255, 255, 255, 0.95);
+    border-radius: 12px;
+    padding: 20px;
+    box-shadow: var(--card-shadow);
+    backdrop-filter: blur(10px);
+    border: 1px solid rgba(255, 255, 255, 0.2);
+}
+
+.access-logs h2 {
+    color: var(--primary-color);
+    text-align: center;
+    margin-bottom: 20px;
+    font-size: 1.8rem;
+}
+
+.access-table {
+    width: 100%;
+    border-collapse: collapse;
+    margin-top: 15px;
+}
+
+.access-table th,
+.access-table td {
+    padding: 12px 15px;
+    text-align: left;
+    border-bottom: 1px solid #eee;
+}
+
+.access-table th {
+    background-color: var(--primary-color);
+    color: white;
+    font-weight: 600;
+}
+
+.access-table tr:hover {
+    background-color: rgba(26, 41, 128, 0.05);
+}
+
+.access-table-container {
+    max-height: 400px;
+    overflow-y: auto;
+}
+
+/* 访问统计汇总 */
+.analytics-grid {
+    display: grid;
+    grid-template-columns: repeat(auto-fit, minmax(240px, 1fr));
+    gap: 15px;
+    margin-bottom: 20px;
+}
+
+.analytics-card h3 {
+    color: var(--primary-color);
+    font-size: 1rem;
+    margin-bottom: 8px;
+}
+
+.analytics-card .access-table th,
+.analytics-card .access-table td {
+    padding: 6px 8px;
+    font-size: 0.85rem;
+}
+
+.trend-bars {
+    display: flex;
+    align-items: flex-end;
+    gap: 2px;
+    height: 80px;
+    margin-bottom: 5px;
+}
+
+.trend-bars div {
+    flex: 1;
+    min-height: 1px;
+    background: var(--primary-color);
+    opacity: 0.7;
+}
+
+.trend-bars div.failed {
+    background: #e74c3c;
+}
+
+.trend-label {
+    color: #666;
+    font-size: 0.8rem;
+    margin-bottom: 15px;
+}"""
+
+
+def icon_css(icons=ICONS):
+    """把图标路径内联为 data URI，每个图标一条规则"""
+    rules = [ICON_BASE_CSS]
+    for name, path in icons.items():
+        svg = (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24">'
+               f'<path fill-rule="evenodd" d="{path}"/></svg>')
+        rules.append(f'.{name} {{ --icon: url("data:image/svg+xml,{quote(svg)}"); }}')
+    return '\n'.join(rules) + '\n'
+
+
+def stylesheet():
+    """返回 (文件名, 内容)，文件名中带内容的SHA-256前缀"""
+    content = (PAGE_CSS + '\n' + icon_css()).encode('utf-8')
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    return f'{STYLESHEET_PREFIX}{digest}.css', content
+
+
+def write_static_assets(root):
+    """把样式表写入 root/_static（内容未变时不重写），返回相对 root 的URL路径
+
+    旧版本的样式表不删除：监视模式下未变化的子目录页面仍可能引用旧文件。
+    """
+    name, content = stylesheet()
+    directory = os.path.join(root, STATIC_DIR)
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, f'.{name}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        write_precompressed(path)
+    return f'{STATIC_DIR}/{name}'
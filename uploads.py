@@ -0,0 +1,254 @@
+import json
+import os
+import re
+import secrets
+import shutil
+import time
+
+from generate_index import is_hidden, is_within
+from hashing import hash_file, add_to_hash_cache
+
+try:
+    import fcntl  # 仅在类Unix系统上可用，防止同一个上传被并发写入
+except ImportError:
+    fcntl = None
+
+# 未完成的上传保存在共享目录根部的隐藏目录中（与目标文件同一文件系统，完成时可以直接改名）
+UPLOAD_DIR = '.uploads'
+# 每次从请求体读取并写入磁盘的字节数，内存占用与文件大小无关
+IO_CHUNK_SIZE = 1024 * 1024
+# 建议客户端每个请求发送的字节数（断线后最多重传这么多）
+CLIENT_CHUNK_SIZE = 8 * 1024 * 1024
+# 多久没有写入的上传视为放弃，创建新上传时清理
+STALE_SECONDS = 24 * 60 * 60
+_UPLOAD_ID = re.compile(r'^[A-Za-z0-9_-]{22}$')
+# 程序所在目录（serve.py 运行时的 sys.path[0]），共享目录默认就是它
+CODE_DIRECTORY = os.path.realpath(os.path.dirname(os.path.abspath(__file__)))
+# Python 会导入或执行的文件类型，不允许上传到程序目录中（否则可以覆盖标准库或可选依赖）
+IMPORTABLE_SUFFIXES = ('.py', '.pyc', '.pyo', '.pyw', '.pyd', '.pth', '.so')
+
+
+class UploadError(Exception):
+    """上传请求无法处理；status 为返回的HTTP状态码，offset 为服务端当前已接收的字节数（如有）"""
+
+    def __init__(self, status, message, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.offset = offset
+
+
+def split_rel_dir(rel_dir):
+    """校验相对目录，返回路径段列表；包含 ..、空段或隐藏目录时返回None"""
+    rel_dir = (rel_dir or '').strip('/')
+    if not rel_dir:
+        return []
+    parts = rel_dir.split('/')
+    if any(not part or part in ('.', '..') or '\\' in part or is_hidden(part) for part in parts):
+        return None
+    return parts
+
+
+def check_filename(filename):
+    if (not filename or filename in ('.', '..') or '/' in filename or '\\' in filename or
+            '\0' in filename or is_hidden(filename) or len(filename.encode('utf-8')) > 255):
+        raise UploadError(400, '文件名不合法')
+    return filename
+
+
+def check_importable(directory, filename):
+    """目标目录在程序目录之内时拒绝可导入的文件名（包括包中的 __init__.py）"""
+    if filename.lower().endswith(IMPORTABLE_SUFFIXES) and is_within(directory, CODE_DIRECTORY):
+        raise UploadError(403, '不允许在程序目录中上传 Python 模块')
+
+
+class UploadManager:
+    """可续传的分块上传
+
+    每个上传对应 .uploads/<id>.json（目标位置、总大小、期望的SHA-256）和 .uploads/<id>.part（已接收的数据）。
+    已接收的字节数就是 .part 文件的大小，保存在磁盘上：连接中断或服务重启后客户端查询偏移量即可续传，
+    多个工作进程之间也一致。完成时校验大小和SHA-256，再原子地移动到目标目录。
+    """
+
+    def __init__(self, root, max_bytes=None, stale_seconds=STALE_SECONDS):
+        self.root = root
+        self.directory = os.path.join(root, UPLOAD_DIR)
+        self.max_bytes = max_bytes
+        self.stale_seconds = stale_seconds
+
+    def target_directory(self, rel_dir):
+        """返回目标目录解析符号链接后的真实路径；不存在或经符号链接指向共享目录之外时按不存在处理"""
+        parts = split_rel_dir(rel_dir)
+        if parts is None:
+            raise UploadError(404, '目录不存在')
+        directory = os.path.realpath(os.path.join(self.root, *parts))
+        if not os.path.isdir(directory) or not is_within(directory, os.path.realpath(self.root)):
+            raise UploadError(404, '目录不存在')
+        return directory
+
+    def create(self, username, rel_dir, filename, size, sha256=None):
+        """登记一个新上传，返回上传状态"""
+        directory = self.target_directory(rel_dir)
+        check_filename(filename)
+        check_importable(directory, filename)
+        if not isinstance(size, int) or size < 0:
+            raise UploadError(400, '文件大小不合法')
+        if self.max_bytes is not None and size > self.max_bytes:
+            raise UploadError(413, '文件超过上传大小限制')
+        if sha256 is not None and not re.fullmatch(r'[0-9a-fA-F]{64}', sha256):
+            raise UploadError(400, 'SHA-256 格式错误')
+        if os.path.exists(os.path.join(directory, filename)):
+            raise UploadError(409, '同名文件已存在')
+        os.makedirs(self.directory, exist_ok=True)
+        self.purge_stale()
+        if shutil.disk_usage(self.directory).free < size:
+            raise UploadError(507, '磁盘空间不足')
+
+        upload_id = secrets.token_urlsafe(16)
+        record = {
+            'id': upload_id,
+            'username': username,
+            'dir': '/'.join(split_rel_dir(rel_dir)),
+            'filename': filename,
+            'size': size,
+            'sha256': sha256.lower() if sha256 else None,
+            'created': time.time(),
+        }
+        open(self._part_path(upload_id), 'xb').close()
+        tmp_path = self._state_path(upload_id) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp_path, self._state_path(upload_id))
+        return dict(record, offset=0)
+
+    def get(self, upload_id):
+        """返回上传状态（含已接收的字节数 offset），不存在时抛出 UploadError"""
+        if not _UPLOAD_ID.match(upload_id or ''):
+            raise UploadError(404, '上传不存在')
+        try:
+            with open(self._state_path(upload_id), 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            offset = os.path.getsize(self._part_path(upload_id))
+        except (OSError, ValueError):
+            raise UploadError(404, '上传不存在')
+        return dict(record, offset=offset)
+
+    def write_chunk(self, upload_id, offset, stream, length):
+        """从 stream 读取 length 字节写到 offset 处，返回写入后的偏移量
+
+        offset 必须等于服务端已接收的字节数，否则返回409和当前偏移量，客户端据此续传。
+        请求体边读边写，中途断开时已写入的部分保留。
+        """
+        record = self.get(upload_id)
+        if length is None:
+            raise UploadError(411, '缺少 Content-Length')
+        if offset + length > record['size']:
+            raise UploadError(413, '数据超出声明的文件大小', record['offset'])
+        with self._open_locked(upload_id) as f:
+            current = os.fstat(f.fileno()).st_size
+            if offset != current:
+                raise UploadError(409, '偏移量不一致', current)
+            f.seek(offset)
+            remaining = length
+            try:
+                while remaining:
+                    data = stream.read(min(IO_CHUNK_SIZE, remaining))
+                    if not data:
+                        break
+                    f.write(data)
+                    remaining -= len(data)
+            except OSError:
+                pass  # 客户端断开：保留已写入的部分
+            finally:
+                f.flush()
+                os.fsync(f.fileno())
+            written = f.tell()
+        if remaining:
+            raise UploadError(400, '请求体不完整', written)
+        return written
+
+    def complete(self, upload_id, sha256=None):
+        """校验并把文件移动到目标目录，返回 (目录路径, 文件名, {算法: 摘要})"""
+        record = self.get(upload_id)
+        expected = (sha256 or record['sha256'] or '').lower() or None
+        with self._open_locked(upload_id) as f:
+            size = os.fstat(f.fileno()).st_size
+            if size != record['size']:
+                raise UploadError(409, '上传尚未完成', size)
+            digests = hash_file(self._part_path(upload_id))
+            if expected is not None and digests['sha256'] != expected:
+                # 数据已损坏，续传没有意义，丢弃后需要重新上传
+                self._remove(upload_id)
+                raise UploadError(422, 'SHA-256 校验失败，请重新上传')
+            # 上传期间目录可能被换成符号链接，移动前重新检查，并直接使用解析后的路径
+            directory = self.target_directory(record['dir'])
+            check_importable(directory, record['filename'])
+            target = os.path.join(directory, record['filename'])
+            try:
+                os.link(self._part_path(upload_id), target)  # 目标已存在时失败，不会覆盖
+            except FileExistsError:
+                raise UploadError(409, '同名文件已存在')
+            except OSError:
+                if os.path.exists(target):
+                    raise UploadError(409, '同名文件已存在')
+                os.replace(self._part_path(upload_id), target)
+            os.chmod(target, 0o644)
+        self._remove(upload_id)
+        try:
+            add_to_hash_cache(directory, record['filename'], os.stat(target), digests)
+        except OSError:
+            pass  # 下次生成索引时重新计算
+        return directory, record['filename'], digests
+
+    def abort(self, upload_id):
+        self.get(upload_id)
+        self._remove(upload_id)
+
+    def purge_stale(self):
+        """删除长时间没有写入的上传，返回删除的数量"""
+        cutoff = time.time() - self.stale_seconds
+        removed = 0
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0
+        for name in names:
+            upload_id, ext = os.path.splitext(name)
+            if ext != '.json':
+                continue
+            try:
+                last = max(os.path.getmtime(os.path.join(self.directory, name)),
+                           os.path.getmtime(self._part_path(upload_id)))
+            except OSError:
+                last = 0
+            if last < cutoff:
+                self._remove(upload_id)
+                removed += 1
+        return removed
+
+    def _state_path(self, upload_id):
+        return os.path.join(self.directory, upload_id + '.json')
+
+    def _part_path(self, upload_id):
+        return os.path.join(self.directory, upload_id + '.part')
+
+    def _remove(self, upload_id):
+        for path in (self._state_path(upload_id), self._part_path(upload_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _open_locked(self, upload_id):
+        """打开 .part 文件并加排他锁，同一上传已有请求在写入时返回409"""
+        try:
+            f = open(self._part_path(upload_id), 'r+b')
+        except OSError:
+            raise UploadError(404, '上传不存在')
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                raise UploadError(409, '该上传正在写入')
+        return f
@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from metrics import IO_SECONDS
+
+
+class UserStore:
+    """用户数据的内存缓存：只在 users.json 变化（mtime/inode/大小）时重新加载"""
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        # 两次检查文件状态之间的最短间隔（秒），登录高峰时大部分请求只做字典查找
+        self.check_interval = check_interval
+        self._users = {}
+        self._signature = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._reload()
+
+    def get(self, username):
+        """按用户名查找用户，不存在时返回None"""
+        self._maybe_reload()
+        return self._users.get(username)
+
+    def all(self):
+        """返回全部用户（只读快照）"""
+        self._maybe_reload()
+        return self._users
+
+    def save(self, users):
+        """原子地写入用户数据：先写临时文件，再重命名覆盖"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.users-', suffix='.tmp', dir=directory)
+        try:
+            with IO_SECONDS.time(operation='users_save'), os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(users, f, indent=4, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._users = dict(users)
+            self._signature = self._stat_signature()
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        if self._stat_signature() != self._signature:
+            self._reload()
+
+    def _reload(self):
+        with self._lock:
+            signature = self._stat_signature()
+            if signature is None:
+                self._users = {}
+            else:
+                try:
+                    with IO_SECONDS.time(operation='users_load'), open(self.path, 'r', encoding='utf-8') as f:
+                        self._users = json.load(f)
+                except ValueError:
+                    # 文件正在被外部编辑器写入时可能不完整，保留旧数据，下次再试
+                    return
+            self._signature = signature
+
+    def _stat_signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)